@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+# Adherence buckets used by the dashboard filter and the details modal
+ADHERENCE_LEVELS = ['high', 'medium', 'low']
+ADHERENCE_LABELS = {'high': 'High (>80%)', 'medium': 'Medium (60-80%)', 'low': 'Low (<60%)'}
+
+
+def utc_now():
+    return pd.Timestamp.now(tz='UTC')
+
+
+def reminder_flags(df, now=None):
+    """
+    Returns (completed, missed) boolean arrays for a normalized reminder frame.
+    A reminder is missed when it is not completed and its due time has passed.
+    """
+    now = now if now is not None else utc_now()
+    completed = (df['status'] == 'completed').to_numpy()
+    missed = ~completed & (df['next_reminder_time'] < now).to_numpy()
+    return completed, missed
+
+
+def adherence_level(rate):
+    """Buckets adherence percentages into 'high' (>80), 'medium' (60-80) and 'low' (<60)."""
+    rate = np.asarray(rate, dtype=float)
+    return np.select([rate > 80, rate >= 60], ['high', 'medium'], 'low')
+
+
+def adherence_table(df, by='patient_identifier', now=None):
+    """
+    Per-group adherence with one grouped sum over boolean columns.
+
+    `by` is a column name or list of names (e.g. ['patient_identifier',
+    'medication_name']). Returns a frame indexed by the group keys, in order
+    of first appearance, with completed, missed, due, rate (0-100, 0 when
+    nothing is due yet) and level columns.
+    """
+    keys = [by] if isinstance(by, str) else list(by)
+    completed, missed = reminder_flags(df, now)
+    flags = pd.DataFrame({'completed': completed, 'missed': missed}, index=df.index)
+    for key in keys:
+        flags[key] = df[key]
+    table = flags.groupby(keys, sort=False, observed=True)[['completed', 'missed']].sum()
+    table['due'] = table['completed'] + table['missed']
+    due = table['due'].to_numpy()
+    table['rate'] = np.divide(table['completed'].to_numpy() * 100.0, due, out=np.zeros(len(table)), where=due > 0)
+    table['level'] = adherence_level(table['rate'])
+    return table
+
+
+def overall_adherence(df, now=None):
+    """Returns (completed, missed, rate) across every row of the frame."""
+    completed, missed = reminder_flags(df, now)
+    completed_count, missed_count = int(completed.sum()), int(missed.sum())
+    due = completed_count + missed_count
+    rate = completed_count / due * 100 if due > 0 else 0
+    return completed_count, missed_count, rate
+
+
+def filter_by_adherence(df, level, now=None):
+    """Keeps the rows of patients whose adherence falls in `level` ('high', 'medium' or 'low')."""
+    if level not in ADHERENCE_LEVELS:
+        return df
+    table = adherence_table(df, now=now)
+    patients = table.index[table['level'] == level]
+    return df[df['patient_identifier'].isin(patients)]
@@ -8,24 +8,72 @@ load_dotenv()
 
 import pandas as pd
 import gspread
-import requests
 from google.oauth2.service_account import Credentials
 from flask import Flask, render_template, request, redirect, session, url_for, jsonify
-from flask_socketio import SocketIO, emit, join_room
+from flask_socketio import SocketIO, join_room, leave_room
 import json
-from threading import Thread, Event
+import hashlib
+import sqlite3
+import hmac
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import Thread, Event, Lock, local
 import numpy as np
-from datetime import timedelta, datetime
+from datetime import datetime
 from openai import OpenAI
-
-client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+from sheet_cache import SnapshotCache
+from sheets_client import SheetsClientRegistry
+from sheet_sync import IncrementalSheetSync, pushed_rows_problem
+from reminder_store import ReminderStore
+from drilldown import get_drilldown
+from dashboard_data import build_dashboard_data, canonical_filters
+from result_cache import LRUCache
+from snapshot_file import ChangeInbox, SnapshotFile
+from message_queue import queue_options
+from compute_pool import ComputePool, PoolBusy, dashboard_task, drilldown_task, normalize_task
+from poll_scheduler import PollScheduler
+from request_coalescer import RequestCoalescer
+from chat_stream import ChatStreams, stream_completion
+from chat_context import TokenUsage, compact_dashboard_result, window_history
+from schedule_cache import ScheduleExtractionCache, validate_schedule
+from quick_setup import parse_quick_setup
+from webhook_queue import DATA_DIR, WebhookQueue, idempotency_key
+from session_store import ServerSideSessionInterface, session_backend
+from bulk_schedule import (
+    BULK_SCHEDULE_CONCURRENCY, BULK_WEBHOOK_BATCH_SIZE, BulkJobRegistry, BulkScheduleJob,
+    common_start_date, group_prescriptions, quick_setup_text, read_prescription_file
+)
+
+# OPENAI_BASE_URL points the client elsewhere, e.g. at fake_llm_server.py for local testing
+client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"), base_url=os.environ.get("OPENAI_BASE_URL"),
+                timeout=float(os.environ.get('OPENAI_TIMEOUT', 60)))
 
 with open('prescription_schedule_prompt.md', 'r', encoding='utf-8') as f:
     PRESCRIPTION_SCHEDULE_PROMPT_MD_CONTENT = f.read()
+# Part of the schedule cache key, so editing the prompt invalidates earlier extractions
+PRESCRIPTION_SCHEDULE_PROMPT_HASH = hashlib.sha256(PRESCRIPTION_SCHEDULE_PROMPT_MD_CONTENT.encode()).hexdigest()[:16]
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'd6216c369373cf88f08e443b5071575acb4a7d5e1e1c2739e1cd0c313f9fefca')
-socketio = SocketIO(app, async_mode='threading', cors_allowed_origins="*")
+# --- Deployment Role ---
+# 'standalone': one process syncs the sheet and serves clients (the default)
+# 'sync': only syncs the reminder tab and publishes the shared snapshot (see sync_process.py)
+# 'web': one of several workers serving clients from the snapshot published by the sync process
+APP_ROLE = os.environ.get('APP_ROLE', 'standalone')
+# --- Session Store ---
+# Session data (notably the chat history) lives server-side; the cookie only carries a signed session id.
+# e.g. sqlite:////data/sessions.sqlite3 or redis://localhost:6379/1; in-process memory by default,
+# except that web workers share a SQLite file in DATA_DIR (persistent storage, unlike the snapshot
+# directory) so a client can land on any of them and keeps its session across restarts
+SESSION_STORE_URL = os.environ.get('SESSION_STORE_URL') or (
+    f"sqlite:///{os.path.join(DATA_DIR, 'sessions.sqlite3')}" if APP_ROLE == 'web' else None)
+app.session_interface = ServerSideSessionInterface(session_backend(SESSION_STORE_URL))
+# Socket.IO fan-out between workers, e.g. redis://localhost:6379/0, or memory:// for an in-process stand-in
+SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+# Socket.IO events read and write the server-side session like HTTP requests do, rather than a per-connection copy
+socketio = SocketIO(app, async_mode='threading', cors_allowed_origins="*", manage_session=False,
+                    **queue_options(SOCKETIO_MESSAGE_QUEUE))
 
 # --- Google Sheets Configuration ---
 SERVICE_ACCOUNT_FILE = 'credentials.json'
@@ -34,269 +82,358 @@ SCOPES = [
     'https://www.googleapis.com/auth/drive'
 ]
 SHEET_NAME = os.environ.get('SHEET_NAME', 'patient_reminder')
+# Optional spreadsheet ID; when set the sheet is opened by key and the Drive lookup by name is skipped
+SHEET_KEY = os.environ.get('SHEET_KEY')
 USERS_TAB = os.environ.get('USERS_TAB', 'pharmacyonboarding')
 REMINDER_TAB = os.environ.get('REMINDER_TAB', 'ReminderData')
+# 'incremental' appends only new reminder rows between periodic full downloads; 'full' always downloads the whole tab
+SHEET_SYNC_MODE = os.environ.get('SHEET_SYNC_MODE', 'incremental')
+
+# --- Sheet Change Ingestion ---
+# Shared secret for /api/sheet-webhook; when set, the poller drops to a slow fallback interval
+SHEET_WEBHOOK_SECRET = os.environ.get('SHEET_WEBHOOK_SECRET')
+SHEET_POLL_INTERVAL = float(os.environ.get('SHEET_POLL_INTERVAL', 10))
+SHEET_FALLBACK_POLL_INTERVAL = float(os.environ.get('SHEET_FALLBACK_POLL_INTERVAL', 120))
+
+# --- Adaptive Poll Scheduling ---
+# With push ingestion configured, polling only backs up missed or dropped notifications
+poll_scheduler = PollScheduler(SHEET_FALLBACK_POLL_INTERVAL if SHEET_WEBHOOK_SECRET else SHEET_POLL_INTERVAL)
+# Marks reads made by the poller itself so they count against its share of the quota
+_poll_context = local()
 
 # --- Background Thread for Polling ---
 thread = Thread()
 thread_stop_event = Event()
 
-def get_google_sheet_data(tab_name):
+def load_google_credentials():
+    """Builds service-account credentials from GOOGLE_CREDENTIALS or the local credentials file."""
+    if os.environ.get("GOOGLE_CREDENTIALS"):
+        creds_dict = json.loads(os.environ["GOOGLE_CREDENTIALS"])
+        creds_dict["private_key"] = creds_dict["private_key"].replace("\\n", "\n")
+        return Credentials.from_service_account_info(
+            creds_dict,
+            scopes=SCOPES
+        )
+    return Credentials.from_service_account_file(
+        SERVICE_ACCOUNT_FILE,
+        scopes=SCOPES
+    )
+
+# --- Shared gspread Client ---
+# Authorized once per process; the spreadsheet and worksheet handles are reused across requests.
+sheets_registry = SheetsClientRegistry(load_google_credentials, sheet_key=SHEET_KEY, sheet_name=SHEET_NAME)
+
+def fetch_google_sheet_data(tab_name):
+    """Downloads a tab straight from Google Sheets, bypassing the snapshot cache. Raises on failure."""
+    poll_scheduler.record_read(poller=getattr(_poll_context, 'active', False))
     try:
-        if os.environ.get("GOOGLE_CREDENTIALS"):
-            creds_dict = json.loads(os.environ["GOOGLE_CREDENTIALS"])
-            creds_dict["private_key"] = creds_dict["private_key"].replace("\\n", "\n")
-            creds = Credentials.from_service_account_info(
-                creds_dict,
-                scopes=SCOPES
-            )
-        else:
-            creds = Credentials.from_service_account_file(
-                SERVICE_ACCOUNT_FILE,
-                scopes=SCOPES
-            )
+        records = sheets_registry.worksheet(tab_name).get_all_records()
+    except (gspread.exceptions.WorksheetNotFound, gspread.exceptions.APIError):
+        # The tab may have been renamed or the handle gone stale; look it up again next time
+        sheets_registry.reset(tab_name)
+        raise
+    return pd.DataFrame(records)
+
+# --- Incremental Sync for the Append-Only Reminder Tab ---
+reminder_sync = IncrementalSheetSync(sheets_registry.worksheet, REMINDER_TAB)
+
+def load_sheet_snapshot(tab_name):
+    """Snapshot cache loader: syncs the reminder tab incrementally, downloads other tabs in full."""
+    if tab_name == REMINDER_TAB and SHEET_SYNC_MODE == 'incremental':
+        poll_scheduler.record_read(poller=getattr(_poll_context, 'active', False))
+        try:
+            return reminder_sync.sync()
+        except (gspread.exceptions.WorksheetNotFound, gspread.exceptions.APIError):
+            sheets_registry.reset(tab_name)
+            reminder_sync.reset()
+            raise
+    return fetch_google_sheet_data(tab_name)
 
-        client = gspread.authorize(creds)
-        sheet = client.open(SHEET_NAME).worksheet(tab_name)
-        records = sheet.get_all_records()
-        return pd.DataFrame(records)
+# --- Shared Snapshot Cache ---
+# Request handlers read from here; the background poller keeps it warm.
+sheet_cache = SnapshotCache(load_sheet_snapshot)
 
+def get_google_sheet_data(tab_name):
+    """Returns the cached snapshot of a tab, fetching it only when missing or expired."""
+    try:
+        # Callers clean columns in place, so hand out a private copy of the shared snapshot
+        return sheet_cache.get(tab_name).copy()
     except Exception as e:
         print(f"[GOOGLE SHEETS ERROR] Tab={tab_name} | {repr(e)}")
         return pd.DataFrame()
 
-def apply_filters(pharmacy_df, filters):
-    """Apply filters to the pharmacy dataframe."""
-    filtered_df = pharmacy_df.copy()
-    
-    print(f"DEBUG: Starting with {len(filtered_df)} rows")
-    print(f"DEBUG: Filters received: {filters}")
-    
-    # Date Range Filter
-    if filters.get('dateRange') and filters['dateRange'] != 'all':
+# --- Memoized Dashboard Results ---
+# Keyed by (pharmacy, canonical filters, pharmacy content hash); the TTL bounds drift of time-relative metrics.
+DASHBOARD_CACHE_SIZE = int(os.environ.get('DASHBOARD_CACHE_SIZE', 512))
+DASHBOARD_CACHE_MAX_BYTES = int(os.environ.get('DASHBOARD_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+DASHBOARD_CACHE_TTL = float(os.environ.get('DASHBOARD_CACHE_TTL', 60))
+dashboard_cache = LRUCache(max_entries=DASHBOARD_CACHE_SIZE, max_bytes=DASHBOARD_CACHE_MAX_BYTES, ttl=DASHBOARD_CACHE_TTL)
+
+# --- Normalized Reminder Store ---
+# Rebuilt once per reminder snapshot; every dashboard, detail and chat path reads from it.
+SNAPSHOT_PERSIST = os.environ.get('SNAPSHOT_PERSIST', 'true').lower() == 'true'
+# Normalized snapshots are persisted locally so a cold start can serve dashboards before Google answers
+# and, with several workers, so the sync process can share each snapshot with them.
+# The sync process writes every new snapshot straight away; others at most once per persist interval.
+snapshot_file = SnapshotFile(source=f"{SHEET_KEY or SHEET_NAME}/{REMINDER_TAB}",
+                             **({'persist_interval': 0} if APP_ROLE == 'sync' else {}))
+# Sheet change notifications received by web workers, applied by the sync process
+change_inbox = ChangeInbox()
+# Seconds between a web worker's checks for a newly published snapshot
+SHARED_SNAPSHOT_CHECK_INTERVAL = float(os.environ.get('SHARED_SNAPSHOT_CHECK_INTERVAL', 1))
+# CPU-heavy normalization and aggregation run in worker processes that map the persisted snapshot;
+# the sync process has no clients to keep responsive, so it normalizes in process.
+# Workers only read persisted snapshots, so without persistence there is no pool.
+compute_pool = ComputePool(snapshot_file.directory, snapshot_file.source,
+                           **({'workers': 0} if APP_ROLE == 'sync' or not SNAPSHOT_PERSIST else {}))
+if not SNAPSHOT_PERSIST and APP_ROLE != 'sync':
+    print("[COMPUTE POOL] Disabled because SNAPSHOT_PERSIST is false; dashboards are computed in process")
+
+def run_offloaded(tenant, store, task, args, inline):
+    """
+    Runs `task(store.generation, *args)` in the compute pool, or `inline()` when the pool is off or
+    broken. PoolBusy (a full pool, or a task still running after the timeout) is raised to the caller:
+    redoing that work on the event loop is exactly what the pool is there to avoid.
+    """
+    if not compute_pool.enabled or store.generation is None:
+        return inline()
+    try:
+        return compute_pool.run(str(tenant).strip(), task, store.generation, *args)
+    except PoolBusy:
+        raise
+    except Exception as e:
+        print(f"[COMPUTE POOL ERROR] {task.__name__} falling back to in-process | {repr(e)}")
+        return inline()
+
+def load_persisted_store():
+    """Returns the store persisted by an earlier process, or an empty one if there is none to use."""
+    if SNAPSHOT_PERSIST:
         try:
-            days = int(filters['dateRange'])
-            cutoff_date = pd.Timestamp.now() - timedelta(days=days)
-            filtered_df = filtered_df[filtered_df['time_stamp'] >= cutoff_date]
-            print(f"DEBUG: After date filter ({days} days): {len(filtered_df)} rows")
+            persisted = snapshot_file.load(ignore_age=APP_ROLE == 'web')
         except Exception as e:
-            print(f"DEBUG: Date filter error: {e}")
-    
-    # Status Filter - FIXED
-    if filters.get('status'):
-        status_list = filters['status']
-        print(f"DEBUG: Status filter value: {status_list}")
-        
-        if isinstance(status_list, str):
-            status_list = [status_list]
-        
-        if status_list and 'all' not in status_list:
-            # Convert to lowercase for comparison
-            status_list_lower = [s.lower() for s in status_list]
-            print(f"DEBUG: Filtering for statuses: {status_list_lower}")
-            print(f"DEBUG: Unique statuses in data: {filtered_df['status'].unique()}")
-            
-            filtered_df = filtered_df[filtered_df['status'].isin(status_list_lower)]
-            print(f"DEBUG: After status filter: {len(filtered_df)} rows")
-    
-    # Medication Filter
-    if filters.get('medication') and filters['medication'] != 'all':
-        filtered_df = filtered_df[filtered_df['medication_name'] == filters['medication']]
-        print(f"DEBUG: After medication filter: {len(filtered_df)} rows")
-    
-    # Patient Search Filter
-    if filters.get('patientSearch') and filters['patientSearch'].strip():
-        search_term = filters['patientSearch'].lower().strip()
-        filtered_df = filtered_df[
-            filtered_df['patient_identifier'].astype(str).str.lower().str.contains(search_term, na=False)
-        ]
-        print(f"DEBUG: After patient search filter: {len(filtered_df)} rows")
-    
-    # Check-in Filter
-    if filters.get('checkin') and filters['checkin'] != 'all':
-        filtered_df = filtered_df[filtered_df['should_check_in'] == filters['checkin']]
-        print(f"DEBUG: After check-in filter: {len(filtered_df)} rows")
-    
-    # Time of Day Filter
-    if filters.get('timeOfDay') and filters['timeOfDay'] != 'all':
-        time_filter = filters['timeOfDay'].capitalize()
-        filtered_df = filtered_df[filtered_df['time_category'] == time_filter]
-        print(f"DEBUG: After time filter: {len(filtered_df)} rows")
-    
-    # Frequency Filter
-    if filters.get('frequency') and filters['frequency'] != 'all':
-        filtered_df = filtered_df[filtered_df['frequency'] == filters['frequency']]
-        print(f"DEBUG: After frequency filter: {len(filtered_df)} rows")
-    
-    print(f"DEBUG: Final filtered count: {len(filtered_df)} rows")
-    return filtered_df
-
-def get_dashboard_data(phone_no, df, filters=None):
-    """Processes the DataFrame to generate all data needed for the dashboard."""
-    
-    # --- Robust primary filter with whitespace stripping ---
-    df['pharmacy_id'] = df['pharmacy_id'].astype(str).str.strip()
-    pharmacy_df = df[df['pharmacy_id'] == str(phone_no).strip()].copy()
-
-    if pharmacy_df.empty:
-        return {}
-
-    # --- Robust Data Cleaning and Preparation ---
-    pharmacy_df['status'] = pharmacy_df['status'].astype(str).str.strip().str.lower()
-    # time_stamp is already UTC-aware because source data has 'Z'
-    pharmacy_df['time_stamp'] = pd.to_datetime(pharmacy_df['time_stamp'], errors='coerce')
-    pharmacy_df['reminderTimeObj'] = pd.to_datetime(pharmacy_df['reminderTime'], format='%H:%M', errors='coerce').dt.time
-    # Make next_reminder_time UTC-aware to allow comparison
-    pharmacy_df['next_reminder_time'] = pd.to_datetime(pharmacy_df['next_reminder_time'], errors='coerce').dt.tz_localize('UTC', ambiguous='infer', nonexistent='NaT')
-    pharmacy_df['should_check_in'] = pharmacy_df['should_check_in'].fillna('').astype(str).str.lower()
-    
-    # Categorize time before filtering
-    def categorize_time(t):
-        if pd.notnull(t):
-            if t.hour < 12: return 'Morning'
-            if 12 <= t.hour < 17: return 'Afternoon'
-            return 'Evening'
-        return 'Unknown'
-    pharmacy_df['time_category'] = pharmacy_df['reminderTimeObj'].apply(categorize_time)
-    
-    # Apply filters if provided
-    if filters:
-        pharmacy_df = apply_filters(pharmacy_df, filters)
-        
-        if pharmacy_df.empty:
-            return get_empty_dashboard_data()
-    
-    # --- Adherence Calculation ---
-    now = pd.Timestamp.utcnow() # Use timezone-aware UTC timestamp
-    missed_mask = (pharmacy_df['status'] != 'completed') & (pharmacy_df['next_reminder_time'] < now)
-    
-    completed_reminders = (pharmacy_df['status'] == 'completed').sum()
-    missed_reminders = missed_mask.sum()
-    
-    total_relevant_reminders = completed_reminders + missed_reminders
-    adherence_rate = (completed_reminders / total_relevant_reminders) * 100 if total_relevant_reminders > 0 else 0
-
-    # Apply adherence level filter if needed
-    if filters and filters.get('adherence') and filters['adherence'] != 'all':
-        adherence_level = filters['adherence']
-        # This logic returns an empty dashboard if the adherence rate doesn't match the filter
-        patient_adherence = pharmacy_df.groupby('patient_identifier').apply(
-            lambda x: (x['status'] == 'completed').sum() / ((x['status'] == 'completed').sum() + ((x['status'] != 'completed') & (x['next_reminder_time'] < now)).sum()) * 100
-        ).fillna(0)
-        
-        high_adherence_patients = patient_adherence[patient_adherence > 80].index
-        medium_adherence_patients = patient_adherence[(patient_adherence >= 60) & (patient_adherence <= 80)].index
-        low_adherence_patients = patient_adherence[patient_adherence < 60].index
-
-        if adherence_level == 'high':
-            pharmacy_df = pharmacy_df[pharmacy_df['patient_identifier'].isin(high_adherence_patients)]
-        elif adherence_level == 'medium':
-            pharmacy_df = pharmacy_df[pharmacy_df['patient_identifier'].isin(medium_adherence_patients)]
-        elif adherence_level == 'low':
-            pharmacy_df = pharmacy_df[pharmacy_df['patient_identifier'].isin(low_adherence_patients)]
-        
-        if pharmacy_df.empty:
-            return get_empty_dashboard_data()
-
-
-    # --- KPI Cards ---
-    total_patients = pharmacy_df['patient_identifier'].nunique()
-    status_counts = pharmacy_df['status'].value_counts()
-    pending_reminders = status_counts.get('pending', 0) + status_counts.get('upcoming', 0)
-
-    # --- Adherence Trend (Line Chart) ---
-    adherence_df = pharmacy_df[pharmacy_df['status'].isin(['completed']) | missed_mask].copy()
-    # Group by the reminder's due date for a more intuitive trend
-    adherence_df['date'] = adherence_df['next_reminder_time'].dt.date
-    adherence_by_day = adherence_df.groupby('date')['status'].apply(
-        lambda x: (x == 'completed').sum() / len(x) * 100 if len(x) > 0 else 0
-    ).reset_index()
-    adherence_by_day = adherence_by_day.sort_values('date')
-
-    # --- Top Medications / Dosages ---
-    top_meds = pharmacy_df['medication_name'].value_counts().nlargest(5)
-    dosage_dist = pharmacy_df['dosage'].value_counts().nlargest(5)
-
-    # --- Reminders by Time of Day ---
-    reminders_by_time = pharmacy_df['time_category'].value_counts()
-    
-    # --- Upcoming vs Completed ---
-    upcoming_vs_completed = status_counts
-
-    # --- Patients Needing Check-In (Table) ---
-    check_in_patients = pharmacy_df[pharmacy_df['should_check_in'] == 'yes'].copy()
-    if not check_in_patients.empty:
-        # Ensure check_in_date is datetime and format it
-        check_in_patients['check_in_date'] = pd.to_datetime(check_in_patients['check_in_date'], errors='coerce')
-        check_in_patients = check_in_patients.dropna(subset=['check_in_date']) # Drop rows where date conversion failed
-        check_in_patients['check_in_date'] = check_in_patients['check_in_date'].dt.strftime('%Y-%m-%d')
-        
-    check_in_table = check_in_patients[['patient_identifier', 'phone_number', 'medication_name', 'status', 'check_in_date', 'check_in_message']].to_dict('records')
-
-    # --- Final Data Structure ---
-    dashboard_data = {
-        "kpi_cards": {
-            "total_patients": int(total_patients),
-            "adherence_rate": f"{adherence_rate:.1f}",
-            "reminders_sent": int(total_relevant_reminders),
-            "pending_reminders": int(pending_reminders)
-        },
-        "adherence_trend": {
-            "labels": [d.strftime('%Y-%m-%d') for d in adherence_by_day['date']],
-            "data": list(adherence_by_day['status'])
-        },
-        "reminder_status": {
-            "labels": list(status_counts.index),
-            "data": [int(v) for v in status_counts.values]
-        },
-        "top_medications": {
-            "labels": list(top_meds.index),
-            "data": [int(v) for v in top_meds.values]
-        },
-        "dosage_distribution": {
-            "labels": list(dosage_dist.index),
-            "data": [int(v) for v in dosage_dist.values]
-        },
-        "reminders_by_time": {
-            "labels": ['Morning', 'Afternoon', 'Evening', 'Unknown'],
-            "data": [int(reminders_by_time.get(c, 0)) for c in ['Morning', 'Afternoon', 'Evening', 'Unknown']]
-        },
-        "upcoming_vs_completed": {
-            "labels": ['Upcoming', 'Completed'],
-            "data": [int(upcoming_vs_completed.get('pending', 0) + upcoming_vs_completed.get('upcoming', 0)), 
-                     int(upcoming_vs_completed.get('completed', 0))]
-        },
-        "check_in_table": check_in_table
-    }
+            print(f"[SNAPSHOT FILE ERROR] {repr(e)}")
+            persisted = None
+        if persisted is not None:
+            frame, offsets, manifest = persisted
+            print(f"Loaded persisted reminder snapshot v{manifest['version']} ({manifest['rows']} rows) in {snapshot_file.stats['last_load_ms']} ms.")
+            _shared_snapshot['generation'] = manifest['generation']
+            return ReminderStore(frame, version=manifest['version'], offsets=offsets, generation=manifest['generation'])
+    return ReminderStore(pd.DataFrame())
+
+_store_lock = Lock()
+_shared_snapshot = {'generation': None, 'checked': 0.0}
+_reminder_store = load_persisted_store()
+_reminder_store_source = None
+
+def get_shared_store():
+    """Web workers: the store for the snapshot most recently published by the sync process, mapped read-only."""
+    global _reminder_store
+    now = time.monotonic()
+    if now - _shared_snapshot['checked'] < SHARED_SNAPSHOT_CHECK_INTERVAL:
+        return _reminder_store
+    with _store_lock:
+        _shared_snapshot['checked'] = now
+        generation = snapshot_file.generation()
+        if generation is None or generation == _shared_snapshot['generation']:
+            return _reminder_store
+        # The sync process may be down for a while; an old snapshot still beats an empty dashboard
+        loaded = snapshot_file.load(ignore_age=True)
+        if loaded is not None:
+            frame, offsets, manifest = loaded
+            store = ReminderStore(frame, version=manifest['version'], offsets=offsets, generation=manifest['generation'])
+            store.inherit_rollups(_reminder_store)
+            _reminder_store = store
+            _shared_snapshot['generation'] = manifest['generation']
+        return _reminder_store
+
+def build_reminder_store(snapshot, version):
+    """Normalizes a raw snapshot; in the compute pool when enabled, which also publishes it for the pool's workers."""
+    if compute_pool.enabled:
+        try:
+            manifest = compute_pool.run(REMINDER_TAB, normalize_task, snapshot, version)
+            loaded = snapshot_file.load(ignore_age=True, generation=manifest['generation'])
+            if loaded is not None:
+                frame, offsets, manifest = loaded
+                return ReminderStore(frame, version=version, offsets=offsets, generation=manifest['generation'])
+        except Exception as e:
+            print(f"[COMPUTE POOL ERROR] normalize_task falling back to in-process | {repr(e)}")
+    return ReminderStore.build(snapshot, version=version)
+
+def get_reminder_store():
+    """Returns the normalized store for the current reminder snapshot, rebuilding it if the snapshot changed."""
+    global _reminder_store, _reminder_store_source
+    if APP_ROLE == 'web':
+        return get_shared_store()
+    if _reminder_store_source is None and not _reminder_store.empty and sheet_cache.peek(REMINDER_TAB) is None:
+        # Serving the persisted snapshot; reconcile with the sheet in the background
+        sheet_cache.prefetch(REMINDER_TAB)
+        return _reminder_store
+    try:
+        snapshot = sheet_cache.get(REMINDER_TAB)
+    except Exception as e:
+        print(f"[GOOGLE SHEETS ERROR] Tab={REMINDER_TAB} | {repr(e)}")
+        return _reminder_store
+    with _store_lock:
+        if snapshot is not _reminder_store_source:
+            store = build_reminder_store(snapshot, _reminder_store.version + 1)
+            # Pharmacies without new or edited rows keep their adherence rollups
+            store.inherit_rollups(_reminder_store)
+            _reminder_store = store
+            _reminder_store_source = snapshot
+            # Stores normalized in the compute pool are already on disk
+            if SNAPSHOT_PERSIST and store.generation is None:
+                snapshot_file.save_async(store.frame, store.offsets, store.version)
+        return _reminder_store
+
+def get_dashboard_data(phone_no, store=None, filters=None):
+    """Returns dashboard data for a pharmacy, memoized per snapshot version and filter set."""
+    if store is None:
+        store = get_reminder_store()
+    elif isinstance(store, pd.DataFrame):
+        # Ad-hoc frames have no snapshot version, so their results are never memoized
+        store = ReminderStore.build(store, version=None)
+
+    if store.version is None:
+        return build_dashboard_data(phone_no, store, filters)
+
+    # Keyed by the pharmacy's own content hash, so edits to other pharmacies don't invalidate it
+    cache_key = (str(phone_no).strip(), canonical_filters(filters), store.partition_hash(phone_no))
+    dashboard_data = dashboard_cache.get(cache_key)
+    if dashboard_data is None:
+        dashboard_data = run_offloaded(phone_no, store, dashboard_task, (phone_no, filters),
+                                       lambda: build_dashboard_data(phone_no, store, filters))
+        dashboard_cache.set(cache_key, dashboard_data)
     return dashboard_data
 
-def get_empty_dashboard_data():
-    """Returns empty dashboard structure when filters result in no data."""
-    return {
-        "kpi_cards": { "total_patients": 0, "adherence_rate": "0.0", "reminders_sent": 0, "pending_reminders": 0 },
-        "adherence_trend": {"labels": [], "data": []},
-        "reminder_status": {"labels": [], "data": []},
-        "top_medications": {"labels": [], "data": []},
-        "dosage_distribution": {"labels": [], "data": []},
-        "reminders_by_time": {"labels": ['Morning', 'Afternoon', 'Evening', 'Unknown'], "data": [0, 0, 0, 0]},
-        "upcoming_vs_completed": {"labels": ['Upcoming', 'Completed'], "data": [0, 0]},
-        "check_in_table": []
+# --- Connected Dashboard Clients ---
+# sid -> {'phone_no': ..., 'filters': ..., 'seq': ...}; lets the poller push each client the view it is looking at
+DEFAULT_DASHBOARD_FILTERS = {"dateRange": "all"}
+connected_clients = {}
+clients_lock = Lock()
+# Bursts of apply_filters events from one session collapse into the newest request
+filter_coalescer = RequestCoalescer(sleep=lambda seconds: socketio.sleep(seconds))
+# Streamed chat replies in flight, so a new question or a disconnect can cancel them
+chat_streams = ChatStreams()
+chat_token_usage = TokenUsage()
+# Resubmitted or double-clicked prescriptions reuse the schedule already extracted for them
+schedule_cache = ScheduleExtractionCache()
+# How scheduling messages were turned into schedule JSON ('model' includes cache hits)
+schedule_sources = {'quick_setup': 0, 'model': 0}
+# Running and recent bulk uploads, so their status can be fetched after the upload page reconnects
+bulk_jobs = BulkJobRegistry()
+# Outbound scheduling webhooks: durable, retried in the background, so requests never wait on Make.com
+webhook_queue = WebhookQueue()
+
+def update_poll_audience():
+    """Tells the poll scheduler how many clients and pharmacy rooms are connected."""
+    with clients_lock:
+        clients = len(connected_clients)
+        rooms = len({str(client_state['phone_no']).strip() for client_state in connected_clients.values()})
+    poll_scheduler.set_clients(clients, rooms)
+
+def push_dashboard_updates(store, pharmacy_ids):
+    """Recomputes and emits dashboards to the connected clients of the given pharmacies only."""
+    with clients_lock:
+        targets = [
+            (sid, client_state['phone_no'], client_state['filters'], client_state.get('seq'))
+            for sid, client_state in connected_clients.items()
+            if str(client_state['phone_no']).strip() in pharmacy_ids
+        ]
+    for sid, phone_no, filters, seq in targets:
+        # Clients sharing a pharmacy and filter set share one memoized computation
+        try:
+            dashboard_data = get_dashboard_data(phone_no, store, filters or DEFAULT_DASHBOARD_FILTERS)
+        except PoolBusy as e:
+            # The client keeps its current view; the next change or filter request brings it up to date
+            print(f"[COMPUTE POOL] Skipped update for {sid}: {e}")
+            continue
+        # Tagged with the client's latest request so it is dropped if a newer filter result is on its way
+        socketio.emit('filtered_data', {'data': json.dumps(dashboard_data, default=str), 'seq': seq}, to=sid)
+
+# Per-pharmacy hashes of the last snapshot whose changes were pushed to clients
+_published_lock = Lock()
+_published_state = {'version': None, 'hashes': None}
+
+def publish_reminder_changes():
+    """Pushes fresh dashboards to the pharmacies whose rows differ from the last published snapshot."""
+    store = get_reminder_store()
+    with _published_lock:
+        # An unchanged snapshot keeps its store (and version), so there is nothing to hash
+        if store.empty or store.version == _published_state['version']:
+            return set()
+        _published_state['version'] = store.version
+        hashes = store.partition_hashes
+        last_hashes = _published_state['hashes']
+        _published_state['hashes'] = hashes
+    if last_hashes is None:
+        return set()
+    changed = {
+        pharmacy_id for pharmacy_id in hashes.keys() | last_hashes.keys()
+        if hashes.get(pharmacy_id) != last_hashes.get(pharmacy_id)
     }
+    if changed:
+        print(f"Data change detected for {len(changed)} pharmacies, pushing updates to their rooms.")
+        dashboard_cache.discard_where(lambda key: key[0] in changed)
+        push_dashboard_updates(store, changed)
+    return changed
+
+def refresh_and_publish():
+    """Syncs the reminder tab from Google and publishes any per-pharmacy changes."""
+    try:
+        sheet_cache.refresh(REMINDER_TAB, raise_errors=True)
+    except Exception as e:
+        print(f"[POLLER ERROR] {repr(e)}")
+        poll_scheduler.record_error(e)
+        return set()
+    changed = publish_reminder_changes()
+    poll_scheduler.record_success(changed)
+    return changed
 
 def poll_google_sheet():
-    """Background thread to poll Google Sheet for changes and notify clients."""
-    last_data_hash = None
+    """Background thread to poll Google Sheet and push fresh dashboards to pharmacies whose rows changed."""
+    _poll_context.active = True
     while not thread_stop_event.isSet():
-        df = get_google_sheet_data(REMINDER_TAB)
-        if not df.empty:
-            current_data_hash = pd.util.hash_pandas_object(df, index=True).sum()
-            if last_data_hash is None or current_data_hash != last_data_hash:
-                last_data_hash = current_data_hash
-                
-                print("Data change detected, emitting 'data_changed' to all clients.")
-                # Emit a simple notification. The client will trigger a filter refresh.
-                socketio.emit('data_changed')
-        socketio.sleep(10)
+        # Paused while nobody is connected; wake up periodically to honour the stop event
+        if not poll_scheduler.wait_for_clients(timeout=30):
+            continue
+        delay = poll_scheduler.quota_delay()
+        if delay:
+            print(f"[POLLER] Read quota share used up, waiting {delay:.1f}s.")
+            socketio.sleep(delay)
+            continue
+        # Refreshing through the shared cache means request handlers rarely hit the network themselves
+        refresh_and_publish()
+        socketio.sleep(poll_scheduler.next_interval())
+
+def watch_shared_snapshot():
+    """Web workers: pushes fresh dashboards to this worker's clients when the sync process publishes a snapshot."""
+    while not thread_stop_event.isSet():
+        publish_reminder_changes()
+        socketio.sleep(SHARED_SNAPSHOT_CHECK_INTERVAL)
+
+def run_sheet_sync():
+    """
+    Main loop of the sync process: polls the reminder tab on the adaptive schedule, applies
+    changes forwarded by web workers, and publishes every new snapshot for them to map.
+    """
+    _poll_context.active = True
+    # Clients connect to the web workers, so the sync process always has an audience
+    poll_scheduler.set_clients(1, 0)
+    next_poll = 0.0
+    while not thread_stop_event.isSet():
+        for message in change_inbox.drain():
+            if message.get('resync'):
+                next_poll = 0.0
+            else:
+                apply_sheet_edit(int(message['start_row']), message['values'])
+        if time.monotonic() >= next_poll:
+            delay = poll_scheduler.quota_delay()
+            if delay:
+                next_poll = time.monotonic() + delay
+            else:
+                refresh_and_publish()
+                next_poll = time.monotonic() + poll_scheduler.next_interval()
+        socketio.sleep(SHARED_SNAPSHOT_CHECK_INTERVAL)
 
 # --- Flask Routes ---
 @app.route('/', methods=['GET'])
@@ -310,7 +447,12 @@ def login():
     phone_no = request.form['phone_no'].strip()
     unique_code = request.form['unique_code']
     
-    users_df = get_google_sheet_data(USERS_TAB)
+    # Always read the users tab fresh so a newly onboarded pharmacy can log in immediately
+    try:
+        users_df = fetch_google_sheet_data(USERS_TAB)
+    except Exception as e:
+        print(f"[GOOGLE SHEETS ERROR] Tab={USERS_TAB} | {repr(e)}")
+        users_df = pd.DataFrame()
     if users_df.empty:
         return render_template('login.html', error="Could not verify users at this time.")
 
@@ -320,6 +462,8 @@ def login():
     matches = users_df[(users_df['phone_no'] == phone_no) & (users_df['unique_code'] == unique_code)]
     
     if not matches.empty:
+        # A new session id at login, so one fixed by someone else beforehand is not authenticated
+        app.session_interface.regenerate(session)
         session['phone_no'] = phone_no
         session['pharm_name'] = matches.iloc[0]['pharm_name']
         return redirect(url_for('dashboard'))
@@ -332,25 +476,24 @@ def dashboard():
         return redirect(url_for('home'))
         
     phone_no = session.get('phone_no')
-    df = get_google_sheet_data(REMINDER_TAB)
+    store = get_reminder_store()
     # Load initial data with default filters (or no filters)
-    dashboard_data = get_dashboard_data(phone_no, df, {"dateRange":"all"}) # Default to All Time
+    dashboard_data = get_dashboard_data(phone_no, store, {"dateRange":"all"}) # Default to All Time
 
     # For the initial load, we also need to get the unique filter options from the *unfiltered* data
-    if not df.empty:
-        pharmacy_df = df[df['pharmacy_id'].astype(str).str.strip() == str(phone_no).strip()].copy()
-        if not pharmacy_df.empty:
-            filters = {
-                "medications": sorted(pharmacy_df['medication_name'].unique().tolist()),
-                "statuses": sorted(pharmacy_df['status'].str.strip().str.lower().unique().tolist()),
-                "frequencies": sorted(pharmacy_df['frequency'].unique().tolist())
-            }
-        else:
-            filters = {"medications": [], "statuses": [], "frequencies": []}
+    pharmacy_df = store.pharmacy_frame(phone_no)
+    if not pharmacy_df.empty:
+        filters = {
+            "medications": sorted(pharmacy_df['medication_name'].unique().tolist()),
+            "statuses": sorted(pharmacy_df['status'].unique().tolist()),
+            "frequencies": sorted(pharmacy_df['frequency'].unique().tolist())
+        }
     else:
         filters = {"medications": [], "statuses": [], "frequencies": []}
 
-    return render_template('dashboard_modular.html', phone_no=phone_no, pharm_name=session.get('pharm_name', phone_no), dashboard_data=json.dumps(dashboard_data, default=str), filters=json.dumps(filters))
+    # Without sticky sessions a polling handshake could land on another worker, so web workers use websockets only
+    socketio_options = {'transports': ['websocket']} if APP_ROLE == 'web' else {}
+    return render_template('dashboard_modular.html', phone_no=phone_no, pharm_name=session.get('pharm_name', phone_no), dashboard_data=json.dumps(dashboard_data, default=str), filters=json.dumps(filters), socketio_options=json.dumps(socketio_options))
 
 @app.route('/api/filter', methods=['POST'])
 def filter_data():
@@ -361,8 +504,7 @@ def filter_data():
     phone_no = session.get('phone_no')
     filters = request.json
     
-    df = get_google_sheet_data(REMINDER_TAB)
-    dashboard_data = get_dashboard_data(phone_no, df, filters)
+    dashboard_data = get_dashboard_data(phone_no, get_reminder_store(), filters)
     
     return jsonify(dashboard_data)
 
@@ -396,52 +538,187 @@ tools = [
     }
 ]
 
-import requests
-
 # --- Helper function for Sending Scheduling Webhook ---
-def send_scheduling_webhook(llm_generated_json):
-    """
-    Sends the LLM-generated optimized JSON payload to the Make.com webhook.
-    """
-    print(f"Sending scheduling webhook with LLM-generated JSON: {llm_generated_json}")
-    
-    webhook_url = os.environ.get('MAKE_WEBHOOK_URL', 'https://hook.eu2.make.com/rjkyoocagsfsrol73ozbq3ypkf7nvsyd')
-    
+def scheduling_contact(llm_generated_json):
+    """The webhook 'contact' object for a schedule JSON, or None if it has no phone number."""
     # The LLM generates the JSON exactly as expected by the webhook's 'extracted_json' variable
     # We just need to wrap it in the 'contact' structure
-    
+
     # Safely get patient info from the LLM-generated JSON
     patient_info = llm_generated_json.get('p', {})
     patient_identifier = patient_info.get('id', 'Unknown Patient')
     phone_number = patient_info.get('ph')
-    
     if not phone_number:
+        return None
+    return {
+        "username": patient_identifier,
+        "name": patient_identifier,
+        "phone": phone_number,
+        "variables": {
+            "extracted_json": json.dumps(llm_generated_json)
+        }
+    }
+
+def enqueue_scheduling_webhook(schedules, owner=None):
+    """
+    Queues one Make.com webhook request carrying a contact per schedule JSON and returns the queued job.
+    The idempotency key is derived from the schedules, so sending the same ones again while they are queued is a no-op.
+    """
+    webhook_url = os.environ.get('MAKE_WEBHOOK_URL', 'https://hook.eu2.make.com/rjkyoocagsfsrol73ozbq3ypkf7nvsyd')
+    payload = [{"contact": scheduling_contact(schedule)} for schedule in schedules]
+    webhook_queue.start(socketio.start_background_task)
+    return webhook_queue.enqueue(webhook_url, payload, idempotency_key(schedules), owner=owner)
+
+def send_scheduling_webhook(llm_generated_json, owner=None):
+    """
+    Queues the LLM-generated optimized JSON payload for the Make.com webhook; delivery happens in the background.
+    """
+    print(f"Sending scheduling webhook with LLM-generated JSON: {llm_generated_json}")
+
+    contact = scheduling_contact(llm_generated_json)
+    if contact is None:
         return {"status": "error", "message": "Phone number not found in LLM-generated JSON. Cannot send webhook."}
+    patient_identifier = contact["name"]
 
-    webhook_payload = [{
-        "contact": {
-            "username": patient_identifier,
-            "name": patient_identifier,
-            "phone": phone_number,
-            "variables": {
-                "extracted_json": json.dumps(llm_generated_json)
-            }
-        }
-    }]
-    
     try:
-        response = requests.post(webhook_url, json=webhook_payload)
-        response.raise_for_status() # Raise an exception for bad status codes (4xx or 5xx)
-        print(f"Webhook response: {response.status_code}")
-        return {"status": "success", "message": f"Successfully scheduled reminder for {patient_identifier}."}
-    except requests.exceptions.RequestException as e:
-        print(f"[WEBHOOK ERROR] {e}")
+        job = enqueue_scheduling_webhook([llm_generated_json], owner=owner)
+    except sqlite3.Error as e:
+        print(f"[WEBHOOK QUEUE ERROR] {e}")
         return {"status": "error", "message": f"Failed to schedule reminder. Error: {e}"}
+    if job['duplicate']:
+        return {"status": "success", "message": f"This reminder for {patient_identifier} is already queued for delivery."}
+    return {"status": "success", "message": f"Reminder for {patient_identifier} queued for delivery."}
+
+
+# --- Chat Assistant ---
+SCHEDULING_KEYWORDS = ["schedule", "remind", "set up reminder", "loading dose"]
+# Build schedules for well-formed Quick Setup messages locally (quick_setup.py) instead of asking
+# the model. Off until `python quick_setup_parity.py check` passes against recorded model outputs.
+QUICK_SETUP_LOCAL_PARSE = os.environ.get('QUICK_SETUP_LOCAL_PARSE', 'false').lower() == 'true'
+TOOL_SUMMARY_INSTRUCTION = {"role": "system", "content": "The previous tool call returned data. Please summarize this information concisely and clearly for the user in a human-readable format. Extract key facts like adherence rate, total patients, and pending reminders without simply re-listing all raw data."}
+
+def new_conversation_history():
+    return [{"role": "system", "content": "You are a helpful assistant for pharmacy administrators. Today's date is " + datetime.now().strftime("%Y-%m-%d") + ". If you cannot answer a question directly using your available tools and data, please inform the user about this limitation and explain why, offering to provide related information if possible. Do not make up answers or provide irrelevant details."}]
+
+def is_scheduling_question(question):
+    # Determine if the intent is scheduling based on keywords, or a message in the Quick Setup format
+    if any(keyword in question.lower() for keyword in SCHEDULING_KEYWORDS):
+        return True
+    return QUICK_SETUP_LOCAL_PARSE and parse_quick_setup(question) is not None
+
+def scheduling_system_message():
+    # For scheduling, use the comprehensive prompt from the MD file
+    current_date_str = datetime.now().strftime("%Y-%m-%d")
+    current_time_str = datetime.now().strftime("%I:%M %p") # e.g., 03:30 PM
+
+    formatted_scheduling_prompt = PRESCRIPTION_SCHEDULE_PROMPT_MD_CONTENT.replace(
+        "{{$current_date}}", current_date_str
+    ).replace(
+        "{{$current_time}}", current_time_str
+    )
+    return {"role": "system", "content": formatted_scheduling_prompt}
+
+def start_chat_turn(history, question):
+    """
+    Trims `history` in place to the token budget (older turns are reduced to a note
+    listing their questions), records the question in it and returns
+    (messages, is_scheduling_intent) for the model.
+    """
+    history[:] = window_history(history)
+    is_scheduling_intent = is_scheduling_question(question)
+
+    if is_scheduling_intent:
+        # Append the scheduling system prompt after the general one; it is sent for this question only
+        messages = list(history) # Start with existing history (including general system message)
+        messages.append(scheduling_system_message())
+    else:
+        # For general queries, use the standard system message and previous conversation history
+        messages = list(history)
+    messages.append({"role": "user", "content": question})
+    history.append({"role": "user", "content": question})
+    return messages, is_scheduling_intent
+
+SCHEDULING_MODEL = "gpt-4o-mini"
+
+def extract_schedule_json(phone_no, question, messages, start_date=None):
+    """The schedule JSON string for a scheduling question: parsed locally, from the schedule cache, or from the model."""
+    # Well-formed Quick Setup messages need no model call at all
+    schedule = parse_quick_setup(question, start_date=start_date) if QUICK_SETUP_LOCAL_PARSE else None
+    if schedule is not None:
+        schedule_sources['quick_setup'] += 1
+        print(f"[QUICK SETUP] Parsed schedule locally for {phone_no}")
+        return json.dumps(schedule, separators=(',', ':'))
+    schedule_sources['model'] += 1
+
+    def call_model():
+        llm_response = client.chat.completions.create(
+            model=SCHEDULING_MODEL,
+            temperature=0.2,
+            messages=messages,
+            response_format={"type": "json_object"}
+        )
+        chat_token_usage.record('schedule', messages, llm_response.usage)
+        return llm_response.choices[0].message.content
+
+    # The prompt resolves dates against today, so the date is part of the key
+    key = schedule_cache.key(question, str(phone_no).strip(), SCHEDULING_MODEL, PRESCRIPTION_SCHEDULE_PROMPT_HASH,
+                             datetime.now().strftime("%Y-%m-%d"))
+    llm_json_string, source = schedule_cache.get_or_extract(key, question, call_model)
+    if source != 'model':
+        print(f"[SCHEDULE CACHE] Reused extraction ({source}) for {phone_no}")
+    return llm_json_string
+
+def schedule_from_llm_json(llm_json_string, phone_no=None):
+    """Queues the model's scheduling JSON for the webhook and returns the answer for the user; raises json.JSONDecodeError."""
+    # --- DEBUGGING: Print LLM's raw JSON output ---
+    print(f"\n[LLM GENERATED JSON DEBUG]:\n{llm_json_string}\n")
+    parsed_llm_json = json.loads(llm_json_string)
+
+    # --- Send to Webhook ---
+    webhook_result = send_scheduling_webhook(parsed_llm_json, owner=phone_no)
+    if webhook_result["status"] == "success":
+        return f"✅ Reminder successfully scheduled! {webhook_result['message']}"
+    return f"❌ Failed to schedule reminder: {webhook_result['message']}"
+
+def run_chat_tools(phone_no, tool_calls):
+    """Executes the model's tool calls (as dicts) and returns the tool messages to send back to it."""
+    # Load the reminder store once for all tool calls
+    store_for_tools = get_reminder_store()
+    available_functions = {
+        "get_dashboard_data": get_dashboard_data,
+    }
+
+    tool_messages = []
+    for tool_call in tool_calls:
+        function_name = tool_call['function']['name']
+        function_to_call = available_functions.get(function_name)
+        function_args = json.loads(tool_call['function']['arguments'] or '{}')
+
+        # Special handling for get_dashboard_data which needs the store
+        if function_name == "get_dashboard_data":
+            function_response = function_to_call(
+                phone_no=phone_no,
+                store=store_for_tools,
+                filters=function_args.get("filters")
+            )
+        else: # This else case should ideally not be reached with only get_dashboard_data tool
+            function_response = "Error: Unknown tool."
+
+        tool_messages.append(
+            {
+                "tool_call_id": tool_call['id'],
+                "role": "tool",
+                "name": function_name,
+                # KPIs and top entries only; the full dashboard (every check-in row) would dominate the prompt
+                "content": json.dumps(compact_dashboard_result(function_response), default=str),
+            }
+        )
+    return tool_messages
 
 
 @app.route('/api/chat', methods=['POST'])
 def api_chat():
-    """API endpoint for the AI chat assistant, now powered by OpenAI."""
+    """API endpoint for the AI chat assistant, now powered by OpenAI. The dashboard streams replies over Socket.IO instead (chat_message)."""
     if 'phone_no' not in session:
         return jsonify({'answer': 'Error: You must be logged in to use the chat assistant.'}), 401
 
@@ -453,42 +730,14 @@ def api_chat():
 
     # Universal initialization of conversation_history
     if 'conversation_history' not in session:
-        session['conversation_history'] = [{"role": "system", "content": "You are a helpful assistant for pharmacy administrators. Today's date is " + datetime.now().strftime("%Y-%m-%d") + ". If you cannot answer a question directly using your available tools and data, please inform the user about this limitation and explain why, offering to provide related information if possible. Do not make up answers or provide irrelevant details."}]
-
-    messages = []
-    
-    # Determine if the intent is scheduling based on keywords
-    scheduling_keywords = ["schedule", "remind", "set up reminder", "loading dose"]
-    is_scheduling_intent = any(keyword in question.lower() for keyword in scheduling_keywords)
-
-    if is_scheduling_intent:
-        # For scheduling, use the comprehensive prompt from the MD file
-        current_date_str = datetime.now().strftime("%Y-%m-%d")
-        current_time_str = datetime.now().strftime("%I:%M %p") # e.g., 03:30 PM
-        
-        formatted_scheduling_prompt = PRESCRIPTION_SCHEDULE_PROMPT_MD_CONTENT.replace(
-            "{{$current_date}}", current_date_str
-        ).replace(
-            "{{$current_time}}", current_time_str
-        )
-        
-        # Append the scheduling system prompt after the general one
-        messages = list(session['conversation_history']) # Start with existing history (including general system message)
-        messages.append({"role": "system", "content": formatted_scheduling_prompt})
-        messages.append({"role": "user", "content": question})
-        
-        # Store this intent to potentially maintain context for follow-ups in complex scheduling
-        session['last_intent'] = 'scheduling'
-    else:
-        # For general queries, use the standard system message and previous conversation history
-        # (conversation_history is already initialized universally)
-        messages = [
-            msg.model_dump() if hasattr(msg, 'model_dump') else msg 
-            for msg in session['conversation_history']
-        ]
-        messages.append({"role": "user", "content": question})
-        session['last_intent'] = 'general' # Mark general intent
+        session['conversation_history'] = new_conversation_history()
 
+    history = session['conversation_history']
+    messages, is_scheduling_intent = start_chat_turn(history, question)
+    # Reassigned so the trimmed history is saved to the session store
+    session['conversation_history'] = history
+    # Store this intent to potentially maintain context for follow-ups in complex scheduling
+    session['last_intent'] = 'scheduling' if is_scheduling_intent else 'general'
 
     # --- DEBUGGING: Print the messages list sent to OpenAI ---
     print(f"\n[LLM PROMPT DEBUG] Messages sent to OpenAI:\n{json.dumps(messages, indent=2)}\n")
@@ -497,29 +746,11 @@ def api_chat():
         # --- First API Call to OpenAI ---
         if is_scheduling_intent:
             # For scheduling, request JSON output
-            llm_response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                temperature=0.2,
-                messages=messages,
-                response_format={"type": "json_object"}
-            )
             # The LLM's response content should be the JSON string
-            llm_json_string = llm_response.choices[0].message.content
-            
-            # --- DEBUGGING: Print LLM's raw JSON output ---
-            print(f"\n[LLM GENERATED JSON DEBUG]:\n{llm_json_string}\n")
+            llm_json_string = extract_schedule_json(phone_no, question, messages)
             
             try:
-                parsed_llm_json = json.loads(llm_json_string)
-                
-                # --- Send to Webhook ---
-                webhook_result = send_scheduling_webhook(parsed_llm_json)
-                
-                if webhook_result["status"] == "success":
-                    final_answer = f"✅ Reminder successfully scheduled! {webhook_result['message']}"
-                else:
-                    final_answer = f"❌ Failed to schedule reminder: {webhook_result['message']}"
-                
+                final_answer = schedule_from_llm_json(llm_json_string, phone_no)
                 # Append the final assistant response to maintain context
                 session['conversation_history'].append({"role": "assistant", "content": final_answer})
                 return jsonify({'answer': final_answer})
@@ -536,6 +767,7 @@ def api_chat():
                 messages=messages,
                 tools=tools, 
             )
+            chat_token_usage.record('general', messages, response.usage)
             response_message = response.choices[0].message
             tool_calls = response_message.tool_calls
             
@@ -544,62 +776,32 @@ def api_chat():
 
             # --- Step 2: Check if the model wants to call a tool ---
             if tool_calls:
-                # Load Google Sheet data once if tool calls are detected
-                df_for_tools = get_google_sheet_data(REMINDER_TAB)
-                
                 # Append the assistant's response with tool_calls (converted to dict)
-                session['conversation_history'].append(response_message.model_dump()) 
+                assistant_message = response_message.model_dump(exclude_none=True)
+                session['conversation_history'].append(assistant_message)
                 
-                # --- Step 3: Execute the tool and get its result ---
-                available_functions = {
-                    "get_dashboard_data": get_dashboard_data,
-                }
-                
-                for tool_call in tool_calls:
-                    function_name = tool_call.function.name
-                    function_to_call = available_functions[function_name]
-                    function_args = json.loads(tool_call.function.arguments)
-                    
-                    # Special handling for get_dashboard_data which needs the df
-                    if function_name == "get_dashboard_data":
-                        function_response = function_to_call(
-                            phone_no=phone_no,
-                            df=df_for_tools,
-                            filters=function_args.get("filters")
-                        )
-                    else: # This else case should ideally not be reached with only get_dashboard_data tool
-                        function_response = "Error: Unknown tool."
-                    
-                    # --- Step 4: Send the tool's result back to the model ---
-                    session['conversation_history'].append(
-                        {
-                            "tool_call_id": tool_call.id,
-                            "role": "tool",
-                            "name": function_name,
-                            "content": json.dumps(function_response, default=str),
-                        }
-                    )
+                # --- Step 3 and 4: Execute the tools and send their results back to the model ---
+                session['conversation_history'].extend(run_chat_tools(phone_no, assistant_message['tool_calls']))
                 
                 # --- Second API Call to OpenAI ---
-                # Add a system message to instruct the LLM to summarize the tool output
-                session['conversation_history'].append(
-                    {"role": "system", "content": "The previous tool call returned data. Please summarize this information concisely and clearly for the user in a human-readable format. Extract key facts like adherence rate, total patients, and pending reminders without simply re-listing all raw data."}
-                )
+                # Add a system message to instruct the LLM to summarize the tool output; it is not kept in the history
+                summary_messages = session['conversation_history'] + [TOOL_SUMMARY_INSTRUCTION]
                 # This call sends the tool's response back to the model so it can generate a final, human-readable answer.
                 second_response = client.chat.completions.create(
                     model="gpt-4o",
-                    messages=session['conversation_history'],
+                    messages=summary_messages,
                 )
+                chat_token_usage.record('tool_summary', summary_messages, second_response.usage)
                 final_answer = second_response.choices[0].message.content
                 # Append the final assistant response (converted to dict)
-                session['conversation_history'].append(second_response.choices[0].message.model_dump())
+                session['conversation_history'].append(second_response.choices[0].message.model_dump(exclude_none=True))
                 return jsonify({'answer': final_answer})
 
             # If no tool was called, just return the model's direct answer
             else:
                 answer = response_message.content
                 # Append the assistant's direct response (converted to dict)
-                session['conversation_history'].append(response_message.model_dump())
+                session['conversation_history'].append(response_message.model_dump(exclude_none=True))
                 return jsonify({'answer': answer})
 
     except Exception as e:
@@ -611,6 +813,94 @@ def api_chat():
         return jsonify({'answer': error_message}), 500
 
 
+def save_chat_turn(session_id, messages):
+    """Appends a streamed turn's messages to the conversation in the stored session `session_id`."""
+    def append(values):
+        history = values.get('conversation_history') or new_conversation_history()
+        values['conversation_history'] = window_history(history) + messages
+    if not app.session_interface.modify(session_id, append):
+        print(f"[SESSION] Streamed chat reply not saved: the session ended or is too large ({len(messages)} messages dropped)")
+
+def stream_chat_reply(sid, request_id, phone_no, session_id, history, question, cancelled):
+    """
+    Background task behind the chat_message event: streams the reply to `sid` as
+    chat_token events and ends with chat_done (full answer), chat_error, or nothing
+    if cancelled. Under gevent the OpenAI client's sockets are cooperative, so
+    waiting on the model ties up neither a worker nor other clients.
+
+    The turn is built on a copy of `history`, the session's conversation when the
+    message arrived, and its messages are appended to the stored session
+    `session_id` under the sid's history lock when the task ends, so an
+    overlapping reply (e.g. one still finishing after being cancelled) never
+    loses or interleaves with another's messages.
+    """
+    def send(event, **payload):
+        socketio.emit(event, dict(payload, request_id=request_id), to=sid)
+
+    first_token = []
+    def on_token(delta):
+        if not first_token:
+            first_token.append(True)
+            chat_streams.first_token(sid, request_id)
+        send('chat_token', delta=delta)
+
+    outcome = 'completed'
+    turn = list(history)
+    new_from = len(turn)
+    try:
+        messages, is_scheduling_intent = start_chat_turn(turn, question)
+        new_from = len(turn) - 1
+        if is_scheduling_intent:
+            # The scheduling JSON is for the webhook, not the user, so it is not streamed
+            send('chat_status', status='Preparing the reminder schedule...')
+            llm_json_string = extract_schedule_json(phone_no, question, messages)
+            if cancelled.is_set():
+                outcome = 'cancelled'
+                return
+            try:
+                final_answer = schedule_from_llm_json(llm_json_string, phone_no)
+            except json.JSONDecodeError:
+                print(f"[LLM JSON ERROR] Invalid JSON: {llm_json_string}")
+                outcome = 'failed'
+                send('chat_error', answer="Sorry, I received an invalid JSON response from the scheduling logic. Please try again.")
+                return
+            turn.append({"role": "assistant", "content": final_answer})
+            send('chat_done', answer=final_answer)
+            return
+
+        reply = stream_completion(
+            client.chat.completions.create(model="gpt-4o", messages=messages, tools=tools, stream=True,
+                                           stream_options={"include_usage": True}),
+            cancelled, on_token, lambda usage: chat_token_usage.record('general', messages, usage)
+        )
+        if reply is not None and reply.get('tool_calls'):
+            turn.append(reply)
+            send('chat_status', status='Looking up your dashboard data...')
+            # Tool results go into the history even if the reply is cancelled next, so every tool call stays answered
+            turn.extend(run_chat_tools(phone_no, reply['tool_calls']))
+            summary_messages = turn + [TOOL_SUMMARY_INSTRUCTION]
+            reply = None if cancelled.is_set() else stream_completion(
+                client.chat.completions.create(model="gpt-4o", messages=summary_messages, stream=True,
+                                               stream_options={"include_usage": True}),
+                cancelled, on_token, lambda usage: chat_token_usage.record('tool_summary', summary_messages, usage)
+            )
+        if reply is None:
+            outcome = 'cancelled'
+            return
+        turn.append(reply)
+        send('chat_done', answer=reply['content'])
+    except Exception as e:
+        outcome = 'failed'
+        print(f"[OPENAI API ERROR] {repr(e)}")
+        error_message = f"Sorry, an error occurred with the AI model: {e}"
+        turn.append({"role": "assistant", "content": error_message})
+        send('chat_error', answer=error_message)
+    finally:
+        with chat_streams.history_lock(sid):
+            save_chat_turn(session_id, turn[new_from:])
+        chat_streams.finish(sid, request_id, outcome)
+
+
 @app.route('/api/details')
 def get_details():
     """API endpoint to get detailed data for drill-downs."""
@@ -620,254 +910,136 @@ def get_details():
     phone_no = session.get('phone_no')
     metric = request.args.get('metric')
     
-    df = get_google_sheet_data(REMINDER_TAB)
-    if df.empty:
+    store = get_reminder_store()
+    if store.empty:
         return jsonify([])
 
-    # Basic cleaning
-    df['pharmacy_id'] = df['pharmacy_id'].astype(str).str.strip()
-    df['status'] = df['status'].astype(str).str.strip().str.lower()
-    df['next_reminder_time'] = pd.to_datetime(df['next_reminder_time'], errors='coerce')
-
-    pharmacy_df = df[df['pharmacy_id'] == str(phone_no).strip()].copy()
-
-    details_df = pd.DataFrame()
-
-    if metric == 'pending_reminders':
-        details_df = pharmacy_df[pharmacy_df['status'].isin(['pending', 'upcoming'])]
-        # Select and rename columns for clarity in the modal
-        details_df = details_df[[
-            'patient_identifier', 'phone_number', 'medication_name', 'next_reminder_time'
-        ]].rename(columns={
-            'patient_identifier': 'Patient Name',
-            'phone_number': 'Phone Number',
-            'medication_name': 'Medication',
-            'next_reminder_time': 'Next Reminder'
-        })
-        # Format date for better readability
-        details_df['Next Reminder'] = details_df['Next Reminder'].dt.strftime('%Y-%m-%d %I:%M %p')
-
-    elif metric == 'total_patients':
-        try:
-            # Simple patient list with basic info
-            patient_list = []
-            for patient_id in pharmacy_df['patient_identifier'].unique():
-                patient_data = pharmacy_df[pharmacy_df['patient_identifier'] == patient_id]
-                
-                patient_list.append({
-                    'Patient Name': patient_id,
-                    'Phone Number': patient_data['phone_number'].iloc[0] if len(patient_data) > 0 else 'N/A',
-                    'Primary Medication': patient_data['medication_name'].iloc[0] if len(patient_data) > 0 else 'N/A',
-                    'Total Reminders': len(patient_data)
-                })
-            
-            details_df = pd.DataFrame(patient_list)
-        except Exception as e:
-            print(f"Error in total_patients: {e}")
-            details_df = pd.DataFrame([{'Error': str(e)}])
+    pharmacy_df = store.pharmacy_frame(phone_no)
 
-    elif metric == 'adherence_rate':
-        try:
-            now = pd.Timestamp.now()
-            patient_adherence = []
-            
-            for patient_id in pharmacy_df['patient_identifier'].unique():
-                patient_data = pharmacy_df[pharmacy_df['patient_identifier'] == patient_id]
-                
-                completed = (patient_data['status'] == 'completed').sum()
-                # Convert to datetime and compare
-                reminder_times = pd.to_datetime(patient_data['next_reminder_time'], errors='coerce')
-                missed = ((reminder_times < now) & (patient_data['status'] != 'completed')).sum()
-                total_due = completed + missed
-                adherence_rate = (completed / total_due * 100) if total_due > 0 else 0
-                
-                # Categorize adherence
-                if adherence_rate > 80:
-                    category = "High (>80%)"
-                elif adherence_rate >= 60:
-                    category = "Medium (60-80%)"
-                else:
-                    category = "Low (<60%)"
-                
-                patient_adherence.append({
-                    'Patient Name': patient_id,
-                    'Completed': completed,
-                    'Missed': missed,
-                    'Adherence Rate (%)': round(adherence_rate, 1),
-                    'Category': category
-                })
-            
-            details_df = pd.DataFrame(patient_adherence).sort_values('Adherence Rate (%)', ascending=False)
-        except Exception as e:
-            print(f"Error in adherence_rate: {e}")
-            details_df = pd.DataFrame([{'Error': str(e)}])
+    # Each metric is a single grouped aggregation over the pharmacy's normalized rows
+    try:
+        details_df = run_offloaded(phone_no, store, drilldown_task, (phone_no, metric),
+                                   lambda: get_drilldown(pharmacy_df, metric))
+    except PoolBusy:
+        raise
+    except Exception as e:
+        print(f"Error in {metric} details: {e}")
+        details_df = pd.DataFrame([{'Error': str(e)}])
 
-    elif metric == 'reminders_sent':
-        try:
-            patient_reminders = []
-            
-            for patient_id in pharmacy_df['patient_identifier'].unique():
-                patient_data = pharmacy_df[pharmacy_df['patient_identifier'] == patient_id]
-                
-                total_reminders = len(patient_data)
-                latest_status = patient_data.iloc[-1]['status'] if len(patient_data) > 0 else 'N/A'
-                frequency = patient_data.iloc[0]['frequency'] if len(patient_data) > 0 else 'N/A'
-                last_reminder = pd.to_datetime(patient_data['time_stamp']).max().strftime('%Y-%m-%d %H:%M') if len(patient_data) > 0 else 'N/A'
-                
-                patient_reminders.append({
-                    'Patient Name': patient_id,
-                    'Total Reminders': total_reminders,
-                    'Latest Status': latest_status,
-                    'Frequency': frequency,
-                    'Last Reminder': last_reminder
-                })
-            
-            details_df = pd.DataFrame(patient_reminders).sort_values('Total Reminders', ascending=False)
-        except Exception as e:
-            print(f"Error in reminders_sent: {e}")
-            details_df = pd.DataFrame([{'Error': str(e)}])
+    return jsonify(details_df.to_dict('records'))
 
-    elif metric.startswith('medication_'):
-        try:
-            medication_name = metric.replace('medication_', '')
-            med_patients = pharmacy_df[pharmacy_df['medication_name'] == medication_name]
-            
-            patient_med_details = []
-            for patient_id in med_patients['patient_identifier'].unique():
-                patient_data = med_patients[med_patients['patient_identifier'] == patient_id]
-                
-                completed = (patient_data['status'] == 'completed').sum()
-                total = len(patient_data)
-                adherence_rate = (completed / total * 100) if total > 0 else 0
-                
-                patient_med_details.append({
-                    'Patient Name': patient_id,
-                    'Dosage': patient_data.iloc[0]['dosage'],
-                    'Frequency': patient_data.iloc[0]['frequency'],
-                    'Adherence Rate (%)': round(adherence_rate, 1),
-                    'Current Status': patient_data.iloc[-1]['status']
-                })
-            
-            details_df = pd.DataFrame(patient_med_details).sort_values('Adherence Rate (%)', ascending=False)
-        except Exception as e:
-            print(f"Error in medication details: {e}")
-            details_df = pd.DataFrame([{'Error': str(e)}])
 
-    elif metric.startswith('status_'):
-        try:
-            status_name = metric.replace('status_', '').lower()
-            status_patients = pharmacy_df[pharmacy_df['status'] == status_name]
-            
-            status_details = []
-            for _, row in status_patients.iterrows():
-                # Calculate days in status
-                reminder_time = pd.to_datetime(row['next_reminder_time'], errors='coerce')
-                now = pd.Timestamp.now()
-                days_in_status = (now - reminder_time).days if pd.notna(reminder_time) else 0
-                
-                status_details.append({
-                    'Patient Name': row['patient_identifier'],
-                    'Medication': row['medication_name'],
-                    'Due Time': reminder_time.strftime('%Y-%m-%d %H:%M') if pd.notna(reminder_time) else 'N/A',
-                    'Days in Status': max(0, days_in_status),
-                    'Phone Number': row['phone_number']
-                })
-            
-            details_df = pd.DataFrame(status_details).sort_values('Days in Status', ascending=False)
-        except Exception as e:
-            print(f"Error in status details: {e}")
-            details_df = pd.DataFrame([{'Error': str(e)}])
+@app.route('/api/sheet-webhook', methods=['POST'])
+def sheet_webhook():
+    """
+    Push ingestion for sheet edits.
 
-    elif metric.startswith('time_'):
-        try:
-            time_slot = metric.replace('time_', '')
-            
-            # Create time category from reminderTime
-            def categorize_time(time_str):
-                try:
-                    hour = int(time_str.split(':')[0])
-                    if hour < 12: return 'Morning'
-                    elif 12 <= hour < 17: return 'Afternoon'
-                    else: return 'Evening'
-                except:
-                    return 'Unknown'
-            
-            pharmacy_df['temp_time_category'] = pharmacy_df['reminderTime'].apply(categorize_time)
-            time_patients = pharmacy_df[pharmacy_df['temp_time_category'] == time_slot]
-            
-            time_details = []
-            for patient_id in time_patients['patient_identifier'].unique():
-                patient_data = time_patients[time_patients['patient_identifier'] == patient_id]
-                
-                # Calculate adherence for this time slot
-                completed = (patient_data['status'] == 'completed').sum()
-                total = len(patient_data)
-                adherence_rate = (completed / total * 100) if total > 0 else 0
-                
-                time_details.append({
-                    'Patient Name': patient_id,
-                    'Medication': patient_data.iloc[0]['medication_name'],
-                    'Exact Time': patient_data.iloc[0]['reminderTime'],
-                    'Adherence Rate (%)': round(adherence_rate, 1),
-                    'Total Reminders': total
-                })
-            
-            details_df = pd.DataFrame(time_details).sort_values('Adherence Rate (%)', ascending=False)
-        except Exception as e:
-            print(f"Error in time details: {e}")
-            details_df = pd.DataFrame([{'Error': str(e)}])
+    Accepts an Apps Script onEdit payload {"tab", "start_row", "values"} and applies it
+    to the in-memory snapshot, or a Drive push notification (X-Goog-Resource-State header)
+    which triggers an incremental sync. Either way changed pharmacies get fresh dashboards.
+    """
+    if not SHEET_WEBHOOK_SECRET:
+        return jsonify({'error': 'Sheet webhook is not configured'}), 404
+    token = request.headers.get('X-Sheet-Webhook-Token') or request.headers.get('X-Goog-Channel-Token') or ''
+    if not hmac.compare_digest(token, SHEET_WEBHOOK_SECRET):
+        return jsonify({'error': 'Unauthorized'}), 401
 
-    elif metric.startswith('completion_'):
-        try:
-            completion_type = metric.replace('completion_', '')
-            now = pd.Timestamp.now()
-            
-            if completion_type.lower() == 'upcoming':
-                # Show pending/upcoming reminders
-                upcoming_data = pharmacy_df[pharmacy_df['status'].isin(['pending', 'upcoming'])]
-                
-                completion_details = []
-                for _, row in upcoming_data.iterrows():
-                    due_time = pd.to_datetime(row['next_reminder_time'], errors='coerce')
-                    days_until = (due_time - now).days if pd.notna(due_time) else 0
-                    
-                    completion_details.append({
-                        'Patient Name': row['patient_identifier'],
-                        'Medication': row['medication_name'],
-                        'Due Time': due_time.strftime('%Y-%m-%d %H:%M') if pd.notna(due_time) else 'N/A',
-                        'Days Until Due': max(0, days_until),
-                        'Frequency': row['frequency']
-                    })
-                
-                details_df = pd.DataFrame(completion_details).sort_values('Days Until Due')
-                
-            elif completion_type.lower() == 'completed':
-                # Show completed reminders
-                completed_data = pharmacy_df[pharmacy_df['status'] == 'completed']
-                
-                completion_details = []
-                for _, row in completed_data.iterrows():
-                    completion_time = pd.to_datetime(row['time_stamp'], errors='coerce')
-                    
-                    completion_details.append({
-                        'Patient Name': row['patient_identifier'],
-                        'Medication': row['medication_name'],
-                        'Completion Time': completion_time.strftime('%Y-%m-%d %H:%M') if pd.notna(completion_time) else 'N/A',
-                        'Frequency': row['frequency'],
-                        'Phone Number': row['phone_number']
-                    })
-                
-                details_df = pd.DataFrame(completion_details).sort_values('Completion Time', ascending=False)
-                
-        except Exception as e:
-            print(f"Error in completion details: {e}")
-            details_df = pd.DataFrame([{'Error': str(e)}])
+    resource_state = request.headers.get('X-Goog-Resource-State')
+    if resource_state:
+        # 'sync' is the handshake sent when the channel is created; it carries no change
+        if resource_state != 'sync':
+            if APP_ROLE == 'web':
+                change_inbox.post({'resync': True})
+            else:
+                socketio.start_background_task(refresh_and_publish)
+        return jsonify({'status': 'accepted'}), 202
 
-    # Future metrics can be added here
-    # elif metric == 'total_patients':
-    #     ...
+    payload = request.get_json(silent=True) or {}
+    tab_name = payload.get('tab', REMINDER_TAB)
+    if tab_name != REMINDER_TAB:
+        sheet_cache.invalidate(tab_name)
+        return jsonify({'status': 'invalidated'})
 
-    return jsonify(details_df.to_dict('records'))
+    try:
+        start_row = int(payload['start_row'])
+        values = payload['values']
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Expected start_row and values'}), 400
+    # Web workers don't hold the header; the sync process checks the width again when applying
+    problem = pushed_rows_problem(values, reminder_sync.width)
+    if problem:
+        return jsonify({'error': problem}), 400
+
+    if APP_ROLE == 'web':
+        # Only the sync process holds the resident reminder rows
+        change_inbox.post({'start_row': start_row, 'values': values})
+        return jsonify({'status': 'forwarded', 'rows': len(values)}), 202
+
+    result = apply_sheet_edit(start_row, values)
+    return jsonify(result), 202 if result['status'] == 'resync' else 200
+
+def apply_sheet_edit(start_row, values):
+    """Applies pushed reminder rows to the resident snapshot, or schedules a sync when they can't be applied."""
+    frame = reminder_sync.apply_rows(start_row, values) if SHEET_SYNC_MODE == 'incremental' else None
+    if frame is None:
+        # Not applicable locally (cold cache, header edit, gap); fall back to a sync
+        socketio.start_background_task(refresh_and_publish)
+        return {'status': 'resync'}
+
+    sheet_cache.put(REMINDER_TAB, frame)
+    changed = publish_reminder_changes()
+    return {'status': 'applied', 'rows': len(values), 'pharmacies_changed': len(changed)}
+
+
+@app.route('/api/patients/search')
+def search_patients():
+    """Typeahead: the pharmacy's patient identifiers starting with the typed prefix."""
+    if 'phone_no' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    prefix = request.args.get('q', '').strip()
+    limit = min(request.args.get('limit', 10, type=int), 50)
+    if not prefix:
+        return jsonify([])
+
+    pharmacy_index = get_reminder_store().pharmacy_index(session.get('phone_no'))
+    return jsonify(pharmacy_index.patients.prefix(prefix, limit))
+
+
+@app.route('/api/metrics')
+def metrics():
+    """Poller and cache statistics used to tune polling and size the in-process caches."""
+    if 'phone_no' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify({
+        'poller': poll_scheduler.state(),
+        'dashboard_cache': dashboard_cache.stats(),
+        'filter_coalescing': filter_coalescer.stats(),
+        'chat_streams': chat_streams.stats(),
+        'chat_tokens': chat_token_usage.stats(),
+        'schedule_cache': schedule_cache.stats(),
+        'schedule_sources': dict(schedule_sources),
+        'reminder_store_version': _reminder_store.version,
+        'reminder_snapshot_age': sheet_cache.age(REMINDER_TAB),
+        'snapshot_file': snapshot_file.stats,
+        'compute_pool': compute_pool.stats(),
+        'bulk_jobs': bulk_jobs.stats(),
+        'webhook_queue': webhook_queue.stats(),
+        'session_store': app.session_interface.stats(),
+        'role': APP_ROLE
+    })
+
+
+@app.errorhandler(PoolBusy)
+def compute_pool_busy(e):
+    """Sheds load when the compute pool is saturated instead of queueing without bound."""
+    if request.path.startswith('/api/'):
+        response = jsonify({'error': 'The server is busy, please retry shortly.'})
+    else:
+        # Pages get a page that retries itself rather than raw JSON
+        response = app.make_response(render_template('busy.html', retry_after=1))
+    response.headers['Retry-After'] = '1'
+    return response, 503
 
 
 @app.route('/schedule')
@@ -876,6 +1048,123 @@ def schedule():
         return redirect(url_for('home'))
     return render_template('prescription_scheduling.html')
 
+# --- Bulk Scheduling ---
+def prepare_bulk_schedule(job, group):
+    """Turns one patient's rows into a schedule JSON. Returns (schedule or None, progress updates)."""
+    if group['problems']:
+        # One bad row holds back the patient's whole schedule, so the file can be fixed and re-uploaded
+        updates = []
+        for row in group['rows']:
+            problems = group['problems'].get(row)
+            message = '; '.join(problems) if problems else 'another row for this patient is invalid'
+            updates += job.mark([row], 'invalid', message)
+        return None, updates
+
+    text = quick_setup_text(group)
+    try:
+        messages = [scheduling_system_message(), {"role": "user", "content": text}]
+        schedule = json.loads(extract_schedule_json(job.phone_no, text, messages, start_date=common_start_date(group)))
+    except Exception as e:
+        print(f"[BULK SCHEDULE ERROR] {group['patient']}: {e}")
+        return None, job.mark(group['rows'], 'failed', f"Could not build a schedule: {e}")
+    problems = validate_schedule(schedule)
+    if problems:
+        return None, job.mark(group['rows'], 'invalid', '; '.join(problems))
+    return schedule, []
+
+def run_bulk_schedule(job, groups):
+    """
+    Prepares every patient's schedule in parallel, then queues the contacts for the webhook
+    in batches, emitting per-row progress to the pharmacy's room as it goes. Always ends
+    with bulk_schedule_done; rows an unexpected error left without an outcome are failed.
+    """
+    def progress(updates):
+        if updates:
+            socketio.emit('bulk_schedule_progress', {'job_id': job.job_id, 'rows': updates, 'counts': job.counts()}, to=job.phone_no)
+
+    try:
+        ready = []
+        with ThreadPoolExecutor(max_workers=BULK_SCHEDULE_CONCURRENCY) as executor:
+            futures = {executor.submit(prepare_bulk_schedule, job, group): group for group in groups}
+            for future in as_completed(futures):
+                group = futures[future]
+                try:
+                    schedule, updates = future.result()
+                except Exception as e:
+                    print(f"[BULK SCHEDULE ERROR] {group['patient']}: {repr(e)}")
+                    schedule, updates = None, job.mark(group['rows'], 'failed', f"Could not build a schedule: {e}")
+                if schedule is not None:
+                    ready.append((group['rows'], schedule))
+                progress(updates)
+
+        # Each batch is one webhook request; the queue delivers and retries it (see /api/webhooks/dead)
+        for start in range(0, len(ready), BULK_WEBHOOK_BATCH_SIZE):
+            batch = ready[start:start + BULK_WEBHOOK_BATCH_SIZE]
+            rows = [row for group_rows, _ in batch for row in group_rows]
+            try:
+                enqueue_scheduling_webhook([schedule for _, schedule in batch], owner=job.phone_no)
+                job.webhook_batches += 1
+                progress(job.mark(rows, 'scheduled'))
+            except sqlite3.Error as e:
+                print(f"[WEBHOOK QUEUE ERROR] {e}")
+                progress(job.mark(rows, 'failed', f"Failed to schedule reminder. Error: {e}"))
+    except Exception as e:
+        print(f"[BULK SCHEDULE ERROR] {job.filename}: {repr(e)}")
+        progress(job.mark_remaining([row for group in groups for row in group['rows']], 'failed',
+                                    f"Bulk scheduling stopped: {e}"))
+    finally:
+        job.finished_at = time.time()
+        bulk_jobs.finish(job)
+        summary = job.snapshot()
+        print(f"[BULK SCHEDULE] {job.filename}: {summary['counts']} in {summary['seconds']}s")
+        socketio.emit('bulk_schedule_done', summary, to=job.phone_no)
+
+@app.route('/api/schedule/bulk', methods=['POST'])
+def api_schedule_bulk():
+    """Starts scheduling every prescription in an uploaded CSV/XLSX; progress arrives over Socket.IO."""
+    if 'phone_no' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        return jsonify({'error': 'No file uploaded.'}), 400
+    try:
+        prescriptions = read_prescription_file(upload.filename, upload.read())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if prescriptions.empty:
+        return jsonify({'error': 'The file has no prescription rows.'}), 400
+
+    groups = group_prescriptions(prescriptions)
+    job = BulkScheduleJob(uuid.uuid4().hex, session['phone_no'], upload.filename, len(prescriptions), len(groups))
+    bulk_jobs.add(job)
+    socketio.start_background_task(run_bulk_schedule, job, groups)
+    return jsonify({'job_id': job.job_id, 'rows': job.total_rows, 'patients': job.total_patients}), 202
+
+@app.route('/api/schedule/bulk/<job_id>')
+def api_schedule_bulk_status(job_id):
+    if 'phone_no' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    job = bulk_jobs.get(job_id)
+    if job is None or job.phone_no != session['phone_no']:
+        return jsonify({'error': 'Unknown bulk scheduling job.'}), 404
+    return jsonify(job.snapshot())
+
+@app.route('/api/webhooks/dead')
+def api_dead_webhooks():
+    """Scheduling webhooks that could not be delivered, newest first."""
+    if 'phone_no' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify({'jobs': webhook_queue.dead_letters(owner=session['phone_no'])})
+
+@app.route('/api/webhooks/dead/<int:job_id>/retry', methods=['POST'])
+def api_retry_dead_webhook(job_id):
+    if 'phone_no' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    if not webhook_queue.retry(job_id, owner=session['phone_no']):
+        return jsonify({'error': 'Unknown undelivered webhook.'}), 404
+    webhook_queue.start(socketio.start_background_task)
+    return jsonify({'status': 'queued'})
+
 @app.route('/logout')
 def logout():
     session.clear()
@@ -887,18 +1176,30 @@ def on_connect(auth=None):
     if 'phone_no' in session:
         phone_no = session.get('phone_no')
         join_room(phone_no)
+        with clients_lock:
+            connected_clients[request.sid] = {'phone_no': phone_no, 'filters': None}
+        update_poll_audience()
+        # Delivers webhooks still queued from before a restart
+        webhook_queue.start(socketio.start_background_task)
         print(f"Client connected and joined room: {phone_no}")
         global thread
         if not thread.is_alive():
             print("Starting background thread...")
-            thread = socketio.start_background_task(poll_google_sheet)
+            # Web workers leave the sheet to the sync process and only watch for its snapshots
+            thread = socketio.start_background_task(watch_shared_snapshot if APP_ROLE == 'web' else poll_google_sheet)
 
 @socketio.on('disconnect')
 def on_disconnect():
     if 'phone_no' in session:
         phone_no = session.get('phone_no')
-        socketio.leave_room(phone_no)
+        leave_room(phone_no)
         print(f"Client disconnected and left room: {phone_no}")
+    with clients_lock:
+        connected_clients.pop(request.sid, None)
+    filter_coalescer.forget(request.sid)
+    # A client that navigated away no longer wants the reply it was streaming
+    chat_streams.cancel(request.sid)
+    update_poll_audience()
 
 @socketio.on('apply_filters')
 def handle_filters(data):
@@ -908,11 +1209,57 @@ def handle_filters(data):
     
     phone_no = session.get('phone_no')
     filters = data.get('filters', {})
-    
-    df = get_google_sheet_data(REMINDER_TAB)
-    dashboard_data = get_dashboard_data(phone_no, df, filters)
-    
-    emit('filtered_data', {'data': json.dumps(dashboard_data, default=str)})
+    sid = request.sid
+    with clients_lock:
+        client_state = connected_clients.get(sid)
+        # Clients that don't number their requests get server-side sequence numbers in arrival order
+        seq = data.get('seq')
+        if not isinstance(seq, int):
+            seq = (client_state.get('seq') or 0) + 1 if client_state else 0
+        if client_state is not None and seq >= (client_state.get('seq') or 0):
+            client_state['filters'] = filters
+            client_state['seq'] = seq
+
+    def deliver(seq, dashboard_data):
+        socketio.emit('filtered_data', {'data': json.dumps(dashboard_data, default=str), 'seq': seq}, to=sid)
+
+    # Only the newest request per session is computed and emitted; older queued ones are dropped
+    try:
+        filter_coalescer.submit(
+            sid, seq, filters,
+            lambda latest_filters: get_dashboard_data(phone_no, get_reminder_store(), latest_filters),
+            deliver
+        )
+    except PoolBusy as e:
+        print(f"[COMPUTE POOL] Dropped filter request from {sid}: {e}")
+
+@socketio.on('chat_message')
+def handle_chat_message(data):
+    """Streams a chat assistant reply back to this client; replaces any reply still streaming."""
+    data = data or {}
+    request_id = data.get('request_id') or str(time.time_ns())
+    if 'phone_no' not in session:
+        socketio.emit('chat_error', {'request_id': request_id, 'answer': 'Error: You must be logged in to use the chat assistant.'}, to=request.sid)
+        return
+    question = (data.get('question') or '').strip()
+    if not question:
+        socketio.emit('chat_done', {'request_id': request_id, 'answer': 'I am sorry, but I did not receive a question.'}, to=request.sid)
+        return
+
+    # The conversation is shared with /api/chat through the session store; the reply task saves its turn there.
+    # Changes go straight to the store too: this handler's copy of the session is saved after it returns,
+    # and could overwrite a turn the reply task has saved in the meantime.
+    last_intent = 'scheduling' if is_scheduling_question(question) else 'general'
+    app.session_interface.modify(session.sid, lambda values: values.update(last_intent=last_intent))
+    cancelled = chat_streams.start(request.sid, request_id)
+    socketio.start_background_task(
+        stream_chat_reply, request.sid, request_id, session.get('phone_no'), session.sid,
+        list(session.get('conversation_history') or new_conversation_history()), question, cancelled
+    )
+
+@socketio.on('chat_cancel')
+def handle_chat_cancel(data):
+    chat_streams.cancel(request.sid, (data or {}).get('request_id'))
 
 if __name__ == '__main__':
     from mcp_server import app as mcp_app
@@ -0,0 +1,131 @@
+"""
+Offline micro-benchmarks for the reminder data paths.
+
+Builds synthetic ReminderData sheets (same columns and formats as the real tab)
+so nothing here talks to Google. Run e.g.:
+
+    python benchmark.py partition
+    python benchmark.py drilldown
+    python benchmark.py trend
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from drilldown import get_drilldown
+from reminder_store import ReminderStore
+from rollups import AdherenceRollup, adherence_trend
+
+MEDICATIONS = ['Amoxicillin', 'Metformin', 'Lisinopril', 'Atorvastatin', 'Ibuprofen', 'Paracetamol', 'Omeprazole']
+DOSAGES = ['500mg', '250mg', '10mg', '1 tab']
+FREQUENCIES = ['Once daily', 'Twice daily', 'Three times daily']
+STATUSES = ['completed', 'pending', 'upcoming', 'missed']
+
+
+def synthetic_reminders(rows, pharmacies, patients_per_pharmacy=50, seed=0):
+    """Returns a raw ReminderData frame shaped like get_all_records() output."""
+    rng = np.random.default_rng(seed)
+    now = pd.Timestamp.now(tz='UTC').floor('min')
+    time_stamp = now - pd.to_timedelta(rng.integers(0, 60 * 24 * 90, rows), unit='min')
+    next_reminder = time_stamp + pd.to_timedelta(rng.integers(-48, 96, rows), unit='h')
+    pharmacy = rng.integers(0, pharmacies, rows)
+    return pd.DataFrame({
+        'pharmacy_id': [f"080{1000000 + p}" for p in pharmacy],
+        'patient_identifier': [f"Patient {p}-{i}" for p, i in zip(pharmacy, rng.integers(0, patients_per_pharmacy, rows))],
+        'phone_number': [f"+234{n}" for n in rng.integers(10**9, 10**10, rows)],
+        'medication_name': rng.choice(MEDICATIONS, rows),
+        'dosage': rng.choice(DOSAGES, rows),
+        'frequency': rng.choice(FREQUENCIES, rows),
+        'status': rng.choice(STATUSES, rows),
+        'time_stamp': time_stamp.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+        'reminderTime': [f"{h:02d}:{m:02d}" for h, m in zip(rng.integers(0, 24, rows), rng.integers(0, 60, rows))],
+        'next_reminder_time': next_reminder.strftime('%Y-%m-%d %H:%M:%S'),
+        'should_check_in': rng.choice(['yes', 'no', ''], rows),
+        'check_in_date': (time_stamp + pd.Timedelta(days=7)).strftime('%Y-%m-%d'),
+        'check_in_message': 'How are you feeling?',
+    })
+
+
+def timed(fn, repeat=50):
+    """Median wall time of `fn()` in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return float(np.median(samples))
+
+
+def bench_partition(rows_per_pharmacy=200):
+    """Tenant slice latency as the number of pharmacies on one sheet grows."""
+    print(f"{'pharmacies':>10} {'rows':>8} {'mask+copy ms':>14} {'partition ms':>14}")
+    for pharmacies in (10, 100, 500, 2000):
+        raw = synthetic_reminders(rows_per_pharmacy * pharmacies, pharmacies)
+        store = ReminderStore.build(raw)
+        frame = store.frame
+        phone_no = store.pharmacy_ids[0]
+        masked = timed(lambda: frame[frame['pharmacy_id'] == phone_no].copy())
+        partitioned = timed(lambda: store.pharmacy_frame(phone_no))
+        print(f"{pharmacies:>10} {len(frame):>8} {masked:>14.3f} {partitioned:>14.3f}")
+
+
+def _per_patient_loop(pharmacy_df):
+    # The pre-engine shape of a drill-down: one boolean mask per patient
+    rows = []
+    for patient_id in pharmacy_df['patient_identifier'].unique():
+        patient_data = pharmacy_df[pharmacy_df['patient_identifier'] == patient_id]
+        rows.append({'Patient Name': patient_id, 'Total Reminders': len(patient_data),
+                     'Latest Status': patient_data.iloc[-1]['status']})
+    return pd.DataFrame(rows)
+
+
+def bench_drilldown(rows=100_000, pharmacies=1):
+    """Drill-down metric latency on one large pharmacy."""
+    store = ReminderStore.build(synthetic_reminders(rows, pharmacies, patients_per_pharmacy=2000))
+    pharmacy_df = store.pharmacy_frame(store.pharmacy_ids[0])
+    print(f"{len(pharmacy_df)} rows, {pharmacy_df['patient_identifier'].nunique()} patients")
+    print(f"{'metric':>24} {'ms':>10}")
+    print(f"{'per-patient loop (ref)':>24} {timed(lambda: _per_patient_loop(pharmacy_df), repeat=3):>10.1f}")
+    metrics = ['pending_reminders', 'total_patients', 'adherence_rate', 'reminders_sent', 'medication_Metformin',
+               'status_pending', 'time_Morning', 'completion_upcoming', 'completion_completed']
+    for metric in metrics:
+        print(f"{metric:>24} {timed(lambda: get_drilldown(pharmacy_df, metric), repeat=10):>10.1f}")
+
+
+def _groupby_trend(pharmacy_df, now):
+    # The pre-rollup trend: a per-day lambda over the due reminders' rows
+    completed = pharmacy_df['status'] == 'completed'
+    due = pharmacy_df[completed | (~completed & (pharmacy_df['next_reminder_time'] < now))].copy()
+    due['date'] = due['next_reminder_time'].dt.date
+    return due.groupby('date')['status'].apply(lambda x: (x == 'completed').sum() / len(x) * 100)
+
+
+def bench_trend(rows=100_000, pharmacies=1):
+    """Adherence trend latency: row scan versus slices of the daily rollups."""
+    store = ReminderStore.build(synthetic_reminders(rows, pharmacies, patients_per_pharmacy=2000))
+    phone_no = store.pharmacy_ids[0]
+    pharmacy_df = store.pharmacy_frame(phone_no)
+    now = pd.Timestamp.now(tz='UTC')
+    print(f"{len(pharmacy_df)} rows")
+    print(f"{'trend':>24} {'ms':>10}")
+    print(f"{'groupby lambda (ref)':>24} {timed(lambda: _groupby_trend(pharmacy_df, now), repeat=5):>10.1f}")
+    print(f"{'rollup build':>24} {timed(lambda: AdherenceRollup(pharmacy_df), repeat=5):>10.1f}")
+    rollup = store.adherence_rollup(phone_no)
+    for label, key, granularity in [('pharmacy / day', (None, None), 'day'), ('medication / day', ('medication_name', 'Metformin'), 'day'),
+                                    ('pharmacy / week', (None, None), 'week'), ('pharmacy / month', (None, None), 'month')]:
+        print(f"{label:>24} {timed(lambda: adherence_trend(rollup.counts(*key, now=now), granularity)):>10.3f}")
+
+
+BENCHMARKS = {
+    'partition': bench_partition,
+    'drilldown': bench_drilldown,
+    'trend': bench_trend,
+}
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print(f"== {name} ==")
+        BENCHMARKS[name]()
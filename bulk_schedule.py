@@ -0,0 +1,242 @@
+import io
+import os
+import re
+import time
+from datetime import datetime
+from threading import Lock
+
+import pandas as pd
+
+from quick_setup import CONTACT_METHODS
+from result_cache import LRUCache
+
+# --- Bulk Scheduling Configuration ---
+BULK_SCHEDULE_MAX_ROWS = int(os.environ.get('BULK_SCHEDULE_MAX_ROWS', 5000))
+# Patients prepared at once; only those needing the model wait on the network
+BULK_SCHEDULE_CONCURRENCY = int(os.environ.get('BULK_SCHEDULE_CONCURRENCY', 8))
+# Contacts per webhook request (the Make.com payload is a list of contact objects)
+BULK_WEBHOOK_BATCH_SIZE = int(os.environ.get('BULK_WEBHOOK_BATCH_SIZE', 25))
+# Finished jobs kept for status requests; running jobs are always kept
+BULK_JOBS_KEEP_FINISHED = int(os.environ.get('BULK_JOBS_KEEP_FINISHED', 50))
+
+# Accepted spellings of each column, after lower-casing and replacing spaces/dashes with underscores
+COLUMN_ALIASES = {
+    'patient_name': ['patient_name', 'patient', 'name', 'patient_identifier'],
+    'phone': ['phone', 'phone_number', 'mobile'],
+    'email': ['email', 'email_address'],
+    'contact': ['contact', 'contact_method'],
+    'medication': ['medication', 'medication_name', 'drug'],
+    'dosage': ['dosage', 'dose'],
+    'frequency': ['frequency'],
+    'duration': ['duration'],
+    'instructions': ['instructions', 'special_instructions'],
+    'start_date': ['start_date', 'start'],
+    'check_in_days': ['check_in_days', 'check_in', 'check_in_days_after'],
+}
+REQUIRED_COLUMNS = ['patient_name', 'phone', 'medication', 'dosage', 'frequency']
+
+
+def read_prescription_file(filename, data):
+    """
+    Reads an uploaded CSV or XLSX of prescriptions (one medication per row) into a frame
+    of text columns named as in COLUMN_ALIASES; raises ValueError with a user-facing message.
+    """
+    extension = os.path.splitext(filename or '')[1].lower()
+    try:
+        if extension == '.csv':
+            frame = pd.read_csv(io.BytesIO(data), dtype=str, keep_default_na=False, skipinitialspace=True)
+        elif extension in ('.xlsx', '.xlsm'):
+            frame = pd.read_excel(io.BytesIO(data), dtype=str).fillna('')
+        else:
+            raise ValueError("Upload a .csv or .xlsx file.")
+    except ImportError:
+        raise ValueError("Reading .xlsx files needs the openpyxl package; upload a .csv instead.")
+    except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as e:
+        raise ValueError(f"Could not read {filename}: {e}")
+
+    headers = {re.sub(r'[\s\-]+', '_', str(column).strip().lower()): column for column in frame.columns}
+    columns = {}
+    for name, aliases in COLUMN_ALIASES.items():
+        source = next((headers[alias] for alias in aliases if alias in headers), None)
+        columns[name] = frame[source].astype(str).str.strip() if source is not None else ''
+    missing = [name for name in REQUIRED_COLUMNS if not isinstance(columns[name], pd.Series)]
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(missing)}.")
+    columns['phone'] = columns['phone'].map(phone_text)
+    if len(frame) > BULK_SCHEDULE_MAX_ROWS:
+        raise ValueError(f"{len(frame)} rows is more than the {BULK_SCHEDULE_MAX_ROWS} allowed per upload.")
+    prescriptions = pd.DataFrame(columns, index=frame.index)
+    # Rows as numbered in the spreadsheet (header is row 1)
+    prescriptions.index = prescriptions.index + 2
+    return prescriptions
+
+
+def phone_text(value):
+    """
+    A phone cell as text. Spreadsheets store numbers typed without quoting as numbers,
+    dropping the leading 0 of local numbers (08031234567 becomes 8031234567), so a
+    10-digit number not starting with 0 gets it back.
+    """
+    value = re.sub(r'\.0$', '', value)
+    if value.isdigit() and len(value) == 10 and not value.startswith('0'):
+        return '0' + value
+    return value
+
+
+def row_problems(row):
+    """What is wrong with one prescription row; empty if it can be scheduled."""
+    problems = []
+    if len(row['patient_name']) < 2:
+        problems.append('patient name is required')
+    if not row['phone']:
+        # Schedules address patients by phone number; the email column is only read to explain this
+        problems.append('phone is required (email-only patients cannot be bulk scheduled)' if row['email'] else 'phone is required')
+    if len(row['medication']) < 2:
+        problems.append('medication is required')
+    if not row['dosage']:
+        problems.append('dosage is required')
+    if not row['frequency']:
+        problems.append('frequency is required')
+    if row['contact'] and row['contact'].lower() not in CONTACT_METHODS:
+        problems.append(f"unknown contact method '{row['contact']}'")
+    elif row['contact'].lower() == 'email':
+        problems.append('email reminders cannot be bulk scheduled; use WhatsApp, SMS or Call')
+    if row['start_date']:
+        try:
+            datetime.strptime(row['start_date'], '%Y-%m-%d')
+        except ValueError:
+            problems.append('start_date must be YYYY-MM-DD')
+    if row['check_in_days'] and not row['check_in_days'].isdigit():
+        problems.append('check_in_days must be a whole number')
+    return problems
+
+
+def group_prescriptions(prescriptions):
+    """
+    Groups rows into one schedule per patient (same name and phone number), in file
+    order. Each group carries its rows and the problems found in any of them.
+    """
+    groups = {}
+    for row_number, row in prescriptions.iterrows():
+        key = (row['patient_name'].casefold(), re.sub(r'\D', '', row['phone']))
+        group = groups.setdefault(key, {'patient': row['patient_name'], 'contact_value': row['phone'],
+                                        'rows': [], 'records': [], 'problems': {}})
+        group['rows'].append(int(row_number))
+        group['records'].append(row.to_dict())
+        problems = row_problems(row)
+        if problems:
+            group['problems'][int(row_number)] = problems
+    return list(groups.values())
+
+
+def quick_setup_text(group):
+    """A patient's rows written as a Quick Setup message, for the local parser or, failing that, the model."""
+    records = group['records']
+    start_dates = {record['start_date'] for record in records}
+    lines = [f"{group['patient']} | {group['contact_value']}"]
+    for record in records:
+        fields = [record['dosage'], record['frequency']] + [record[key] for key in ('duration', 'instructions') if record[key]]
+        # Differing start dates are left for the model to place
+        if len(start_dates) > 1 and record['start_date']:
+            fields.append(f"start on {record['start_date']}")
+        lines.append(f"{record['medication']}: {', '.join(fields)}")
+    contact = next((record['contact'] for record in records if record['contact']), None)
+    if contact:
+        lines.append(f"Contact: {CONTACT_METHODS[contact.lower()]}")
+    check_in = next((record['check_in_days'] for record in records if record['check_in_days']), None)
+    if check_in:
+        lines.append(f"Check-in: {check_in} days")
+    return '\n'.join(lines)
+
+
+def common_start_date(group):
+    """The start date shared by all of a patient's rows, or None (today, or differing dates)."""
+    start_dates = {record['start_date'] for record in group['records']}
+    if len(start_dates) != 1:
+        return None
+    return start_dates.pop() or None
+
+
+class BulkScheduleJob:
+    """Progress of one bulk upload; every row ends up scheduled, invalid or failed."""
+
+    def __init__(self, job_id, phone_no, filename, rows, patients):
+        self.job_id = job_id
+        self.phone_no = phone_no
+        self.filename = filename
+        self.total_rows = rows
+        self.total_patients = patients
+        self.started_at = time.time()
+        self.finished_at = None
+        self.webhook_batches = 0
+        self._lock = Lock()
+        self._rows = {}
+
+    def mark(self, rows, status, message=None):
+        """Records the outcome of some rows and returns them as progress updates."""
+        updates = [{'row': row, 'status': status, 'message': message} for row in rows]
+        with self._lock:
+            for update in updates:
+                self._rows[update['row']] = update
+        return updates
+
+    def mark_remaining(self, rows, status, message=None):
+        """Like `mark`, for those of `rows` that have no outcome yet."""
+        with self._lock:
+            rows = [row for row in rows if row not in self._rows]
+        return self.mark(rows, status, message)
+
+    def counts(self):
+        with self._lock:
+            statuses = [update['status'] for update in self._rows.values()]
+        return {
+            'total': self.total_rows,
+            'done': len(statuses),
+            **{status: statuses.count(status) for status in ('scheduled', 'invalid', 'failed')},
+        }
+
+    def snapshot(self):
+        with self._lock:
+            problems = [update for update in self._rows.values() if update['status'] != 'scheduled']
+        return {
+            'job_id': self.job_id,
+            'filename': self.filename,
+            'patients': self.total_patients,
+            'finished': self.finished_at is not None,
+            'seconds': round((self.finished_at or time.time()) - self.started_at, 1),
+            'webhook_batches': self.webhook_batches,
+            'counts': self.counts(),
+            'problems': sorted(problems, key=lambda update: update['row']),
+        }
+
+
+class BulkJobRegistry:
+    """
+    Bulk upload jobs by id, so their status can be fetched after the upload page
+    reconnects. Running jobs are kept until they finish; of the finished ones only
+    the `keep_finished` most recently used are.
+    """
+
+    def __init__(self, keep_finished=BULK_JOBS_KEEP_FINISHED):
+        self._lock = Lock()
+        self._running = {}
+        self._finished = LRUCache(max_entries=keep_finished)
+
+    def add(self, job):
+        with self._lock:
+            self._running[job.job_id] = job
+
+    def finish(self, job):
+        with self._lock:
+            self._running.pop(job.job_id, None)
+            self._finished.set(job.job_id, job)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._running.get(job_id)
+        return job if job is not None else self._finished.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            running = len(self._running)
+        return {'running': running, 'finished': self._finished.stats()}
@@ -0,0 +1,160 @@
+import json
+import os
+from threading import Lock
+
+# --- Chat Context Configuration ---
+# Entries kept per chart series in tool results; the rest are folded into one "others" total
+CHAT_TOOL_TOP_N = int(os.environ.get('CHAT_TOOL_TOP_N', 5))
+# Approximate prompt tokens of conversation history sent with each question
+CHAT_HISTORY_TOKEN_BUDGET = int(os.environ.get('CHAT_HISTORY_TOKEN_BUDGET', 3000))
+# Messages of conversation history kept per session, however short they are
+CHAT_HISTORY_MAX_MESSAGES = int(os.environ.get('CHAT_HISTORY_MAX_MESSAGES', 40))
+# Questions from dropped turns listed in the history note, newest last
+CHAT_HISTORY_NOTE_QUESTIONS = 8
+
+# Rough size of English/JSON text in OpenAI tokens; good enough for budgeting without a tokenizer
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+HISTORY_NOTE_PREFIX = "Earlier in this conversation the user asked: "
+
+SERIES_KEYS = ['reminder_status', 'top_medications', 'dosage_distribution', 'reminders_by_time', 'upcoming_vs_completed']
+
+
+def compact_dashboard_result(dashboard_data, top_n=CHAT_TOOL_TOP_N):
+    """
+    The get_dashboard_data tool result as the model needs it: the KPI cards, the
+    top `top_n` entries of each chart series, a summary of the adherence trend and
+    the next check-ins, instead of every series point and check-in row.
+    """
+    if not dashboard_data:
+        return {'note': 'No reminders found for this pharmacy and filters.'}
+
+    compact = {'kpis': dashboard_data.get('kpi_cards', {})}
+    for key in SERIES_KEYS:
+        series = dashboard_data.get(key) or {}
+        pairs = sorted(zip(series.get('labels', []), series.get('data', [])), key=lambda pair: -pair[1])
+        top = {str(label): value for label, value in pairs[:top_n] if value}
+        rest = pairs[top_n:]
+        if rest:
+            top[f"{len(rest)} others"] = sum(value for _, value in rest)
+        compact[key] = top
+
+    trend = dashboard_data.get('adherence_trend') or {}
+    labels, rates = trend.get('labels', []), trend.get('data', [])
+    if rates:
+        compact['adherence_trend'] = {
+            'periods': len(rates),
+            'from': labels[0],
+            'to': labels[-1],
+            'average': round(sum(rates) / len(rates), 1),
+            'lowest': {labels[rates.index(min(rates))]: round(min(rates), 1)},
+            'highest': {labels[rates.index(max(rates))]: round(max(rates), 1)},
+            'latest': {label: round(rate, 1) for label, rate in zip(labels[-top_n:], rates[-top_n:])},
+        }
+
+    check_ins = dashboard_data.get('check_in_table') or []
+    if check_ins:
+        upcoming = sorted(check_ins, key=lambda row: str(row.get('check_in_date') or ''))
+        compact['check_ins'] = {
+            'rows': len(check_ins),
+            'patients': len({row.get('patient_identifier') for row in check_ins}),
+            'earliest': [
+                {'patient': row.get('patient_identifier'), 'medication': row.get('medication_name'),
+                 'date': row.get('check_in_date')}
+                for row in upcoming[:top_n]
+            ],
+        }
+    return compact
+
+
+def estimate_tokens(messages):
+    """Approximate prompt tokens for a list of chat messages."""
+    total = 0
+    for message in messages:
+        text = message.get('content') or ''
+        if message.get('tool_calls'):
+            text += json.dumps(message['tool_calls'], default=str)
+        total += len(text) // CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS
+    return total
+
+
+def _turns(messages):
+    # Each turn starts at a user message and carries its assistant, tool and system follow-ups,
+    # so an assistant tool call is never separated from its tool results
+    turns = []
+    for message in messages:
+        if message.get('role') == 'user' or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def window_history(history, budget=CHAT_HISTORY_TOKEN_BUDGET, max_messages=CHAT_HISTORY_MAX_MESSAGES):
+    """
+    Conversation history trimmed to about `budget` tokens and `max_messages` messages:
+    the leading system prompt, a note listing the questions of dropped turns, and the
+    most recent whole turns that fit. The latest turn is always kept.
+    """
+    messages = [message.model_dump() if hasattr(message, 'model_dump') else message for message in history]
+    head, noted = [], []
+    while messages and messages[0].get('role') == 'system':
+        message = messages.pop(0)
+        content = message.get('content') or ''
+        if content.startswith(HISTORY_NOTE_PREFIX):
+            try:
+                noted = list(json.loads(content[len(HISTORY_NOTE_PREFIX):]))
+            except (TypeError, ValueError):
+                noted = []
+        else:
+            head.append(message)
+
+    turns = _turns(messages)
+    remaining = budget - estimate_tokens(head)
+    # One message of room is left for the note
+    room = max_messages - len(head) - 1
+    first_kept = len(turns)
+    while first_kept > 0:
+        turn = turns[first_kept - 1]
+        cost = estimate_tokens(turn)
+        if first_kept < len(turns) and (cost > remaining or len(turn) > room):
+            break
+        first_kept -= 1
+        remaining -= cost
+        room -= len(turn)
+
+    # The note takes room too; give up further old turns until it fits (the latest turn always stays)
+    while True:
+        questions = noted + [str(message.get('content'))[:100] for turn in turns[:first_kept]
+                             for message in turn if message.get('role') == 'user']
+        note = [{'role': 'system', 'content': HISTORY_NOTE_PREFIX + json.dumps(questions[-CHAT_HISTORY_NOTE_QUESTIONS:])}] if questions else []
+        windowed = head + note + [message for turn in turns[first_kept:] for message in turn]
+        if estimate_tokens(windowed) <= budget or first_kept >= len(turns) - 1:
+            return windowed
+        first_kept += 1
+
+
+class TokenUsage:
+    """Running token counts for chat completions, logged per request and reported in /api/metrics."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._totals = {'requests': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'estimated_prompt_tokens': 0}
+
+    def record(self, label, messages, usage):
+        estimated = estimate_tokens(messages)
+        prompt = getattr(usage, 'prompt_tokens', None)
+        completion = getattr(usage, 'completion_tokens', None)
+        print(f"[LLM TOKENS] {label} | messages={len(messages)} estimated_prompt={estimated} "
+              f"prompt={prompt} completion={completion}")
+        with self._lock:
+            self._totals['requests'] += 1
+            self._totals['estimated_prompt_tokens'] += estimated
+            self._totals['prompt_tokens'] += prompt or 0
+            self._totals['completion_tokens'] += completion or 0
+
+    def stats(self):
+        with self._lock:
+            totals = dict(self._totals)
+        requests = totals['requests']
+        totals['avg_prompt_tokens'] = round(totals['prompt_tokens'] / requests, 1) if requests else None
+        return totals
@@ -0,0 +1,117 @@
+import time
+from threading import Event, Lock
+
+
+def stream_completion(stream, cancelled, on_token, on_usage=None):
+    """
+    Consumes a streamed chat completion, passing each content delta to `on_token`
+    and, if the stream was requested with usage included, its token counts to `on_usage`.
+
+    Returns the assembled assistant message as a dict (tool calls included, their
+    argument fragments joined), or None if `cancelled` was set before the stream
+    ended. The stream is always closed, so a cancelled reply stops generating.
+    """
+    content = []
+    tool_calls = {}
+    try:
+        for chunk in stream:
+            if cancelled.is_set():
+                return None
+            if getattr(chunk, 'usage', None) is not None and on_usage is not None:
+                on_usage(chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content.append(delta.content)
+                on_token(delta.content)
+            # Tool calls arrive as fragments keyed by index: id and name first, then pieces of the arguments
+            for fragment in delta.tool_calls or []:
+                call = tool_calls.setdefault(fragment.index, {'id': None, 'type': 'function',
+                                                              'function': {'name': '', 'arguments': ''}})
+                if fragment.id:
+                    call['id'] = fragment.id
+                if fragment.function is not None:
+                    call['function']['name'] += fragment.function.name or ''
+                    call['function']['arguments'] += fragment.function.arguments or ''
+    finally:
+        stream.close()
+
+    message = {'role': 'assistant', 'content': ''.join(content) or None}
+    if tool_calls:
+        message['tool_calls'] = [tool_calls[index] for index in sorted(tool_calls)]
+    return message
+
+
+class ChatStreams:
+    """
+    In-flight streamed chat replies, at most one per Socket.IO session.
+
+    Starting a reply cancels the session's previous one, and a session's reply is
+    cancelled when the user asks or disconnects (e.g. navigates away). Cancellation
+    is cooperative: the streaming task checks its event between chunks, so a
+    cancelled task may still be finishing when the next one starts; such tasks
+    merge into the conversation under the session's `history_lock`.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._active = {}
+        # sid -> [history lock, tasks started and not yet finished]
+        self._history_locks = {}
+        self._started = 0
+        self._outcomes = {'completed': 0, 'cancelled': 0, 'failed': 0}
+        self._first_token_ms = []
+
+    def start(self, sid, request_id):
+        """Registers a new reply for `sid` and returns the Event that cancels it."""
+        cancelled = Event()
+        with self._lock:
+            previous = self._active.get(sid)
+            self._active[sid] = (request_id, cancelled, time.perf_counter())
+            self._started += 1
+            self._history_locks.setdefault(sid, [Lock(), 0])[1] += 1
+        if previous is not None:
+            previous[1].set()
+        return cancelled
+
+    def cancel(self, sid, request_id=None):
+        """Cancels the session's reply (only if it is `request_id`, when given); returns True if one was cancelled."""
+        with self._lock:
+            active = self._active.get(sid)
+            if active is None or (request_id is not None and active[0] != request_id):
+                return False
+        active[1].set()
+        return True
+
+    def history_lock(self, sid):
+        """The lock a task of `sid` (between `start` and `finish`) holds while merging into the conversation history."""
+        with self._lock:
+            return self._history_locks[sid][0]
+
+    def first_token(self, sid, request_id):
+        with self._lock:
+            active = self._active.get(sid)
+            if active is not None and active[0] == request_id:
+                self._first_token_ms = (self._first_token_ms + [(time.perf_counter() - active[2]) * 1000])[-100:]
+
+    def finish(self, sid, request_id, outcome):
+        with self._lock:
+            self._outcomes[outcome] += 1
+            active = self._active.get(sid)
+            if active is not None and active[0] == request_id:
+                del self._active[sid]
+            history_lock = self._history_locks[sid]
+            history_lock[1] -= 1
+            if not history_lock[1]:
+                del self._history_locks[sid]
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._first_token_ms)
+            return {
+                'active': len(self._active),
+                'started': self._started,
+                **self._outcomes,
+                'median_first_token_ms': round(latencies[len(latencies) // 2], 1) if latencies else None,
+            }
@@ -0,0 +1,219 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from threading import BoundedSemaphore, Lock
+
+from dashboard_data import build_dashboard_data
+from drilldown import get_drilldown
+from reminder_store import ReminderStore, normalize_reminders, partition_by_pharmacy
+from snapshot_file import SnapshotFile
+
+# --- Compute Pool Configuration ---
+# Worker processes for CPU-heavy aggregation; 0 keeps all work inline in the web process
+COMPUTE_POOL_WORKERS = int(os.environ.get('COMPUTE_POOL_WORKERS', 1))
+# Tasks allowed in the pool (running or queued) before new ones are turned away
+COMPUTE_POOL_MAX_QUEUE = int(os.environ.get('COMPUTE_POOL_MAX_QUEUE', 16))
+# Tasks one pharmacy may have in the pool at once, so a heavy tenant cannot occupy every worker
+COMPUTE_POOL_PER_TENANT = int(os.environ.get('COMPUTE_POOL_PER_TENANT', 2))
+# Seconds a caller waits for its tenant slot and then for its result
+COMPUTE_POOL_TIMEOUT = float(os.environ.get('COMPUTE_POOL_TIMEOUT', 30))
+
+
+class PoolBusy(Exception):
+    """The pool's queue is full, or a tenant waited too long for one of its slots."""
+
+
+# --- Worker Process Side ---
+# Each worker maps the persisted snapshot generation a task names and keeps it (and its
+# per-pharmacy indexes and rollups) until a task asks for a newer one.
+_worker = {'snapshot_file': None, 'store': None}
+
+
+def _init_worker(snapshot_dir, source):
+    _worker['snapshot_file'] = SnapshotFile(snapshot_dir, source=source)
+
+
+def _worker_store(generation):
+    store = _worker['store']
+    if store is None or store.generation != generation:
+        loaded = _worker['snapshot_file'].load(ignore_age=True, generation=generation)
+        if loaded is None:
+            raise LookupError(f"Snapshot generation {generation} is not available")
+        frame, offsets, manifest = loaded
+        fresh = ReminderStore(frame, version=manifest['version'], offsets=offsets, generation=generation)
+        if store is not None:
+            fresh.inherit_rollups(store)
+        store = _worker['store'] = fresh
+    return store
+
+
+def dashboard_task(generation, phone_no, filters):
+    return build_dashboard_data(phone_no, _worker_store(generation), filters)
+
+
+def drilldown_task(generation, phone_no, metric):
+    return get_drilldown(_worker_store(generation).pharmacy_frame(phone_no), metric)
+
+
+def normalize_task(raw_df, version):
+    """Normalizes a raw sheet snapshot and publishes it as a new generation; returns its manifest."""
+    frame, offsets = partition_by_pharmacy(normalize_reminders(raw_df))
+    return _worker['snapshot_file'].write(frame, offsets, version)
+
+
+class ComputePool:
+    """
+    Bounded process pool for CPU-bound pandas work.
+
+    Under gevent a long aggregation on the web process stalls every other
+    socket and request, so heavy work runs in worker processes instead and the
+    caller's greenlet simply waits on the result. Workers read the snapshot
+    from the memory-mapped files in `snapshot_dir` rather than receiving rows
+    with every task. At most `max_queue` tasks are in the pool at once (more
+    raise PoolBusy) and each tenant may hold at most `per_tenant` of them.
+
+    Workers are started with the 'spawn' method, so they never inherit gevent's
+    monkey-patched modules; a script that creates the pool therefore needs an
+    `if __name__ == '__main__':` guard. compute_pool_check.py verifies results
+    and event loop responsiveness under `monkey.patch_all()` as app.py runs it.
+    """
+
+    def __init__(self, snapshot_dir, source, workers=COMPUTE_POOL_WORKERS, max_queue=COMPUTE_POOL_MAX_QUEUE,
+                 per_tenant=COMPUTE_POOL_PER_TENANT, timeout=COMPUTE_POOL_TIMEOUT):
+        self.snapshot_dir = snapshot_dir
+        self.source = source
+        self.workers = workers
+        self.max_queue = max(max_queue, workers)
+        self.per_tenant = per_tenant
+        self.timeout = timeout
+        self._executor = None
+        self._lock = Lock()
+        self._tenant_slots = {}
+        # Callers holding or waiting on each tenant's semaphore, so idle tenants are dropped
+        self._tenant_users = {}
+        self._tenant_in_flight = {}
+        self._in_flight = 0
+        self._waiting = 0
+        self._max_depth = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._busy_ms = 0.0
+
+    @property
+    def enabled(self):
+        return self.workers > 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # 'spawn' keeps gevent's monkey-patched state out of the workers
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker, initargs=(self.snapshot_dir, self.source)
+                )
+            return self._executor
+
+    def run(self, tenant, fn, *args):
+        """
+        Runs `fn(*args)` in a worker and returns its result; only the calling greenlet waits.
+
+        A task still running after `timeout` raises PoolBusy; it keeps its tenant slot until
+        the worker finishes it, so a slow tenant cannot stack abandoned tasks in the pool.
+        """
+        with self._lock:
+            if self._in_flight + self._waiting >= self.max_queue:
+                self._rejected += 1
+                raise PoolBusy(f"Compute pool queue is full ({self.max_queue})")
+            slots = self._tenant_slots.setdefault(tenant, BoundedSemaphore(self.per_tenant))
+            self._tenant_users[tenant] = self._tenant_users.get(tenant, 0) + 1
+            self._waiting += 1
+        acquired = slots.acquire(timeout=self.timeout)
+        with self._lock:
+            self._waiting -= 1
+            if not acquired:
+                self._rejected += 1
+                self._forget_tenant(tenant)
+                raise PoolBusy(f"Tenant {tenant} is at its compute limit ({self.per_tenant})")
+            self._in_flight += 1
+            self._tenant_in_flight[tenant] = self._tenant_in_flight.get(tenant, 0) + 1
+            self._max_depth = max(self._max_depth, self._in_flight)
+
+        start = time.perf_counter()
+        future = None
+        try:
+            future = self._get_executor().submit(fn, *args)
+            result = future.result(timeout=self.timeout)
+        except FutureTimeout:
+            if future.cancel():
+                self._release(tenant, slots, 'failed')
+            else:
+                # The worker is still on it; hold the slot until it is done
+                future.add_done_callback(lambda _: self._release(tenant, slots, None))
+                with self._lock:
+                    self._timed_out += 1
+            raise PoolBusy(f"Compute task {fn.__name__} for tenant {tenant} took longer than {self.timeout}s")
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory); start a fresh pool for the next task
+            with self._lock:
+                self._executor = None
+            self._release(tenant, slots, 'failed')
+            raise
+        except BaseException:
+            self._release(tenant, slots, 'failed')
+            raise
+        self._release(tenant, slots, 'completed', (time.perf_counter() - start) * 1000)
+        return result
+
+    def _release(self, tenant, slots, outcome, busy_ms=0.0):
+        slots.release()
+        with self._lock:
+            self._in_flight -= 1
+            self._tenant_in_flight[tenant] -= 1
+            if not self._tenant_in_flight[tenant]:
+                del self._tenant_in_flight[tenant]
+            self._forget_tenant(tenant)
+            if outcome == 'completed':
+                self._completed += 1
+                self._busy_ms += busy_ms
+            elif outcome == 'failed':
+                self._failed += 1
+
+    def _forget_tenant(self, tenant):
+        """Drops a tenant's semaphore once nobody holds or waits on it; call with the lock held."""
+        self._tenant_users[tenant] -= 1
+        if not self._tenant_users[tenant]:
+            del self._tenant_users[tenant]
+            del self._tenant_slots[tenant]
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'workers': self.workers,
+                'started': self._executor is not None,
+                'in_flight': self._in_flight,
+                # Tasks submitted beyond the number of workers wait in the executor's queue
+                'queue_depth': max(0, self._in_flight - self.workers),
+                'waiting_on_tenant_limit': self._waiting,
+                'max_in_flight_seen': self._max_depth,
+                'max_queue': self.max_queue,
+                'per_tenant_limit': self.per_tenant,
+                'tenants_in_flight': dict(self._tenant_in_flight),
+                'completed': self._completed,
+                'failed': self._failed,
+                'rejected': self._rejected,
+                'timed_out': self._timed_out,
+                'tenants_tracked': len(self._tenant_slots),
+                'avg_task_ms': round(self._busy_ms / self._completed, 1) if self._completed else None,
+            }
@@ -0,0 +1,79 @@
+"""
+Checks that the compute pool works under gevent the way app.py runs it.
+
+Patches like app.py does, persists a synthetic snapshot, then runs dashboard
+and drill-down tasks from concurrent greenlets through a spawn-context
+ComputePool while a ticker greenlet measures how long the event loop is
+blocked. Run e.g.:
+
+    python compute_pool_check.py              # 50k rows, 2 workers, 10 concurrent tasks
+    python compute_pool_check.py 200000 4 20
+
+Exits non-zero if a pooled result differs from the in-process one, or if the
+event loop stalls for longer than MAX_LOOP_GAP_MS while the pool is busy.
+"""
+from gevent import monkey
+monkey.patch_all()
+
+import sys
+import tempfile
+import time
+
+import gevent
+
+from benchmark import synthetic_reminders
+from compute_pool import ComputePool, dashboard_task, drilldown_task
+from dashboard_data import build_dashboard_data
+from drilldown import get_drilldown
+from reminder_store import ReminderStore
+from snapshot_file import SnapshotFile
+
+MAX_LOOP_GAP_MS = 100
+SOURCE = 'compute-pool-check'
+
+
+def check(rows=50_000, workers=2, tasks=10):
+    store = ReminderStore.build(synthetic_reminders(rows, 2, patients_per_pharmacy=500))
+    snapshot_file = SnapshotFile(tempfile.mkdtemp(prefix='compute-pool-check-'), source=SOURCE)
+    generation = snapshot_file.write(store.frame, store.offsets, store.version)['generation']
+    phone_no = store.pharmacy_ids[0]
+    pool = ComputePool(snapshot_file.directory, SOURCE, workers=workers, max_queue=tasks, per_tenant=tasks)
+
+    expected_dashboard = build_dashboard_data(phone_no, store, None)
+    expected_details = get_drilldown(store.pharmacy_frame(phone_no), 'reminders_sent').to_dict('records')
+    # The first task starts the workers; keep that out of the stall measurement
+    pool.run(phone_no, dashboard_task, generation, phone_no, None)
+
+    gaps = []
+    running = [True]
+
+    def ticker():
+        last = time.perf_counter()
+        while running[0]:
+            gevent.sleep(0.005)
+            now = time.perf_counter()
+            gaps.append((now - last) * 1000)
+            last = now
+
+    def task(i):
+        if i % 2:
+            return pool.run(phone_no, drilldown_task, generation, phone_no, 'reminders_sent').to_dict('records') == expected_details
+        return pool.run(phone_no, dashboard_task, generation, phone_no, None) == expected_dashboard
+
+    tick = gevent.spawn(ticker)
+    start = time.perf_counter()
+    results = [greenlet.get() for greenlet in [gevent.spawn(task, i) for i in range(tasks)]]
+    elapsed = (time.perf_counter() - start) * 1000
+    running[0] = False
+    tick.join()
+
+    max_gap = max(gaps) if gaps else float('inf')
+    print(f"{tasks} tasks on {workers} workers in {elapsed:.0f}ms; {sum(results)} match in-process results; "
+          f"longest event loop gap {max_gap:.1f}ms over {len(gaps)} ticks")
+    print(pool.stats())
+    return all(results) and max_gap <= MAX_LOOP_GAP_MS
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    sys.exit(0 if check(*args) else 1)
@@ -0,0 +1,210 @@
+"""
+Dashboard aggregation over a normalized ReminderStore.
+
+Kept free of Flask, Socket.IO and Google Sheets imports so the compute pool's
+worker processes can run it against a memory-mapped snapshot.
+"""
+import json
+from datetime import timedelta
+
+import pandas as pd
+
+from adherence import filter_by_adherence, overall_adherence, utc_now
+from reminder_store import value_counts
+from rollups import ROLLUP_DIMENSIONS, TREND_GRANULARITIES, AdherenceRollup, adherence_trend
+
+
+def apply_filters(pharmacy_index, filters):
+    """Apply filters to a pharmacy's rows by combining its precomputed bitmaps, then take the matches once."""
+    mask = None
+
+    def narrow(selected):
+        nonlocal mask
+        mask = selected if mask is None else mask & selected
+
+    # Date Range Filter
+    if filters.get('dateRange') and filters['dateRange'] != 'all':
+        try:
+            days = int(filters['dateRange'])
+            narrow(pharmacy_index.since(pd.Timestamp.now(tz='UTC') - timedelta(days=days)))
+        except (TypeError, ValueError) as e:
+            print(f"[FILTER ERROR] Invalid dateRange {filters['dateRange']!r}: {e}")
+    
+    # Status Filter
+    if filters.get('status'):
+        status_list = filters['status']
+        if isinstance(status_list, str):
+            status_list = [status_list]
+        if status_list and 'all' not in status_list:
+            narrow(pharmacy_index.any_of('status', [s.lower() for s in status_list]))
+    
+    # Medication Filter
+    if filters.get('medication') and filters['medication'] != 'all':
+        narrow(pharmacy_index.bitmap('medication_name', filters['medication']))
+    
+    # Patient Search Filter
+    if filters.get('patientSearch') and filters['patientSearch'].strip():
+        search_term = filters['patientSearch'].lower().strip()
+        narrow(pharmacy_index.patients.row_mask(search_term))
+    
+    # Check-in Filter
+    if filters.get('checkin') and filters['checkin'] != 'all':
+        narrow(pharmacy_index.bitmap('should_check_in', filters['checkin']))
+    
+    # Time of Day Filter
+    if filters.get('timeOfDay') and filters['timeOfDay'] != 'all':
+        narrow(pharmacy_index.bitmap('time_category', filters['timeOfDay'].capitalize()))
+    
+    # Frequency Filter
+    if filters.get('frequency') and filters['frequency'] != 'all':
+        narrow(pharmacy_index.bitmap('frequency', filters['frequency']))
+    
+    return pharmacy_index.take(mask)
+
+
+def trend_rollup_slice(filters):
+    """
+    Which rollup slice answers the adherence trend for `filters`, as (covered, column, value):
+    (True, None, None) for the whole pharmacy, (True, column, value) for a single filter the
+    rollups are split by, and (False, None, None) when the filters narrow rows in a way the
+    rollups don't cover and the trend must be counted from rows.
+    """
+    narrowing = json.loads(canonical_filters(filters))
+    narrowing.pop('trendGranularity', None)
+    if not narrowing:
+        return True, None, None
+    if len(narrowing) == 1:
+        name, value = next(iter(narrowing.items()))
+        if name in ROLLUP_DIMENSIONS:
+            return True, ROLLUP_DIMENSIONS[name], value.capitalize() if name == 'timeOfDay' else value
+    return False, None, None
+
+
+def canonical_filters(filters):
+    """Stable cache key for a filter dict: drops no-op values and orders keys and list items."""
+    canonical = {}
+    for name, value in (filters or {}).items():
+        if isinstance(value, list):
+            if not value or 'all' in value:
+                continue
+            value = sorted(str(v).lower() for v in value) if name == 'status' else sorted(map(str, value))
+        elif value is None or str(value).strip() in ('', 'all'):
+            continue
+        elif name == 'patientSearch':
+            value = str(value).strip().lower()
+        else:
+            value = str(value)
+        canonical[name] = value
+    return json.dumps(canonical, sort_keys=True)
+
+
+def build_dashboard_data(phone_no, store, filters=None):
+    """Processes the normalized reminder store to generate all data needed for the dashboard."""
+    pharmacy_index = store.pharmacy_index(phone_no)
+    pharmacy_df = pharmacy_index.frame
+
+    if pharmacy_df.empty:
+        return {}
+
+    # Apply filters if provided
+    if filters:
+        pharmacy_df = apply_filters(pharmacy_index, filters)
+        
+        if pharmacy_df.empty:
+            return get_empty_dashboard_data()
+    
+    # --- Adherence Calculation ---
+    now = utc_now()
+    completed_reminders, missed_reminders, adherence_rate = overall_adherence(pharmacy_df, now)
+    total_relevant_reminders = completed_reminders + missed_reminders
+
+    # Apply adherence level filter if needed
+    if filters and filters.get('adherence') and filters['adherence'] != 'all':
+        # Keeps only patients whose own adherence falls in the requested bucket
+        pharmacy_df = filter_by_adherence(pharmacy_df, filters['adherence'], now)
+        
+        if pharmacy_df.empty:
+            return get_empty_dashboard_data()
+
+    # --- KPI Cards ---
+    total_patients = pharmacy_df['patient_identifier'].nunique()
+    status_counts = value_counts(pharmacy_df['status'])
+    pending_reminders = status_counts.get('pending', 0) + status_counts.get('upcoming', 0)
+
+    # --- Adherence Trend (Line Chart) ---
+    # Grouped by the reminder's due date; read from the pharmacy's daily rollups where the filters allow
+    granularity = (filters or {}).get('trendGranularity')
+    if granularity not in TREND_GRANULARITIES:
+        granularity = 'day'
+    covered, column, value = trend_rollup_slice(filters)
+    if covered and (column, value) in store.adherence_rollup(phone_no):
+        daily_counts = store.adherence_rollup(phone_no).counts(column, value, now=now)
+    else:
+        daily_counts = AdherenceRollup(pharmacy_df, dimensions=()).counts(now=now)
+
+    # --- Top Medications / Dosages ---
+    top_meds = value_counts(pharmacy_df['medication_name']).nlargest(5)
+    dosage_dist = value_counts(pharmacy_df['dosage']).nlargest(5)
+
+    # --- Reminders by Time of Day ---
+    reminders_by_time = pharmacy_df['time_category'].value_counts()
+    
+    # --- Upcoming vs Completed ---
+    upcoming_vs_completed = status_counts
+
+    # --- Patients Needing Check-In (Table) ---
+    check_in_patients = pharmacy_df[pharmacy_df['should_check_in'] == 'yes']
+    if not check_in_patients.empty:
+        # check_in_date is parsed in the store; drop rows where date conversion failed and format it
+        check_in_patients = check_in_patients.dropna(subset=['check_in_date']).copy()
+        check_in_patients['check_in_date'] = check_in_patients['check_in_date'].dt.strftime('%Y-%m-%d')
+        
+    check_in_table = check_in_patients[['patient_identifier', 'phone_number', 'medication_name', 'status', 'check_in_date', 'check_in_message']].to_dict('records')
+
+    # --- Final Data Structure ---
+    dashboard_data = {
+        "kpi_cards": {
+            "total_patients": int(total_patients),
+            "adherence_rate": f"{adherence_rate:.1f}",
+            "reminders_sent": int(total_relevant_reminders),
+            "pending_reminders": int(pending_reminders)
+        },
+        "adherence_trend": adherence_trend(daily_counts, granularity),
+        "reminder_status": {
+            "labels": list(status_counts.index),
+            "data": [int(v) for v in status_counts.values]
+        },
+        "top_medications": {
+            "labels": list(top_meds.index),
+            "data": [int(v) for v in top_meds.values]
+        },
+        "dosage_distribution": {
+            "labels": list(dosage_dist.index),
+            "data": [int(v) for v in dosage_dist.values]
+        },
+        "reminders_by_time": {
+            "labels": ['Morning', 'Afternoon', 'Evening', 'Unknown'],
+            "data": [int(reminders_by_time.get(c, 0)) for c in ['Morning', 'Afternoon', 'Evening', 'Unknown']]
+        },
+        "upcoming_vs_completed": {
+            "labels": ['Upcoming', 'Completed'],
+            "data": [int(upcoming_vs_completed.get('pending', 0) + upcoming_vs_completed.get('upcoming', 0)), 
+                     int(upcoming_vs_completed.get('completed', 0))]
+        },
+        "check_in_table": check_in_table
+    }
+    return dashboard_data
+
+
+def get_empty_dashboard_data():
+    """Returns empty dashboard structure when filters result in no data."""
+    return {
+        "kpi_cards": { "total_patients": 0, "adherence_rate": "0.0", "reminders_sent": 0, "pending_reminders": 0 },
+        "adherence_trend": {"labels": [], "data": []},
+        "reminder_status": {"labels": [], "data": []},
+        "top_medications": {"labels": [], "data": []},
+        "dosage_distribution": {"labels": [], "data": []},
+        "reminders_by_time": {"labels": ['Morning', 'Afternoon', 'Evening', 'Unknown'], "data": [0, 0, 0, 0]},
+        "upcoming_vs_completed": {"labels": ['Upcoming', 'Completed'], "data": [0, 0]},
+        "check_in_table": []
+    }
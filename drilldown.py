@@ -0,0 +1,171 @@
+import numpy as np
+import pandas as pd
+
+from adherence import ADHERENCE_LABELS, adherence_table, utc_now
+
+PENDING_STATUSES = ['pending', 'upcoming']
+
+
+def _format_times(series, fmt):
+    """strftime over a UTC datetime column with 'N/A' for missing values."""
+    if fmt == '%Y-%m-%d %H:%M':
+        # numpy's ISO formatter is several times faster than strftime for this layout
+        values = series.dt.tz_localize(None).to_numpy()
+        formatted = np.char.replace(np.datetime_as_string(values, unit='m'), 'T', ' ')
+        formatted = np.where(np.isnat(values), 'N/A', formatted)
+        return pd.Series(formatted.astype(object), index=series.index)
+    return series.dt.strftime(fmt).fillna('N/A')
+
+
+def _days_between(later, earlier):
+    """Whole days from `earlier` to `later`, floored at zero, with missing times counted as zero."""
+    days = (later - earlier).dt.days
+    return days.clip(lower=0).fillna(0).astype(int)
+
+
+def _per_patient(df):
+    """Grouped first/last rows and sizes per patient, in order of first appearance."""
+    grouped = df.groupby('patient_identifier', sort=False, observed=True)
+    return grouped.nth(0).set_index('patient_identifier'), grouped.nth(-1).set_index('patient_identifier'), grouped.size()
+
+
+def _completion_rate(df):
+    """Completed share of all reminders per patient (not just the due ones), in percent."""
+    completed = (df['status'] == 'completed').groupby(df['patient_identifier'], sort=False, observed=True).sum()
+    total = df.groupby('patient_identifier', sort=False, observed=True).size()
+    return (completed / total * 100).round(1)
+
+
+def pending_reminders(df, now):
+    pending = df[df['status'].isin(PENDING_STATUSES)]
+    return pd.DataFrame({
+        'Patient Name': pending['patient_identifier'],
+        'Phone Number': pending['phone_number'],
+        'Medication': pending['medication_name'],
+        'Next Reminder': _format_times(pending['next_reminder_time'], '%Y-%m-%d %I:%M %p')
+    })
+
+
+def total_patients(df, now):
+    first, _, size = _per_patient(df)
+    return pd.DataFrame({
+        'Patient Name': size.index,
+        'Phone Number': first['phone_number'].reindex(size.index).to_numpy(),
+        'Primary Medication': first['medication_name'].reindex(size.index).to_numpy(),
+        'Total Reminders': size.to_numpy()
+    })
+
+
+def adherence_rate(df, now):
+    table = adherence_table(df, now=now)
+    return pd.DataFrame({
+        'Patient Name': table.index,
+        'Completed': table['completed'].to_numpy(),
+        'Missed': table['missed'].to_numpy(),
+        'Adherence Rate (%)': table['rate'].round(1).to_numpy(),
+        'Category': [ADHERENCE_LABELS[level] for level in table['level']]
+    }).sort_values('Adherence Rate (%)', ascending=False)
+
+
+def reminders_sent(df, now):
+    first, last, size = _per_patient(df)
+    last_reminder = df.groupby('patient_identifier', sort=False, observed=True)['time_stamp'].max()
+    return pd.DataFrame({
+        'Patient Name': size.index,
+        'Total Reminders': size.to_numpy(),
+        'Latest Status': last['status'].reindex(size.index).to_numpy(),
+        'Frequency': first['frequency'].reindex(size.index).to_numpy(),
+        'Last Reminder': _format_times(last_reminder, '%Y-%m-%d %H:%M').reindex(size.index).to_numpy()
+    }).sort_values('Total Reminders', ascending=False)
+
+
+def medication_details(df, now, medication_name):
+    med_df = df[df['medication_name'] == medication_name]
+    first, last, size = _per_patient(med_df)
+    return pd.DataFrame({
+        'Patient Name': size.index,
+        'Dosage': first['dosage'].reindex(size.index).to_numpy(),
+        'Frequency': first['frequency'].reindex(size.index).to_numpy(),
+        'Adherence Rate (%)': _completion_rate(med_df).reindex(size.index).to_numpy(),
+        'Current Status': last['status'].reindex(size.index).to_numpy()
+    }).sort_values('Adherence Rate (%)', ascending=False)
+
+
+def status_details(df, now, status_name):
+    status_df = df[df['status'] == status_name]
+    return pd.DataFrame({
+        'Patient Name': status_df['patient_identifier'],
+        'Medication': status_df['medication_name'],
+        'Due Time': _format_times(status_df['next_reminder_time'], '%Y-%m-%d %H:%M'),
+        'Days in Status': _days_between(now, status_df['next_reminder_time']),
+        'Phone Number': status_df['phone_number']
+    }).sort_values('Days in Status', ascending=False)
+
+
+def time_details(df, now, time_slot):
+    time_df = df[df['time_category'] == time_slot]
+    first, _, size = _per_patient(time_df)
+    return pd.DataFrame({
+        'Patient Name': size.index,
+        'Medication': first['medication_name'].reindex(size.index).to_numpy(),
+        'Exact Time': first['reminderTime'].reindex(size.index).to_numpy(),
+        'Adherence Rate (%)': _completion_rate(time_df).reindex(size.index).to_numpy(),
+        'Total Reminders': size.to_numpy()
+    }).sort_values('Adherence Rate (%)', ascending=False)
+
+
+def completion_details(df, now, completion_type):
+    completion_type = completion_type.lower()
+    if completion_type == 'upcoming':
+        upcoming = df[df['status'].isin(PENDING_STATUSES)]
+        return pd.DataFrame({
+            'Patient Name': upcoming['patient_identifier'],
+            'Medication': upcoming['medication_name'],
+            'Due Time': _format_times(upcoming['next_reminder_time'], '%Y-%m-%d %H:%M'),
+            'Days Until Due': _days_between(upcoming['next_reminder_time'], now),
+            'Frequency': upcoming['frequency']
+        }).sort_values('Days Until Due')
+    if completion_type == 'completed':
+        completed = df[df['status'] == 'completed']
+        return pd.DataFrame({
+            'Patient Name': completed['patient_identifier'],
+            'Medication': completed['medication_name'],
+            'Completion Time': _format_times(completed['time_stamp'], '%Y-%m-%d %H:%M'),
+            'Frequency': completed['frequency'],
+            'Phone Number': completed['phone_number']
+        }).sort_values('Completion Time', ascending=False)
+    return pd.DataFrame()
+
+
+METRICS = {
+    'pending_reminders': pending_reminders,
+    'total_patients': total_patients,
+    'adherence_rate': adherence_rate,
+    'reminders_sent': reminders_sent,
+}
+
+# Metrics whose name carries a parameter, e.g. 'medication_Amoxicillin' or 'status_pending'
+PREFIXED_METRICS = {
+    'medication_': medication_details,
+    'status_': lambda df, now, name: status_details(df, now, name.lower()),
+    'time_': time_details,
+    'completion_': completion_details,
+}
+
+
+def get_drilldown(pharmacy_df, metric, now=None):
+    """
+    Returns the details table for a dashboard metric as a DataFrame.
+
+    Every metric is a grouped aggregation or a vectorized column expression over
+    the pharmacy's normalized rows; unknown metrics return an empty frame.
+    """
+    if not metric:
+        return pd.DataFrame()
+    now = now if now is not None else utc_now()
+    if metric in METRICS:
+        return METRICS[metric](pharmacy_df, now)
+    for prefix, handler in PREFIXED_METRICS.items():
+        if metric.startswith(prefix):
+            return handler(pharmacy_df, now, metric[len(prefix):])
+    return pd.DataFrame()
@@ -0,0 +1,145 @@
+"""
+Local stand-in for the OpenAI chat completions API, for exercising the chat
+assistant without a key or network access:
+
+    python fake_llm_server.py
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=fake python app.py
+
+It speaks just enough of POST /v1/chat/completions for app.py: plain and
+streamed (SSE) replies, a get_dashboard_data tool call for dashboard-style
+questions, a summary of the tool result on the follow-up call, and a scheduling
+JSON object when `response_format` asks for JSON. FAKE_LLM_TOKEN_DELAY_MS paces
+the streamed chunks so cancellation can be observed; streams a client abandons
+are reported on stdout.
+"""
+import json
+import os
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FAKE_LLM_PORT = int(os.environ.get('FAKE_LLM_PORT', 8001))
+FAKE_LLM_TOKEN_DELAY = float(os.environ.get('FAKE_LLM_TOKEN_DELAY_MS', 30)) / 1000
+
+DASHBOARD_WORDS = ('adherence', 'patients', 'pending', 'dashboard', 'medication', 'reminders')
+SCHEDULE_JSON = {
+    "a": "med_reminder",
+    "p": {"id": "Test Patient", "c": "WhatsApp", "ph": "+2348000000000"},
+    "f": {"check": "no", "date": None},
+    "m": [{"n": "Amoxicillin", "d": "500mg", "f": "three times daily", "t": "08:00 AM",
+           "s": time.strftime("%Y-%m-%d"), "du": "5 days"}],
+}
+
+
+def fake_reply(body):
+    """The assistant message the fake model answers `body` with."""
+    messages = body.get('messages') or []
+    last = messages[-1] if messages else {}
+    if (body.get('response_format') or {}).get('type') == 'json_object':
+        return {'role': 'assistant', 'content': json.dumps(SCHEDULE_JSON, separators=(',', ':'))}
+
+    tool_results = [message for message in messages if message.get('role') == 'tool']
+    if tool_results and last.get('role') != 'user':
+        try:
+            data = json.loads(tool_results[-1]['content']).get('kpis') or {}
+        except (TypeError, ValueError, AttributeError):
+            data = {}
+        return {'role': 'assistant', 'content': (
+            f"Over the selected period you have {data.get('total_patients', 0)} patients with an adherence rate of "
+            f"{data.get('adherence_rate', 'n/a')}%. {data.get('reminders_sent', 0)} reminders were sent and "
+            f"{data.get('pending_reminders', 0)} are still pending."
+        )}
+
+    question = str(last.get('content') or '')
+    if body.get('tools') and any(word in question.lower() for word in DASHBOARD_WORDS):
+        return {'role': 'assistant', 'content': None, 'tool_calls': [{
+            'id': f"call_{uuid.uuid4().hex[:12]}", 'type': 'function',
+            'function': {'name': 'get_dashboard_data', 'arguments': json.dumps({'filters': {'dateRange': '30'}})},
+        }]}
+    return {'role': 'assistant', 'content': f"This is a fake reply to: {question}"}
+
+
+def fake_usage(body, message):
+    # Same 4-characters-per-token rule of thumb the app budgets with
+    prompt = len(json.dumps(body.get('messages') or [])) // 4
+    completion = len(json.dumps(message)) // 4
+    return {'prompt_tokens': prompt, 'completion_tokens': completion, 'total_tokens': prompt + completion}
+
+
+def stream_deltas(message):
+    """Splits a message into the deltas a streamed reply would carry."""
+    yield {'role': 'assistant', 'content': ''}
+    for index, call in enumerate(message.get('tool_calls') or []):
+        yield {'tool_calls': [{'index': index, 'id': call['id'], 'type': 'function',
+                               'function': {'name': call['function']['name'], 'arguments': ''}}]}
+        arguments = call['function']['arguments']
+        for start in range(0, len(arguments), 8):
+            yield {'tool_calls': [{'index': index, 'function': {'arguments': arguments[start:start + 8]}}]}
+    words = (message.get('content') or '').split(' ')
+    for i, word in enumerate(words):
+        yield {'content': word if i == 0 else ' ' + word}
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/v1/chat/completions':
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        message = fake_reply(body)
+        finish_reason = 'tool_calls' if message.get('tool_calls') else 'stop'
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        base = {'id': completion_id, 'created': int(time.time()), 'model': body.get('model', 'fake')}
+
+        if not body.get('stream'):
+            payload = json.dumps(dict(base, object='chat.completion', choices=[
+                {'index': 0, 'message': message, 'finish_reason': finish_reason}
+            ], usage=fake_usage(body, message))).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        sent = 0
+        try:
+            for delta in stream_deltas(message):
+                self._event(dict(base, object='chat.completion.chunk',
+                                 choices=[{'index': 0, 'delta': delta, 'finish_reason': None}]))
+                sent += 1
+                time.sleep(FAKE_LLM_TOKEN_DELAY)
+            self._event(dict(base, object='chat.completion.chunk',
+                             choices=[{'index': 0, 'delta': {}, 'finish_reason': finish_reason}]))
+            if (body.get('stream_options') or {}).get('include_usage'):
+                self._event(dict(base, object='chat.completion.chunk', choices=[], usage=fake_usage(body, message)))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            print(f"[FAKE LLM] Client closed {completion_id} after {sent} chunks")
+
+    def _event(self, payload):
+        self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode())
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        print(f"[FAKE LLM] {format % args}")
+
+
+def serve(port=FAKE_LLM_PORT):
+    server = ThreadingHTTPServer(('127.0.0.1', port), FakeLLMHandler)
+    server.daemon_threads = True
+    print(f"Fake LLM server listening on http://127.0.0.1:{port}/v1")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    serve()
@@ -0,0 +1,43 @@
+"""
+gunicorn settings.
+
+With WEB_CONCURRENCY=1 (the default) the single worker polls the sheet itself.
+With more workers they run as APP_ROLE=web and share one snapshot: the master
+starts sync_process.py next to them, restarts it if it dies, and stops it on
+shutdown. Set SOCKETIO_MESSAGE_QUEUE (e.g. redis://localhost:6379/0) so emits
+reach clients connected to any worker.
+"""
+import os
+import subprocess
+import sys
+import threading
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+worker_class = 'gevent'
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+
+_sync = {'process': None, 'stopping': False}
+
+
+def _supervise_sync_process(server):
+    while not _sync['stopping']:
+        _sync['process'] = subprocess.Popen([sys.executable, 'sync_process.py'], env=dict(os.environ, APP_ROLE='sync'))
+        code = _sync['process'].wait()
+        if not _sync['stopping']:
+            server.log.error(f"Sheet sync process exited with {code}; restarting")
+            threading.Event().wait(5)
+
+
+def on_starting(server):
+    if workers > 1:
+        # Inherited by the forked workers
+        os.environ['APP_ROLE'] = 'web'
+        if not os.environ.get('SOCKETIO_MESSAGE_QUEUE'):
+            server.log.warning("SOCKETIO_MESSAGE_QUEUE is not set; emits only reach clients on the emitting worker")
+        threading.Thread(target=_supervise_sync_process, args=(server,), daemon=True).start()
+
+
+def on_exit(server):
+    _sync['stopping'] = True
+    if _sync['process'] is not None and _sync['process'].poll() is None:
+        _sync['process'].terminate()
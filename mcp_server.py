@@ -1,7 +1,7 @@
 import os
 from dotenv import load_dotenv
 from flask import Flask, jsonify, request
-from app import get_dashboard_data, get_google_sheet_data, REMINDER_TAB
+from app import get_dashboard_data, get_reminder_store
 
 # Load environment variables from .env file
 load_dotenv()
@@ -20,8 +20,7 @@ def mcp_get_dashboard_data():
     if not phone_no:
         return jsonify({'error': 'phone_no is required'}), 400
 
-    df = get_google_sheet_data(REMINDER_TAB)
-    dashboard_data = get_dashboard_data(phone_no, df, filters)
+    dashboard_data = get_dashboard_data(phone_no, get_reminder_store(), filters)
 
     return jsonify(dashboard_data)
 
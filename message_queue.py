@@ -0,0 +1,48 @@
+import queue
+from threading import Lock
+
+import socketio
+
+
+class InProcessManager(socketio.PubSubManager):
+    """
+    Socket.IO client manager whose pub/sub channel lives in process memory.
+
+    A stand-in for Redis in tests and local runs: every server created in this
+    process on the same channel receives the others' emits, room changes and
+    disconnects exactly as separate workers would through a real queue.
+    """
+    name = 'inprocess'
+
+    _channels = {}
+    _channels_lock = Lock()
+
+    def __init__(self, url='memory://', channel='socketio', write_only=False, logger=None, json=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        self._inbox = queue.Queue()
+        if not write_only:
+            with self._channels_lock:
+                self._channels.setdefault(channel, []).append(self._inbox)
+
+    def _publish(self, data):
+        with self._channels_lock:
+            subscribers = list(self._channels.get(self.channel, ()))
+        for inbox in subscribers:
+            inbox.put(data)
+
+    def _listen(self):
+        while True:
+            yield self._inbox.get()
+
+
+def queue_options(url, channel='flask-socketio'):
+    """
+    SocketIO() keyword arguments for a message queue URL: 'memory://' selects the
+    in-process manager, anything else (e.g. redis://localhost:6379/0) is passed to
+    Flask-SocketIO as `message_queue`. No URL means no queue.
+    """
+    if not url:
+        return {}
+    if url.startswith('memory://'):
+        return {'client_manager': InProcessManager(url, channel=channel)}
+    return {'message_queue': url, 'channel': channel}
@@ -0,0 +1,162 @@
+import os
+import random
+import time
+from collections import deque
+from threading import Event, Lock
+
+import requests
+from gspread.exceptions import APIError
+
+# --- Poll Scheduler Configuration ---
+SHEET_POLL_MIN_INTERVAL = float(os.environ.get('SHEET_POLL_MIN_INTERVAL', 5))
+SHEET_POLL_MAX_INTERVAL = float(os.environ.get('SHEET_POLL_MAX_INTERVAL', 120))
+SHEET_POLL_MAX_BACKOFF = float(os.environ.get('SHEET_POLL_MAX_BACKOFF', 600))
+# Google Sheets allows 60 read requests per minute per user by default
+SHEETS_READ_QUOTA_PER_MINUTE = int(os.environ.get('SHEETS_READ_QUOTA_PER_MINUTE', 60))
+# Share of that quota the poller may use; the rest is left for request handlers and logins
+SHEET_POLL_QUOTA_SHARE = float(os.environ.get('SHEET_POLL_QUOTA_SHARE', 0.5))
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+QUOTA_WINDOW = 60.0
+CHANGE_HISTORY = 10
+
+
+def error_status(error):
+    """HTTP status of a Google API error, or None for network and other failures."""
+    if isinstance(error, APIError):
+        response = getattr(error, 'response', None)
+        return getattr(response, 'status_code', None)
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        return error.response.status_code
+    return None
+
+
+class PollScheduler:
+    """
+    Decides when the background sheet poller runs next.
+
+    - Pauses while no dashboard clients are connected.
+    - Polls faster when recent polls saw changes or many pharmacies are
+      watching, and stretches the interval while the sheet stays idle.
+    - Backs off exponentially (with jitter) after errors, which for 429 and
+      5xx responses is what Google asks for.
+    - Counts sheet reads in a sliding one-minute window and holds the poller
+      back once it has used its share of the per-minute read quota.
+    """
+
+    def __init__(self, base_interval, min_interval=SHEET_POLL_MIN_INTERVAL, max_interval=SHEET_POLL_MAX_INTERVAL,
+                 max_backoff=SHEET_POLL_MAX_BACKOFF, reads_per_minute=SHEETS_READ_QUOTA_PER_MINUTE,
+                 quota_share=SHEET_POLL_QUOTA_SHARE):
+        self.base_interval = base_interval
+        self.min_interval = min(min_interval, base_interval)
+        self.max_interval = max(max_interval, base_interval)
+        self.max_backoff = max_backoff
+        self.reads_per_minute = reads_per_minute
+        self.poll_budget = max(1, int(reads_per_minute * quota_share))
+        self._lock = Lock()
+        self._has_clients = Event()
+        self._clients = 0
+        self._rooms = 0
+        self._changes = deque(maxlen=CHANGE_HISTORY)
+        self._idle_polls = 0
+        self._errors = 0
+        self._reads = deque()
+        self._poll_reads = deque()
+        self._last_error = None
+        self._last_poll = None
+        self._next_interval = base_interval
+
+    # --- Inputs ---
+    def set_clients(self, clients, rooms):
+        """Records how many sockets (and distinct pharmacy rooms) are connected."""
+        with self._lock:
+            self._clients = clients
+            self._rooms = rooms
+        if clients > 0:
+            self._has_clients.set()
+        else:
+            self._has_clients.clear()
+
+    def record_read(self, poller=False):
+        """Counts one read request against the per-minute quota."""
+        now = time.monotonic()
+        with self._lock:
+            self._reads.append(now)
+            if poller:
+                self._poll_reads.append(now)
+
+    def record_success(self, changed):
+        with self._lock:
+            self._errors = 0
+            self._last_error = None
+            self._changes.append(bool(changed))
+            self._idle_polls = 0 if changed else self._idle_polls + 1
+            self._last_poll = time.time()
+
+    def record_error(self, error):
+        with self._lock:
+            self._errors += 1
+            status = error_status(error)
+            self._last_error = {'status': status, 'error': repr(error), 'at': time.time(),
+                                'retryable': status is None or status in RETRYABLE_STATUS_CODES}
+            self._last_poll = time.time()
+
+    # --- Decisions ---
+    def wait_for_clients(self, timeout):
+        """Blocks up to `timeout` seconds until a client is connected; returns whether one is."""
+        return self._has_clients.wait(timeout)
+
+    def quota_delay(self):
+        """Seconds to hold off so the poller stays within its share of the read quota."""
+        with self._lock:
+            self._expire_reads()
+            if len(self._poll_reads) < self.poll_budget and len(self._reads) < self.reads_per_minute:
+                return 0.0
+            oldest = self._poll_reads[0] if len(self._poll_reads) >= self.poll_budget else self._reads[0]
+            return max(0.0, oldest + QUOTA_WINDOW - time.monotonic())
+
+    def next_interval(self):
+        """Seconds until the next poll, given recent errors, changes and audience."""
+        with self._lock:
+            if self._errors:
+                backoff = min(self.max_backoff, self.base_interval * (2 ** self._errors))
+                interval = backoff * random.uniform(0.8, 1.2)
+            else:
+                change_rate = sum(self._changes) / len(self._changes) if self._changes else 0.0
+                if change_rate >= 0.5:
+                    interval = self.base_interval / 2
+                else:
+                    # Stretch the interval while the sheet stays idle
+                    interval = self.base_interval * (1.5 ** min(self._idle_polls, 10))
+                # More pharmacies watching means fresher data is worth more reads
+                interval /= min(2.0, 1 + self._rooms / 20)
+                interval = min(self.max_interval, max(self.min_interval, interval))
+            self._next_interval = interval
+            return interval
+
+    def state(self):
+        with self._lock:
+            self._expire_reads()
+            return {
+                'paused': self._clients == 0,
+                'clients': self._clients,
+                'rooms': self._rooms,
+                'base_interval': self.base_interval,
+                'next_interval': round(self._next_interval, 2),
+                'recent_change_rate': round(sum(self._changes) / len(self._changes), 2) if self._changes else None,
+                'idle_polls': self._idle_polls,
+                'consecutive_errors': self._errors,
+                'last_error': self._last_error,
+                'last_poll': self._last_poll,
+                'reads_last_minute': len(self._reads),
+                'poller_reads_last_minute': len(self._poll_reads),
+                'reads_per_minute_quota': self.reads_per_minute,
+                'poller_read_budget': self.poll_budget,
+            }
+
+    # --- Internals (called with self._lock held) ---
+    def _expire_reads(self):
+        cutoff = time.monotonic() - QUOTA_WINDOW
+        for reads in (self._reads, self._poll_reads):
+            while reads and reads[0] < cutoff:
+                reads.popleft()
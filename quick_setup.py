@@ -0,0 +1,126 @@
+import re
+from datetime import datetime, timedelta
+
+# Parses the "Quick Setup" prescription format from prescription_schedule_prompt.md:
+#
+#     Alice Matthew | +2348012345678
+#     Lisinopril 10mg, once daily, 30 days, take with food
+#     Paracetamol: 500mg, every 6 hours, 5 days, take after food
+#     Contact: WhatsApp
+#
+# into the compact schedule JSON the model would produce, without calling it.
+# Anything the prompt leaves to the model's judgement (loading doses, delayed
+# starts, frequencies without a documented time rule, check-in dates) is not
+# parsed, so those messages still go to the model. So are email contacts: the
+# scheduling webhook needs a phone number, which the model asks for.
+
+CONTACT_METHODS = {'whatsapp': 'WhatsApp', 'sms': 'SMS', 'email': 'Email', 'call': 'Call'}
+DEFAULT_CONTACT = 'WhatsApp'
+
+# Fixed reminder times the prompt documents per frequency
+FIXED_TIMES = {
+    'once daily': ['09:00 AM'],
+    'daily': ['09:00 AM'],
+    'once a day': ['09:00 AM'],
+    'twice daily': ['09:00 AM', '09:00 PM'],
+    'twice a day': ['09:00 AM', '09:00 PM'],
+}
+EVERY_HOURS = re.compile(r'^every (\d{1,2}) ?(?:hours?|hrs?|hourly)$|^(\d{1,2}) ?hourly$')
+DOSE = re.compile(r'(\d+(?:\.\d+)?\s*(?:mg|mcg|g|ml|iu|units?|tablets?|tabs?|capsules?|caps?|puffs?|drops?|sachets?))$', re.IGNORECASE)
+DURATION = re.compile(r'^(\d+)\s*(day|week|month)s?$', re.IGNORECASE)
+PHONE = re.compile(r'^\+?\d{10,15}$')
+# Phrases that mean a schedule the prompt wants the model to work out
+FREE_FORM_HINTS = re.compile(r'\b(then|from now|later|loading|start(?:ing)? (?:in|on|after)|tomorrow)\b', re.IGNORECASE)
+
+def _normalize_phone(value):
+    digits = re.sub(r'[\s\-().]', '', value)
+    if digits.startswith('0'):
+        digits = '+234' + digits[1:]
+    elif digits.startswith('234'):
+        digits = '+' + digits
+    return digits if PHONE.match(digits) and digits.startswith('+') else None
+
+
+def _reminder_times(frequency, now):
+    if frequency in FIXED_TIMES:
+        return FIXED_TIMES[frequency]
+    match = EVERY_HOURS.match(frequency)
+    if match:
+        hours = int(match.group(1) or match.group(2))
+        if hours and 24 % hours == 0:
+            # Interval schedules start from the current time
+            return [(now + timedelta(hours=hours * i)).strftime('%I:%M %p') for i in range(24 // hours)]
+    return None
+
+
+def _parse_medication(line, start_date, now):
+    if ':' in line.split(',')[0]:
+        name, rest = line.split(':', 1)
+        fields = [field.strip() for field in rest.split(',')]
+        name, dose = name.strip(), fields.pop(0)
+    else:
+        fields = [field.strip() for field in line.split(',')]
+        match = DOSE.search(fields[0])
+        if match is None:
+            return None
+        name, dose = fields.pop(0)[:match.start()].strip(), match.group(1)
+    if len(name) < 2 or not dose or not fields:
+        return None
+
+    frequency = ' '.join(fields.pop(0).lower().split())
+    times = _reminder_times(frequency, now)
+    if times is None:
+        return None
+    medication = {'n': name, 'd': dose, 'f': frequency, 't': ', '.join(times), 's': start_date}
+    if fields and DURATION.match(fields[0]):
+        amount, unit = DURATION.match(fields.pop(0)).groups()
+        medication['du'] = f"{amount} {unit.lower()}{'s' if int(amount) != 1 else ''}"
+    instructions = ', '.join(field for field in fields if field)
+    if instructions:
+        medication['i'] = instructions
+    return medication
+
+
+def parse_quick_setup(text, now=None, start_date=None):
+    """
+    The compact schedule JSON for a well-formed Quick Setup message, or None when the
+    message is free-form, incomplete or ambiguous and should go to the model instead.
+    Every medication starts on `start_date` (YYYY-MM-DD), today by default.
+    """
+    now = now or datetime.now()
+    if not text or FREE_FORM_HINTS.search(text):
+        return None
+    lines = [line.strip() for line in text.strip().splitlines() if line.strip()]
+    # Allow one introductory line such as "Please set up:"
+    if lines and '|' not in lines[0] and lines[0].endswith(':'):
+        lines.pop(0)
+    if len(lines) < 2 or lines[0].count('|') != 1:
+        return None
+
+    patient_name, contact_value = (part.strip() for part in lines[0].split('|'))
+    phone = _normalize_phone(contact_value)
+    if len(patient_name) < 2 or phone is None:
+        return None
+
+    start_date = start_date or now.strftime('%Y-%m-%d')
+    contact = DEFAULT_CONTACT
+    medications = []
+    for line in lines[1:]:
+        label, _, value = line.partition(':')
+        label = label.strip().lower()
+        if label == 'contact':
+            contact = CONTACT_METHODS.get(value.strip().lower())
+            # Email reminders need an address as well as the phone number the webhook requires
+            if contact is None or contact == 'Email':
+                return None
+        elif label in ('check-in', 'checkin', 'check in'):
+            # The check-in date is the model's call (see "Check-in Assignment" in the prompt)
+            return None
+        else:
+            medication = _parse_medication(line, start_date, now)
+            if medication is None:
+                return None
+            medications.append(medication)
+    if not medications:
+        return None
+    return {'a': 'med_reminder', 'p': {'id': patient_name, 'c': contact, 'ph': phone}, 'f': {'check': 'no'}, 'm': medications}
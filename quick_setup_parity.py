@@ -0,0 +1,115 @@
+"""
+Parity check of the Quick Setup parser (quick_setup.py) against recorded model extractions.
+
+The corpus is JSONL, one {"input": ..., "now": "YYYY-MM-DD HH:MM", "llm": {...},
+"model": ...} record per line; "llm" is the schedule JSON the scheduling model
+("model") produced for that input at that time. Recordings only come from
+`record`, never by hand, so the check compares against what the model really said. Run e.g.:
+
+    python quick_setup_parity.py record quick_setup_corpus.jsonl   # fill in missing "llm" outputs (needs OPENAI_API_KEY)
+    python quick_setup_parity.py check quick_setup_corpus.jsonl    # compare the parser with the recordings
+
+Inputs the parser declines are counted as model fallbacks, not failures.
+`check` exits non-zero if a parsed input differs from its recording, if a
+parsed input has no recording yet, or if nothing was compared at all.
+app.py only uses the parser when QUICK_SETUP_LOCAL_PARSE=true; enable it once
+`check` passes against recordings of the current prompt.
+"""
+import json
+import os
+import sys
+from datetime import datetime
+
+from quick_setup import parse_quick_setup
+
+SCHEDULING_MODEL = "gpt-4o-mini"
+
+
+def load_corpus(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _without_nulls(value):
+    # The prompt asks the model to omit empty optional fields; some recordings still carry nulls
+    if isinstance(value, dict):
+        return {key: _without_nulls(item) for key, item in value.items() if item not in (None, '', [])}
+    if isinstance(value, list):
+        return [_without_nulls(item) for item in value]
+    return value
+
+
+def differences(expected, actual, path=''):
+    """Paths at which two schedule JSON values differ, e.g. ['m[1].t: ... != ...']."""
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        found = []
+        for key in sorted(set(expected) | set(actual)):
+            found += differences(expected.get(key), actual.get(key), f"{path}.{key}" if path else key)
+        return found
+    if isinstance(expected, list) and isinstance(actual, list) and len(expected) == len(actual):
+        return [diff for i, (a, b) in enumerate(zip(expected, actual)) for diff in differences(a, b, f"{path}[{i}]")]
+    return [] if expected == actual else [f"{path}: {expected!r} (model) != {actual!r} (parser)"]
+
+
+def record(path):
+    from openai import OpenAI
+    client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"), base_url=os.environ.get("OPENAI_BASE_URL"))
+    with open('prescription_schedule_prompt.md', 'r', encoding='utf-8') as f:
+        prompt = f.read()
+
+    corpus = load_corpus(path)
+    for entry in corpus:
+        if entry.get('llm') is not None:
+            continue
+        now = datetime.strptime(entry['now'], '%Y-%m-%d %H:%M')
+        system = prompt.replace("{{$current_date}}", now.strftime("%Y-%m-%d")).replace("{{$current_time}}", now.strftime("%I:%M %p"))
+        response = client.chat.completions.create(
+            model=SCHEDULING_MODEL,
+            temperature=0.2,
+            messages=[{"role": "system", "content": system}, {"role": "user", "content": entry['input']}],
+            response_format={"type": "json_object"}
+        )
+        entry['llm'] = json.loads(response.choices[0].message.content)
+        entry['model'] = response.model
+        print(f"recorded: {entry['input'].splitlines()[0]}")
+    with open(path, 'w', encoding='utf-8') as f:
+        for entry in corpus:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+
+def check(path):
+    parsed = fallbacks = unrecorded = mismatched = 0
+    for entry in load_corpus(path):
+        schedule = parse_quick_setup(entry['input'], datetime.strptime(entry['now'], '%Y-%m-%d %H:%M'))
+        title = entry['input'].splitlines()[0]
+        if schedule is None:
+            fallbacks += 1
+            print(f"{'model':>8}  {title}")
+            continue
+        parsed += 1
+        if entry.get('llm') is None:
+            unrecorded += 1
+            print(f"{'parsed':>8}  {title} (no recording)")
+            continue
+        found = differences(_without_nulls(entry['llm']), schedule)
+        mismatched += bool(found)
+        print(f"{'DIFF' if found else 'ok':>8}  {title}")
+        for diff in found:
+            print(f"{'':>10}{diff}")
+    compared = parsed - unrecorded
+    print(f"\n{parsed} parsed ({mismatched} differ from the model, {unrecorded} unrecorded), {fallbacks} left to the model")
+    if unrecorded:
+        print(f"{unrecorded} parsed inputs have no recording; run `record` first")
+    elif not compared:
+        print("Nothing was compared with the model")
+    return compared > 0 and unrecorded == 0 and mismatched == 0
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3 or sys.argv[1] not in ('record', 'check'):
+        print(__doc__)
+        sys.exit(2)
+    if sys.argv[1] == 'record':
+        record(sys.argv[2])
+    else:
+        sys.exit(0 if check(sys.argv[2]) else 1)
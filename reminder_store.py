@@ -0,0 +1,304 @@
+from bisect import bisect_left
+
+import numpy as np
+import pandas as pd
+
+from rollups import AdherenceRollup
+
+TIME_CATEGORIES = ['Morning', 'Afternoon', 'Evening', 'Unknown']
+# Low-cardinality text columns stored as pandas categoricals
+CATEGORICAL_COLUMNS = ['pharmacy_id', 'status', 'medication_name', 'frequency', 'dosage', 'should_check_in']
+# Timestamps parsed once and stored as UTC-aware datetimes
+DATETIME_COLUMNS = ['time_stamp', 'next_reminder_time', 'check_in_date']
+
+
+def normalize_reminders(raw_df):
+    """Cleans a raw ReminderData frame into the typed layout every dashboard path reads from."""
+    df = raw_df.copy()
+    if df.empty:
+        return df
+
+    if 'pharmacy_id' in df:
+        df['pharmacy_id'] = df['pharmacy_id'].astype(str).str.strip()
+    if 'status' in df:
+        df['status'] = df['status'].astype(str).str.strip().str.lower()
+    if 'should_check_in' in df:
+        df['should_check_in'] = df['should_check_in'].fillna('').astype(str).str.lower()
+
+    # time_stamp carries a 'Z' suffix in the sheet; naive values are treated as UTC as well
+    for column in DATETIME_COLUMNS:
+        if column in df:
+            df[column] = pd.to_datetime(df[column], errors='coerce', utc=True)
+
+    # Categorize the reminder's time of day once instead of a row-wise apply per request
+    if 'reminderTime' in df:
+        hours = pd.to_datetime(df['reminderTime'], format='%H:%M', errors='coerce').dt.hour
+        category = np.select([hours < 12, hours < 17, hours >= 17], TIME_CATEGORIES[:3], 'Unknown')
+        df['time_category'] = pd.Categorical(category, categories=TIME_CATEGORIES)
+    else:
+        df['time_category'] = pd.Categorical(['Unknown'] * len(df), categories=TIME_CATEGORIES)
+
+    for column in CATEGORICAL_COLUMNS:
+        if column in df:
+            df[column] = df[column].astype('category')
+    return df
+
+
+def partition_by_pharmacy(frame):
+    """
+    Stable-sorts a normalized frame by pharmacy_id and returns it with a
+    {pharmacy_id: (start, stop)} map of each tenant's contiguous row range.
+    Rows keep their sheet order within a pharmacy.
+    """
+    if frame.empty or 'pharmacy_id' not in frame:
+        return frame, {}
+    codes = frame['pharmacy_id'].cat.codes.to_numpy()
+    order = np.argsort(codes, kind='stable')
+    frame = frame.take(order).reset_index(drop=True)
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    stops = np.r_[starts[1:], len(sorted_codes)]
+    categories = frame['pharmacy_id'].cat.categories
+    offsets = {
+        categories[sorted_codes[start]]: (int(start), int(stop))
+        for start, stop in zip(starts, stops) if sorted_codes[start] >= 0
+    }
+    return frame, offsets
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class PatientSearchIndex:
+    """
+    Trigram index over one pharmacy's lowercased patient identifiers.
+
+    Substring queries intersect the posting lists of the query's trigrams and
+    confirm the few candidates with a plain `in` check; queries shorter than
+    three characters scan the (small) list of distinct patients instead.
+    A sorted copy of the names serves prefix lookups for typeahead.
+    """
+
+    def __init__(self, patient_identifiers):
+        original = patient_identifiers.astype(str).to_numpy()
+        self._row_codes, uniques = pd.factorize(np.char.lower(original.astype(str)))
+        self._names = list(uniques)
+        # Display name (first spelling seen) and row count per distinct patient
+        first_rows = np.unique(self._row_codes, return_index=True)[1]
+        self._display = list(original[first_rows])
+        self._counts = np.bincount(self._row_codes, minlength=len(self._names))
+        self._postings = {}
+        for name_id, name in enumerate(self._names):
+            for gram in trigrams(name):
+                self._postings.setdefault(gram, []).append(name_id)
+        self._sorted = sorted(range(len(self._names)), key=self._names.__getitem__)
+        self._sorted_names = [self._names[i] for i in self._sorted]
+
+    def matching_names(self, term):
+        """Ids of distinct patients whose lowercased identifier contains `term`."""
+        term = term.lower()
+        if len(term) < 3:
+            return [i for i, name in enumerate(self._names) if term in name]
+        candidates = None
+        for gram in sorted(trigrams(term), key=lambda g: len(self._postings.get(g, ()))):
+            posting = self._postings.get(gram)
+            if not posting:
+                return []
+            candidates = set(posting) if candidates is None else candidates.intersection(posting)
+            if not candidates:
+                return []
+        return [i for i in candidates if term in self._names[i]]
+
+    def row_mask(self, term):
+        """Boolean mask over the pharmacy's rows whose patient identifier contains `term`."""
+        return np.isin(self._row_codes, self.matching_names(term))
+
+    def prefix(self, prefix, limit=10):
+        """Up to `limit` patient identifiers starting with `prefix`, most reminders first."""
+        prefix = prefix.lower()
+        start = bisect_left(self._sorted_names, prefix)
+        end = bisect_left(self._sorted_names, prefix + '\U0010ffff', lo=start)
+        matches = sorted(self._sorted[start:end], key=lambda i: (-self._counts[i], self._names[i]))
+        return [self._display[i] for i in matches[:limit]]
+
+
+class PharmacyIndex:
+    """
+    Precomputed filter structures over one pharmacy's rows.
+
+    Holds a boolean bitmap per (column, value), built on first use and kept for
+    the life of the snapshot, and a sorted timestamp index so a date cutoff is
+    a binary search. Filtering is then a few bitwise ANDs and one final take.
+    """
+
+    def __init__(self, frame):
+        self.frame = frame
+        self._bitmaps = {}
+        self._codes = {}
+        self._none = np.zeros(len(frame), dtype=bool)
+        self._patients = None
+        timestamps = frame['time_stamp'].dt.tz_localize(None).to_numpy() if 'time_stamp' in frame else np.array([], dtype='datetime64[ns]')
+        # NaT sorts last, so valid timestamps occupy the first `_valid_times` slots of the order
+        self._time_order = np.argsort(timestamps, kind='stable')
+        self._sorted_times = timestamps[self._time_order]
+        self._valid_times = int(len(timestamps) - np.isnat(timestamps).sum())
+
+    def __len__(self):
+        return len(self.frame)
+
+    def bitmap(self, column, value):
+        """Rows where `column == value`, as a cached boolean array."""
+        key = (column, value)
+        bitmap = self._bitmaps.get(key)
+        if bitmap is None:
+            series = self.frame[column]
+            try:
+                code = series.cat.categories.get_loc(value)
+            except (KeyError, TypeError):
+                bitmap = self._none
+            else:
+                codes = self._codes.get(column)
+                if codes is None:
+                    codes = self._codes[column] = series.cat.codes.to_numpy()
+                bitmap = codes == code
+            self._bitmaps[key] = bitmap
+        return bitmap
+
+    def any_of(self, column, values):
+        """Rows where `column` is any of `values`."""
+        mask = self._none.copy()
+        for value in values:
+            mask |= self.bitmap(column, value)
+        return mask
+
+    def since(self, cutoff):
+        """Rows whose time_stamp is at or after the UTC `cutoff`."""
+        position = np.searchsorted(self._sorted_times[:self._valid_times], np.datetime64(cutoff.tz_convert('UTC').tz_localize(None)), side='left')
+        mask = self._none.copy()
+        mask[self._time_order[position:self._valid_times]] = True
+        return mask
+
+    @property
+    def patients(self):
+        """Trigram search index over this pharmacy's patient identifiers, built on first use."""
+        if self._patients is None:
+            self._patients = PatientSearchIndex(self.frame['patient_identifier'])
+        return self._patients
+
+    def take(self, mask):
+        """The rows selected by `mask`, or every row when `mask` is None."""
+        if mask is None:
+            return self.frame
+        return self.frame.iloc[np.flatnonzero(mask)]
+
+
+class ReminderStore:
+    """
+    Normalized, read-only view of one ReminderData snapshot.
+
+    Built once per snapshot so request handlers only filter and aggregate.
+    Rows are grouped by pharmacy so a tenant's slice is a dictionary lookup
+    plus a positional slice rather than a scan of every pharmacy's rows.
+    Frames handed out by the store are shared and must not be modified in place.
+    `generation` names the persisted snapshot (see snapshot_file.py) holding the
+    same rows, when there is one, so other processes can map it instead.
+    """
+
+    def __init__(self, frame, version=0, offsets=None, generation=None):
+        if offsets is None:
+            frame, offsets = partition_by_pharmacy(frame)
+        self.frame = frame
+        self.version = version
+        self.generation = generation
+        self.offsets = offsets
+        self._indexes = {}
+        self._rollups = {}
+        self._partition_hashes = None
+
+    @classmethod
+    def build(cls, raw_df, version=0):
+        return cls(normalize_reminders(raw_df), version)
+
+    @property
+    def empty(self):
+        return self.frame.empty
+
+    @property
+    def pharmacy_ids(self):
+        return list(self.offsets)
+
+    def pharmacy_bounds(self, phone_no):
+        """Returns the (start, stop) row range of one pharmacy, or None if it has no rows."""
+        return self.offsets.get(str(phone_no).strip())
+
+    def pharmacy_frame(self, phone_no):
+        """Returns the rows belonging to one pharmacy."""
+        bounds = self.pharmacy_bounds(phone_no)
+        if bounds is None:
+            return self.frame.iloc[0:0]
+        return self.frame.iloc[bounds[0]:bounds[1]]
+
+    @property
+    def partition_hashes(self):
+        """{pharmacy_id: content hash} for every pharmacy, computed once per snapshot."""
+        if self._partition_hashes is None:
+            hashes = {}
+            if self.offsets:
+                row_hashes = pd.util.hash_pandas_object(self.frame, index=False).to_numpy()
+                for pharmacy_id, (start, stop) in self.offsets.items():
+                    # Sum wraps around in uint64; the row count separates equal-sum partitions
+                    hashes[pharmacy_id] = (int(row_hashes[start:stop].sum()), stop - start)
+            self._partition_hashes = hashes
+        return self._partition_hashes
+
+    def partition_hash(self, phone_no):
+        """Content hash of one pharmacy's rows, or None if it has none."""
+        return self.partition_hashes.get(str(phone_no).strip())
+
+    def pharmacy_index(self, phone_no):
+        """Returns the filter index for one pharmacy, building it on first use."""
+        key = str(phone_no).strip()
+        index = self._indexes.get(key)
+        if index is None:
+            index = self._indexes[key] = PharmacyIndex(self.pharmacy_frame(key))
+        return index
+
+    def adherence_rollup(self, phone_no):
+        """Returns the daily adherence rollup for one pharmacy, building it on first use."""
+        key = str(phone_no).strip()
+        rollup = self._rollups.get(key)
+        if rollup is None:
+            rollup = self._rollups[key] = AdherenceRollup(self.pharmacy_frame(key))
+        return rollup
+
+    def inherit_rollups(self, previous):
+        """
+        Carries over rollups from an earlier snapshot for pharmacies whose rows are unchanged,
+        so only pharmacies that received new or edited rows rebuild theirs.
+        """
+        if previous is None or not previous._rollups:
+            return 0
+        inherited = 0
+        for pharmacy_id, rollup in previous._rollups.items():
+            if pharmacy_id not in self._rollups and previous.partition_hash(pharmacy_id) == self.partition_hash(pharmacy_id):
+                self._rollups[pharmacy_id] = rollup
+                inherited += 1
+        return inherited
+
+
+def value_counts(series):
+    """
+    value_counts() that leaves out categories absent from the slice and, like counting
+    the plain text column, orders equal counts by first appearance (a categorical's
+    own value_counts breaks ties by category order, which changes the dashboard's charts).
+    """
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        return series.value_counts()
+    codes = series.cat.codes.to_numpy()
+    codes = codes[codes >= 0]
+    present, first_position = np.unique(codes, return_index=True)
+    counts = np.bincount(codes, minlength=len(series.cat.categories))
+    by_appearance = present[np.argsort(first_position, kind='stable')]
+    order = by_appearance[np.argsort(-counts[by_appearance], kind='stable')]
+    return pd.Series(counts[order], index=pd.Index(series.cat.categories[order], name=series.name), name='count')
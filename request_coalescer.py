@@ -0,0 +1,109 @@
+import os
+import time
+from threading import Lock
+
+# --- Coalescing Configuration ---
+# Seconds a new request waits before running, so a burst of filter toggles collapses into one computation
+FILTER_DEBOUNCE_SECONDS = float(os.environ.get('FILTER_DEBOUNCE_MS', 50)) / 1000
+
+
+class RequestCoalescer:
+    """
+    Latest-wins request handling per key (e.g. per Socket.IO session).
+
+    The first request for a key becomes the leader and runs `compute`; requests
+    arriving while it is queued or running only replace the pending payload and
+    return immediately. When the leader finishes, a result is delivered only if
+    nothing newer arrived meanwhile, then the leader moves on to the newest
+    pending payload. Requests carrying an older sequence number than one already
+    seen for the key are ignored.
+    """
+
+    def __init__(self, debounce=FILTER_DEBOUNCE_SECONDS, sleep=time.sleep):
+        self.debounce = debounce
+        self._sleep = sleep
+        self._lock = Lock()
+        self._slots = {}
+        self._latest_seq = {}
+        self._submitted = 0
+        self._computed = 0
+        self._delivered = 0
+        self._coalesced = 0
+        self._discarded = 0
+        self._failed = 0
+        self._out_of_order = 0
+
+    def submit(self, key, seq, payload, compute, deliver):
+        """
+        Runs `compute(payload)` and then `deliver(seq, result)` unless a newer request for
+        `key` supersedes it. Returns True if this call led the work, False if it was folded in.
+        If `compute` or `deliver` raises, the leader still serves any newer pending request
+        and raises the first error afterwards.
+        """
+        with self._lock:
+            self._submitted += 1
+            if seq < self._latest_seq.get(key, float('-inf')):
+                self._out_of_order += 1
+                return False
+            self._latest_seq[key] = seq
+            slot = self._slots.get(key)
+            if slot is not None:
+                if 'pending' in slot:
+                    self._coalesced += 1
+                slot['pending'] = (seq, payload)
+                return False
+            slot = {'pending': (seq, payload)}
+            self._slots[key] = slot
+
+        error = None
+        try:
+            while True:
+                if self.debounce:
+                    self._sleep(self.debounce)
+                with self._lock:
+                    job = slot.pop('pending', None)
+                    if job is None:
+                        del self._slots[key]
+                        break
+                seq, payload = job
+                try:
+                    result = compute(payload)
+                    with self._lock:
+                        self._computed += 1
+                        if 'pending' in slot:
+                            # A newer request is waiting; this result is already out of date
+                            self._discarded += 1
+                            continue
+                        self._delivered += 1
+                    deliver(seq, result)
+                except Exception as e:
+                    # Requests that arrived meanwhile are still served; the first error is raised once the slot is empty
+                    with self._lock:
+                        self._failed += 1
+                    error = error or e
+        except BaseException:
+            with self._lock:
+                self._slots.pop(key, None)
+            raise
+        if error is not None:
+            raise error
+        return True
+
+    def forget(self, key):
+        """Drops sequence tracking for a key, e.g. when its session disconnects."""
+        with self._lock:
+            self._latest_seq.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'submitted': self._submitted,
+                'computed': self._computed,
+                'delivered': self._delivered,
+                'coalesced': self._coalesced,
+                'discarded_results': self._discarded,
+                'failed': self._failed,
+                'out_of_order': self._out_of_order,
+                'in_flight': len(self._slots),
+                'debounce_ms': round(self.debounce * 1000, 1),
+            }
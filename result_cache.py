@@ -0,0 +1,110 @@
+import json
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+def json_size(value):
+    """Approximate memory cost of a JSON-serializable value, in bytes of its encoding."""
+    return len(json.dumps(value, default=str))
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache bounded by entry count and, optionally, total size.
+
+    Entries may also expire after `ttl` seconds. `sizeof(value)` estimates an
+    entry's cost against `max_bytes`. Hit, miss and eviction counters are kept
+    in `stats()` so the cache can be sized from production traffic.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=None, ttl=None, sizeof=json_size):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._sizeof = sizeof
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return default
+            value, size, stored_at = entry
+            if self.ttl is not None and time.monotonic() - stored_at >= self.ttl:
+                self._drop(key)
+                self._expirations += 1
+                self._misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def set(self, key, value):
+        size = self._sizeof(value) if self.max_bytes is not None else 0
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                # Larger than the whole cache; storing it would only evict everything else
+                return
+            self._entries[key] = (value, size, time.monotonic())
+            self._bytes += size
+            while len(self._entries) > self.max_entries or (self.max_bytes is not None and self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self._evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            self._drop(key)
+            return entry[0]
+
+    def discard_where(self, predicate):
+        """Drops every entry whose key satisfies `predicate(key)`; returns how many were dropped."""
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                self._drop(key)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+            }
+
+    # --- Internals (called with self._lock held) ---
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+
+from adherence import utc_now
+
+# Columns with their own per-value rollups, keyed by the dashboard filter that selects them
+ROLLUP_DIMENSIONS = {'medication': 'medication_name', 'frequency': 'frequency', 'timeOfDay': 'time_category'}
+TREND_GRANULARITIES = ['day', 'week', 'month']
+
+
+def _utc_naive(timestamp):
+    return np.datetime64(timestamp.tz_convert('UTC').tz_localize(None), 'ns')
+
+
+class AdherenceRollup:
+    """
+    Daily adherence counts for one pharmacy's reminders, bucketed by due date.
+
+    Holds completed and open (not completed) counts per day for the whole
+    pharmacy and for each medication, frequency and time category. Whether an
+    open reminder is missed or still pending depends on the current time, so
+    that split happens when the counts are read: open reminders due on earlier
+    days are missed, later ones pending, and today's are split by a binary
+    search over their sorted due times. Nothing stored depends on `now`, so a
+    rollup stays valid for as long as the pharmacy's rows are unchanged.
+    """
+
+    def __init__(self, frame, dimensions=ROLLUP_DIMENSIONS.values()):
+        due = frame['next_reminder_time'].dt.tz_localize(None).to_numpy(dtype='datetime64[ns]')
+        # Reminders without a due date have no day to count against
+        valid = ~np.isnat(due)
+        completed = (frame['status'] == 'completed').to_numpy() & valid
+        open_ = ~completed & valid
+        days = due.astype('datetime64[D]')
+
+        self._cells = {(None, None): self._cell(days, due, completed, open_)}
+        for column in dimensions:
+            if column not in frame:
+                continue
+            codes, values = pd.factorize(frame[column])
+            for code, value in enumerate(values):
+                rows = codes == code
+                self._cells[(column, value)] = self._cell(days[rows], due[rows], completed[rows], open_[rows])
+
+    @staticmethod
+    def _cell(days, due, completed, open_):
+        counted = completed | open_
+        day_index, day_of_row = np.unique(days[counted], return_inverse=True)
+        completed_counts = np.bincount(day_of_row, weights=completed[counted], minlength=len(day_index)).astype(np.int64)
+        open_counts = np.bincount(day_of_row, weights=open_[counted], minlength=len(day_index)).astype(np.int64)
+        return day_index, completed_counts, open_counts, np.sort(due[open_])
+
+    def __contains__(self, key):
+        return key in self._cells
+
+    def counts(self, column=None, value=None, now=None):
+        """
+        Completed, missed and pending counts per due day for the whole pharmacy, or for
+        the rows where `column == value`, as a frame indexed by day.
+        """
+        cell = self._cells.get((column, value))
+        if cell is None:
+            return pd.DataFrame({'completed': [], 'missed': [], 'pending': []}, dtype=np.int64,
+                                index=pd.DatetimeIndex([], name='day'))
+        day_index, completed, open_counts, open_due = cell
+        now = _utc_naive(now if now is not None else utc_now())
+        today = now.astype('datetime64[D]')
+        missed = np.where(day_index < today, open_counts, 0)
+        pending = np.where(day_index > today, open_counts, 0)
+        position = np.searchsorted(day_index, today)
+        if position < len(day_index) and day_index[position] == today:
+            start, stop = np.searchsorted(open_due, [today.astype('datetime64[ns]'), now])
+            missed[position] = stop - start
+            pending[position] = open_counts[position] - missed[position]
+        return pd.DataFrame({'completed': completed, 'missed': missed, 'pending': pending},
+                            index=pd.DatetimeIndex(day_index, name='day'))
+
+
+def adherence_trend(counts, granularity='day'):
+    """
+    Chart series from per-day counts: adherence % per day, week (labelled by its
+    Monday) or month, over the periods that had anything due.
+    """
+    if granularity == 'week':
+        periods = counts.index.to_period('W')
+        counts = counts.groupby(periods).sum()
+        labels = counts.index.start_time.strftime('%Y-%m-%d')
+    elif granularity == 'month':
+        periods = counts.index.to_period('M')
+        counts = counts.groupby(periods).sum()
+        labels = counts.index.strftime('%Y-%m')
+    else:
+        labels = counts.index.strftime('%Y-%m-%d')
+
+    completed = counts['completed'].to_numpy()
+    due = completed + counts['missed'].to_numpy()
+    keep = due > 0
+    return {
+        "labels": list(labels[keep]),
+        "data": [float(rate) for rate in completed[keep] / due[keep] * 100]
+    }
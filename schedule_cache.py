@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import re
+import unicodedata
+from threading import Event, Lock
+
+from result_cache import LRUCache
+
+# --- Schedule Extraction Cache Configuration ---
+SCHEDULE_CACHE_SIZE = int(os.environ.get('SCHEDULE_CACHE_SIZE', 512))
+# Seconds an extraction is reused; short, since relative times ("in 20 mins") are resolved against the clock
+SCHEDULE_CACHE_TTL = float(os.environ.get('SCHEDULE_CACHE_TTL', 600))
+# Seconds an identical request waits for the extraction already in flight before making its own
+SCHEDULE_INFLIGHT_WAIT = float(os.environ.get('SCHEDULE_INFLIGHT_WAIT', 60))
+
+PHONE_PATTERN = re.compile(r'\+?\d[\d\s\-().]{6,}\d')
+
+
+def normalize_prescription_text(text):
+    """Canonical form of a prescription message: Unicode-normalized with whitespace collapsed. Case is kept (it is in names)."""
+    return ' '.join(unicodedata.normalize('NFKC', text or '').split())
+
+
+def _digits(text):
+    return re.sub(r'\D', '', text or '')
+
+
+def validate_schedule(schedule):
+    """Problems that would stop a compact schedule JSON (see prescription_schedule_prompt.md) from being sent; empty if valid."""
+    if not isinstance(schedule, dict):
+        return ['schedule is not a JSON object']
+    problems = []
+    patient = schedule.get('p')
+    if not isinstance(patient, dict) or not patient.get('ph'):
+        problems.append('missing patient phone number (p.ph)')
+    if not isinstance(patient, dict) or not patient.get('id'):
+        problems.append('missing patient identifier (p.id)')
+    medications = schedule.get('m')
+    if not isinstance(medications, list) or not medications:
+        problems.append('no medications (m)')
+    else:
+        for i, medication in enumerate(medications):
+            if not isinstance(medication, dict) or not medication.get('n'):
+                problems.append(f'medication {i + 1} has no name (n)')
+            elif not medication.get('s'):
+                problems.append(f'medication {i + 1} has no start date (s)')
+    return problems
+
+
+class _Flight:
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+
+class ScheduleExtractionCache:
+    """
+    Content-addressed cache of prescription messages to the schedule JSON the model extracted.
+
+    Keys hash the normalized message together with whatever else shapes the
+    extraction (pharmacy, prompt version, model, date). Only self-contained
+    messages are cached: the message must include a phone number, and the
+    extracted schedule must be valid with its phone number taken from the
+    message. A follow-up like "yes, schedule it" depends on the conversation
+    before it and always goes to the model. Identical requests arriving while
+    an extraction is in flight wait for it instead of calling the model again.
+    """
+
+    def __init__(self, max_entries=SCHEDULE_CACHE_SIZE, ttl=SCHEDULE_CACHE_TTL, inflight_wait=SCHEDULE_INFLIGHT_WAIT):
+        self._cache = LRUCache(max_entries=max_entries, ttl=ttl)
+        self.inflight_wait = inflight_wait
+        self._lock = Lock()
+        self._inflight = {}
+        self._extractions = 0
+        self._shared = 0
+        self._uncacheable = 0
+        self._rejected = 0
+
+    @staticmethod
+    def key(text, *context):
+        """Cache key for a prescription message in `context` (e.g. pharmacy, prompt hash, model, date), or None if it is not self-contained."""
+        normalized = normalize_prescription_text(text)
+        if not PHONE_PATTERN.search(normalized):
+            return None
+        return hashlib.sha256(json.dumps([normalized, *context], default=str).encode()).hexdigest()
+
+    def get_or_extract(self, key, text, extract):
+        """
+        Returns (schedule_json_string, source) where source is 'cache', 'shared' (another
+        request's in-flight extraction) or 'model'. `extract()` calls the model and returns
+        its JSON string; with `key` None it is always called and nothing is cached.
+        """
+        if key is None:
+            with self._lock:
+                self._uncacheable += 1
+                self._extractions += 1
+            return extract(), 'model'
+
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached, 'cache'
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+        if not leader:
+            if flight.done.wait(self.inflight_wait):
+                with self._lock:
+                    self._shared += 1
+                if flight.error is not None:
+                    raise flight.error
+                return flight.result, 'shared'
+            # The leader is taking too long; fall through and extract independently
+        try:
+            with self._lock:
+                self._extractions += 1
+            result = extract()
+            flight.result = result
+            if self._cacheable(text, result):
+                self._cache.set(key, result)
+            else:
+                with self._lock:
+                    self._rejected += 1
+            return result, 'model'
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            if leader:
+                with self._lock:
+                    self._inflight.pop(key, None)
+                flight.done.set()
+
+    @staticmethod
+    def _cacheable(text, result):
+        try:
+            schedule = json.loads(result)
+        except (TypeError, ValueError):
+            return False
+        if validate_schedule(schedule):
+            return False
+        # The phone number must come from the message itself, not from earlier turns
+        phone = _digits(schedule['p']['ph'])[-9:]
+        return bool(phone) and phone in _digits(text)
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                'model_calls': self._extractions,
+                'shared_in_flight': self._shared,
+                'uncacheable_inputs': self._uncacheable,
+                'not_cached_results': self._rejected,
+                'in_flight': len(self._inflight),
+            }
+        stats.update(self._cache.stats())
+        return stats
@@ -0,0 +1,269 @@
+import os
+import secrets
+import sqlite3
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SessionInterface
+from itsdangerous import BadSignature, Signer
+
+from chat_context import CHARS_PER_TOKEN, window_history
+from result_cache import LRUCache
+
+# --- Session Store Configuration ---
+# Seconds a session is kept after it was last changed
+SESSION_TTL = float(os.environ.get('SESSION_TTL', 7 * 24 * 3600))
+# In-memory backend bounds: sessions kept, and their total serialized size
+SESSION_STORE_MAX_ENTRIES = int(os.environ.get('SESSION_STORE_MAX_ENTRIES', 10000))
+SESSION_STORE_MAX_BYTES = int(os.environ.get('SESSION_STORE_MAX_BYTES', 256 * 1024 * 1024))
+# Largest serialized session stored; bigger ones have their chat history trimmed, and are not saved if that is not enough
+SESSION_MAX_BYTES = int(os.environ.get('SESSION_MAX_BYTES', 256 * 1024))
+
+
+class MemorySessionBackend:
+    """Sessions in process memory: LRU-bounded and expiring. Each worker process has its own."""
+
+    def __init__(self, ttl=SESSION_TTL, max_entries=SESSION_STORE_MAX_ENTRIES, max_bytes=SESSION_STORE_MAX_BYTES):
+        self._cache = LRUCache(max_entries=max_entries, max_bytes=max_bytes, ttl=ttl, sizeof=len)
+
+    def get(self, sid):
+        return self._cache.get(sid)
+
+    def set(self, sid, data):
+        self._cache.set(sid, data)
+
+    def delete(self, sid):
+        self._cache.pop(sid)
+
+    def stats(self):
+        return {'backend': 'memory', **self._cache.stats()}
+
+
+class SQLiteSessionBackend:
+    """Sessions in a SQLite file, shared by every process on the host."""
+
+    # Expired rows are purged once every this many writes
+    PURGE_EVERY = 500
+
+    def __init__(self, path, ttl=SESSION_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._lock = Lock()
+        self._writes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS sessions (sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)')
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, sid):
+        with self._connect() as conn:
+            row = conn.execute('SELECT data FROM sessions WHERE sid = ? AND expires_at > ?', (sid, time.time())).fetchone()
+        return row[0] if row else None
+
+    def set(self, sid, data):
+        now = time.time()
+        with self._lock:
+            self._writes += 1
+            purge = self._writes % self.PURGE_EVERY == 0
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)', (sid, data, now + self.ttl))
+            if purge:
+                conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (now,))
+
+    def delete(self, sid):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+    def stats(self):
+        with self._connect() as conn:
+            entries, size = conn.execute('SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM sessions WHERE expires_at > ?',
+                                         (time.time(),)).fetchone()
+        return {'backend': 'sqlite', 'entries': entries, 'bytes': size}
+
+
+class RedisSessionBackend:
+    """Sessions in Redis (or any server speaking its protocol), shared by every worker; Redis expires them."""
+
+    def __init__(self, url, ttl=SESSION_TTL, prefix='session:'):
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, sid):
+        data = self._client.get(self.prefix + sid)
+        return data.decode('utf-8') if data is not None else None
+
+    def set(self, sid, data):
+        self._client.setex(self.prefix + sid, int(self.ttl), data)
+
+    def delete(self, sid):
+        self._client.delete(self.prefix + sid)
+
+    def stats(self):
+        return {'backend': 'redis'}
+
+
+def session_backend(url, ttl=SESSION_TTL):
+    """
+    Session backend for a store URL: 'sqlite:///path/to/sessions.sqlite3',
+    'redis://host:6379/1' (or rediss://), and 'memory://' or no URL for in-process memory.
+    """
+    if not url or url.startswith('memory://'):
+        return MemorySessionBackend(ttl=ttl)
+    if url.startswith('sqlite:///'):
+        return SQLiteSessionBackend(url[len('sqlite:///'):], ttl=ttl)
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisSessionBackend(url, ttl=ttl)
+    raise ValueError(f"Unsupported session store URL: {url}")
+
+
+class ServerSideSession(SecureCookieSession):
+    def __init__(self, initial=None, sid=None, new=False):
+        super().__init__(initial)
+        self.sid = sid
+        self.new = new
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """
+    Flask session interface that keeps session data in a backend and only a signed
+    session id in the cookie, so requests and Socket.IO handshakes no longer carry
+    the conversation history. Data is serialized like Flask's cookie sessions and
+    written only when the session changed; an emptied session is deleted, and one
+    over `max_bytes` is trimmed to fit (see `_store`).
+    """
+    serializer = TaggedJSONSerializer()
+    salt = 'server-side-session'
+
+    def __init__(self, backend, max_bytes=SESSION_MAX_BYTES):
+        self.backend = backend
+        self.max_bytes = max_bytes
+        self._lock = Lock()
+        self._loads = 0
+        self._saves = 0
+        self._oversized = 0
+        self._refused = 0
+        self._largest = 0
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt=self.salt)
+
+    def open_session(self, app, request):
+        if not app.secret_key:
+            return None
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode('utf-8')
+            except BadSignature:
+                sid = None
+            data = self.backend.get(sid) if sid else None
+            if data is not None:
+                with self._lock:
+                    self._loads += 1
+                try:
+                    return ServerSideSession(self.serializer.loads(data), sid=sid)
+                except ValueError:
+                    pass
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def regenerate(self, session):
+        """
+        Moves `session` to a new id, keeping its data: the old record is deleted and the
+        new id is stored and sent when the session is saved. Call it at login, so an id
+        planted before authentication (session fixation) is worthless afterwards.
+        """
+        if not session.new:
+            self.backend.delete(session.sid)
+        session.sid = secrets.token_urlsafe(32)
+        session.new = True
+        session.modified = True
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not session:
+            if session.modified:
+                self.backend.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=self.get_cookie_secure(app),
+                                       partitioned=self.get_cookie_partitioned(app), samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+            return
+        if not session.modified:
+            return
+
+        self._store(session.sid, dict(session))
+        response.set_cookie(name, self._signer(app).sign(session.sid).decode('utf-8'),
+                            expires=self.get_expiration_time(app, session), httponly=self.get_cookie_httponly(app),
+                            domain=domain, path=path, secure=self.get_cookie_secure(app),
+                            partitioned=self.get_cookie_partitioned(app), samesite=self.get_cookie_samesite(app))
+
+    def modify(self, sid, change):
+        """
+        Applies `change(values)` to the stored data of session `sid` and saves it, for
+        code outside a request (e.g. a background task); returns False if the session is
+        gone or could not be saved.
+        """
+        data = self.backend.get(sid)
+        if data is None:
+            return False
+        try:
+            values = self.serializer.loads(data)
+        except ValueError:
+            return False
+        change(values)
+        return self._store(sid, values)
+
+    def _store(self, sid, values):
+        """
+        Stores `values` under `sid`. A session over `max_bytes` has its conversation
+        history windowed to ever fewer tokens and messages until it fits; if even the
+        latest turn does not, nothing is stored and False is returned.
+        """
+        data = self.serializer.dumps(values)
+        oversized = len(data) > self.max_bytes
+        history = values.get('conversation_history')
+        if oversized and isinstance(history, list):
+            budget, max_messages = self.max_bytes // CHARS_PER_TOKEN, len(history)
+            while len(data) > self.max_bytes and max_messages > 1:
+                budget, max_messages = budget // 2, max_messages // 2
+                values['conversation_history'] = window_history(history, budget=budget, max_messages=max_messages)
+                data = self.serializer.dumps(values)
+        stored = len(data) <= self.max_bytes
+        with self._lock:
+            self._saves += stored
+            self._largest = max(self._largest, len(data))
+            self._oversized += oversized
+            self._refused += not stored
+        if not stored:
+            print(f"[SESSION] Not saving session of {len(data)} bytes: over SESSION_MAX_BYTES ({self.max_bytes}) "
+                  "even with its chat history trimmed")
+            return False
+        if oversized:
+            print(f"[SESSION] Trimmed chat history to {len(values['conversation_history'])} messages "
+                  f"to fit SESSION_MAX_BYTES ({self.max_bytes})")
+        self.backend.set(sid, data)
+        return True
+
+    def stats(self):
+        with self._lock:
+            stats = {'loads': self._loads, 'saves': self._saves, 'oversized_saves': self._oversized,
+                     'refused_saves': self._refused, 'largest_bytes': self._largest}
+        stats.update(self.backend.stats())
+        return stats
@@ -0,0 +1,154 @@
+import os
+import time
+from threading import Lock, Event, Thread
+
+# --- Snapshot Cache Configuration ---
+# Seconds a snapshot is served as fresh before a refresh is triggered.
+SHEET_CACHE_TTL = float(os.environ.get('SHEET_CACHE_TTL', 30))
+# Seconds past the TTL a stale snapshot may still be served while it is being refreshed.
+SHEET_CACHE_MAX_STALE = float(os.environ.get('SHEET_CACHE_MAX_STALE', 300))
+
+
+class _Entry:
+    def __init__(self, value, fetched_at):
+        self.value = value
+        self.fetched_at = fetched_at
+
+
+class SnapshotCache:
+    """
+    In-process cache of sheet snapshots keyed by tab name.
+
+    - Fresh entries (younger than `ttl`) are returned directly.
+    - Stale entries (younger than `ttl + max_stale`) are returned immediately
+      while a single background refresh runs (stale-while-revalidate).
+    - Missing or expired entries block, but concurrent callers for the same
+      key wait on one fetch instead of each hitting the network (single-flight).
+    """
+
+    def __init__(self, loader, ttl=SHEET_CACHE_TTL, max_stale=SHEET_CACHE_MAX_STALE):
+        self._loader = loader
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._entries = {}
+        self._inflight = {}
+        self._errors = {}
+        self._lock = Lock()
+        self._listeners = []
+
+    def get(self, key):
+        """Returns the snapshot for `key`, fetching or revalidating as needed."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                age = now - entry.fetched_at
+                if age < self.ttl:
+                    return entry.value
+                if age < self.ttl + self.max_stale:
+                    self._start_fetch(key, background=True)
+                    return entry.value
+            done, leader = self._start_fetch(key, background=False)
+
+        if leader:
+            self._fetch(key, done)
+        else:
+            done.wait()
+
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            raise LookupError(f"No snapshot available for '{key}'")
+        return entry.value
+
+    def refresh(self, key, raise_errors=False):
+        """
+        Fetches `key` now, sharing any fetch already in flight, and returns the new snapshot.
+        A failed fetch leaves the previous snapshot in place; with `raise_errors` its error is raised.
+        """
+        with self._lock:
+            done, leader = self._start_fetch(key, background=False)
+        if leader:
+            self._fetch(key, done)
+        else:
+            done.wait()
+        with self._lock:
+            error = self._errors.get(key)
+        if raise_errors and error is not None:
+            raise error
+        return self.peek(key)
+
+    def prefetch(self, key):
+        """Starts a background fetch of `key` unless one is already running; never blocks."""
+        with self._lock:
+            self._start_fetch(key, background=True)
+
+    def put(self, key, value):
+        """Stores a snapshot fetched elsewhere (e.g. by the background poller)."""
+        with self._lock:
+            self._entries[key] = _Entry(value, time.monotonic())
+        self._notify(key)
+
+    def peek(self, key):
+        """Returns the cached snapshot for `key` without fetching, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry.value if entry is not None else None
+
+    def age(self, key):
+        """Seconds since `key` was last stored, or None if it is not cached."""
+        with self._lock:
+            entry = self._entries.get(key)
+        return time.monotonic() - entry.fetched_at if entry is not None else None
+
+    def invalidate(self, key=None):
+        """Drops one cached snapshot, or all of them when `key` is None."""
+        with self._lock:
+            if key is None:
+                keys = list(self._entries)
+                self._entries.clear()
+            else:
+                keys = [key] if self._entries.pop(key, None) is not None else []
+        for k in keys:
+            self._notify(k)
+
+    def on_change(self, callback):
+        """Registers `callback(key)` to run whenever a snapshot is stored or invalidated."""
+        self._listeners.append(callback)
+        return callback
+
+    # --- Internals ---
+    def _start_fetch(self, key, background):
+        # Must be called with self._lock held. Returns (done_event, is_leader).
+        done = self._inflight.get(key)
+        if done is not None:
+            return done, False
+        done = Event()
+        self._inflight[key] = done
+        if background:
+            Thread(target=self._fetch, args=(key, done), daemon=True).start()
+            return done, False
+        return done, True
+
+    def _fetch(self, key, done):
+        try:
+            value = self._loader(key)
+        except Exception as e:
+            print(f"[SNAPSHOT CACHE ERROR] Key={key} | {repr(e)}")
+            with self._lock:
+                self._errors[key] = e
+        else:
+            with self._lock:
+                self._errors.pop(key, None)
+            self.put(key, value)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            done.set()
+
+    def _notify(self, key):
+        for callback in list(self._listeners):
+            try:
+                callback(key)
+            except Exception as e:
+                print(f"[SNAPSHOT CACHE LISTENER ERROR] Key={key} | {repr(e)}")
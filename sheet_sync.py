@@ -0,0 +1,174 @@
+import os
+import time
+from threading import Lock
+
+import pandas as pd
+from gspread.utils import numericise_all, rowcol_to_a1, to_records
+
+# --- Incremental Sync Configuration ---
+# Seconds between full re-downloads that pick up rows edited or deleted in place.
+SHEET_FULL_SYNC_INTERVAL = float(os.environ.get('SHEET_FULL_SYNC_INTERVAL', 300))
+
+
+def pushed_rows_problem(rows, width=None):
+    """
+    Why pushed cell values can't be applied as sheet rows, or None if they can: they must be
+    a non-empty list of lists of scalars (text, numbers, booleans), at most `width` cells wide.
+    """
+    if not isinstance(rows, list) or not rows:
+        return 'values must be a non-empty list of rows'
+    for i, row in enumerate(rows):
+        if not isinstance(row, list):
+            return f'values[{i}] must be a list of cells'
+        if width is not None and len(row) > width:
+            return f'values[{i}] has {len(row)} cells; the sheet has {width} columns'
+        if not all(isinstance(cell, (str, int, float, bool)) for cell in row):
+            return f'values[{i}] must contain only text, numbers or booleans'
+    return None
+
+
+class IncrementalSheetSync:
+    """
+    Keeps a resident DataFrame of an append-only tab in step with the sheet.
+
+    The first sync (and one every `full_sync_interval` seconds) downloads the
+    whole tab; every other sync only requests the rows below the last one seen
+    and appends them, so its cost depends on how many rows were added rather
+    than on the size of the tab. Records are built exactly like
+    `Worksheet.get_all_records()` so both paths produce the same frame.
+    """
+
+    def __init__(self, worksheet_getter, tab_name, full_sync_interval=SHEET_FULL_SYNC_INTERVAL):
+        self._worksheet_getter = worksheet_getter
+        self.tab_name = tab_name
+        self.full_sync_interval = full_sync_interval
+        self._lock = Lock()
+        self._header = None
+        self._frame = None
+        self._last_row = 0
+        self._last_full_sync = None
+        self.stats = {"full_syncs": 0, "incremental_syncs": 0, "rows_appended": 0}
+
+    @property
+    def width(self):
+        """Number of header columns, or None before the first sync."""
+        return len(self._header) if self._header else None
+
+    @property
+    def last_row(self):
+        """1-based sheet row of the last data row seen (the header is row 1)."""
+        return self._last_row
+
+    def sync(self, force_full=False):
+        """Brings the resident frame up to date and returns it."""
+        with self._lock:
+            worksheet = self._worksheet_getter(self.tab_name)
+            due = self._last_full_sync is None or time.monotonic() - self._last_full_sync >= self.full_sync_interval
+            if force_full or due or self._frame is None:
+                self._full_sync(worksheet)
+            else:
+                self._append_new_rows(worksheet)
+            return self._frame
+
+    def apply_rows(self, start_row, rows):
+        """
+        Applies pushed cell values to the resident frame without reading the sheet.
+
+        `start_row` is the 1-based sheet row of `rows[0]`. Rows at or above the
+        last seen row replace the matching resident rows; rows directly below it
+        are appended. Returns the updated frame, or None when the change cannot
+        be applied locally (no resident frame yet, the header row was edited, the
+        rows leave a gap or aren't rows of cells) and a sync is needed instead.
+        """
+        with self._lock:
+            if self._frame is None or not self._header or start_row < 2:
+                return None
+            if pushed_rows_problem(rows, len(self._header)) is not None:
+                return None
+            if start_row > self._last_row + 1:
+                return None
+            self.stats["pushed_rows"] = self.stats.get("pushed_rows", 0) + len(rows)
+            # Resident row i holds sheet row i + 2 (row 1 is the header)
+            begin = start_row - 2
+            overlap = max(0, min(len(rows), self._last_row - start_row + 1))
+            parts = [self._frame.iloc[:begin], self._to_frame(rows), self._frame.iloc[begin + overlap:]]
+            self._frame = pd.concat([part for part in parts if not part.empty], ignore_index=True)
+            self._last_row = max(self._last_row, start_row + len(rows) - 1)
+            return self._frame
+
+    def reset(self):
+        """Forgets the resident frame so the next sync downloads the whole tab."""
+        with self._lock:
+            self._header = None
+            self._frame = None
+            self._last_row = 0
+            self._last_full_sync = None
+
+    # --- Internals (called with self._lock held) ---
+    def _full_sync(self, worksheet):
+        values = worksheet.get(pad_values=True)
+        self._last_full_sync = time.monotonic()
+        self.stats["full_syncs"] += 1
+        if not values or values == [[]]:
+            self._header = None
+            self._frame = pd.DataFrame()
+            self._last_row = 0
+            return
+        self._header = list(values[0])
+        rows = values[1:]
+        self._frame = self._to_frame(rows)
+        self._last_row = 1 + len(rows)
+
+    def _append_new_rows(self, worksheet):
+        self.stats["incremental_syncs"] += 1
+        if not self._header:
+            self._full_sync(worksheet)
+            return
+        last_column = rowcol_to_a1(1, len(self._header))[:-1]
+        start = self._last_row + 1
+        values = worksheet.get(f"A{start}:{last_column}")
+        rows = [] if not values or values == [[]] else list(values)
+        if not rows:
+            return
+        self._last_row = start + len(rows) - 1
+        new_frame = self._to_frame(rows)
+        self._frame = new_frame if self._frame.empty else pd.concat([self._frame, new_frame], ignore_index=True)
+        self.stats["rows_appended"] += len(rows)
+
+    def _to_frame(self, rows):
+        width = len(self._header)
+        padded = [list(row[:width]) + [""] * (width - len(row)) for row in rows]
+        records = to_records(self._header, [numericise_all(row) for row in padded])
+        return pd.DataFrame(records, columns=self._header)
+
+
+class FakeSheetNotifier:
+    """
+    Offline stand-in for the Apps Script onEdit trigger.
+
+    Edits the rows held by a MockSheetsTransport-style `tabs` dict and posts
+    the same changed-range payload the real trigger sends, through `post`
+    (e.g. a Flask test client's `post`, or `requests.post` against a running app).
+    """
+
+    def __init__(self, post, tabs, url='/api/sheet-webhook', secret=None):
+        self._post = post
+        self.tabs = tabs
+        self.url = url
+        self.secret = secret
+
+    def append(self, tab_name, *rows):
+        """Appends rows below the last one and notifies."""
+        start_row = len(self.tabs[tab_name]) + 1
+        self.tabs[tab_name].extend(list(row) for row in rows)
+        return self.notify(tab_name, start_row, rows)
+
+    def edit(self, tab_name, row_number, values):
+        """Replaces one 1-based sheet row and notifies."""
+        self.tabs[tab_name][row_number - 1] = list(values)
+        return self.notify(tab_name, row_number, [values])
+
+    def notify(self, tab_name, start_row, rows):
+        payload = {"tab": tab_name, "start_row": start_row, "values": [list(map(str, row)) for row in rows]}
+        headers = {"X-Sheet-Webhook-Token": self.secret} if self.secret else {}
+        return self._post(self.url, json=payload, headers=headers)
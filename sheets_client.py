@@ -0,0 +1,163 @@
+import json
+import re
+from threading import Lock
+from urllib.parse import urlparse, unquote
+
+import gspread
+import requests
+from requests.adapters import HTTPAdapter, BaseAdapter
+from google.auth.transport.requests import AuthorizedSession
+
+
+class SheetsClientRegistry:
+    """
+    Long-lived gspread client shared by every request.
+
+    Credentials are built and authorized once, the spreadsheet is opened once
+    (by key when one is configured, otherwise by name on first use and by its
+    resolved key afterwards) and worksheet handles are kept per tab. All calls
+    go through one AuthorizedSession, which keeps connections alive and only
+    refreshes the OAuth token when it has expired.
+    """
+
+    def __init__(self, credentials_factory, sheet_key=None, sheet_name=None, transport=None, pool_size=10):
+        self._credentials_factory = credentials_factory
+        self._sheet_key = sheet_key
+        self._sheet_name = sheet_name
+        self._transport = transport
+        self._pool_size = pool_size
+        self._lock = Lock()
+        self._client = None
+        self._spreadsheet = None
+        self._worksheets = {}
+        self.stats = {"authorizations": 0, "spreadsheet_opens": 0, "worksheet_lookups": 0}
+
+    def client(self):
+        """Returns the shared gspread client, authorizing it on first use."""
+        with self._lock:
+            return self._get_client()
+
+    def spreadsheet(self):
+        """Returns the shared spreadsheet handle, opening it on first use."""
+        with self._lock:
+            return self._get_spreadsheet()
+
+    def worksheet(self, tab_name):
+        """Returns the cached worksheet handle for `tab_name`."""
+        with self._lock:
+            worksheet = self._worksheets.get(tab_name)
+            if worksheet is None:
+                worksheet = self._get_spreadsheet().worksheet(tab_name)
+                self.stats["worksheet_lookups"] += 1
+                self._worksheets[tab_name] = worksheet
+            return worksheet
+
+    def reset(self, tab_name=None):
+        """Drops one worksheet handle, or every handle and the client when `tab_name` is None."""
+        with self._lock:
+            if tab_name is not None:
+                self._worksheets.pop(tab_name, None)
+                return
+            self._worksheets.clear()
+            self._spreadsheet = None
+            self._client = None
+
+    # --- Internals (called with self._lock held) ---
+    def _get_client(self):
+        if self._client is None:
+            credentials = self._credentials_factory()
+            session = AuthorizedSession(credentials)
+            adapter = self._transport or HTTPAdapter(pool_connections=self._pool_size, pool_maxsize=self._pool_size)
+            session.mount('https://', adapter)
+            self._client = gspread.Client(credentials, session=session)
+            self.stats["authorizations"] += 1
+        return self._client
+
+    def _get_spreadsheet(self):
+        if self._spreadsheet is None:
+            client = self._get_client()
+            if self._sheet_key:
+                self._spreadsheet = client.open_by_key(self._sheet_key)
+            else:
+                self._spreadsheet = client.open(self._sheet_name)
+                # Later re-opens (after reset) skip the Drive lookup by name
+                self._sheet_key = self._spreadsheet.id
+            self.stats["spreadsheet_opens"] += 1
+        return self._spreadsheet
+
+
+class MockSheetsTransport(BaseAdapter):
+    """
+    Offline stand-in for the Google Sheets and Drive HTTP APIs.
+
+    Mount it through `SheetsClientRegistry(transport=...)` to exercise client
+    and worksheet reuse without network access. `tabs` maps a tab name to its
+    rows (header row first); every request is recorded in `self.requests`.
+    """
+
+    def __init__(self, tabs, sheet_key='mock-sheet-key', sheet_name='patient_reminder'):
+        super().__init__()
+        self.tabs = tabs
+        self.sheet_key = sheet_key
+        self.sheet_name = sheet_name
+        self.requests = []
+
+    def count(self, path_fragment):
+        """Number of recorded requests whose URL path contains `path_fragment`."""
+        return sum(1 for method, path in self.requests if path_fragment in path)
+
+    def send(self, request, **kwargs):
+        url = urlparse(request.url)
+        path = unquote(url.path)
+        self.requests.append((request.method, path))
+
+        if url.netloc == 'www.googleapis.com' and path.startswith('/drive/v3/files'):
+            return self._response(request, 200, {"files": [{"id": self.sheet_key, "name": self.sheet_name}]})
+
+        prefix = f"/v4/spreadsheets/{self.sheet_key}"
+        if not path.startswith(prefix):
+            return self._response(request, 404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+
+        rest = path[len(prefix):]
+        if rest == '':
+            return self._response(request, 200, self._metadata())
+        if rest.startswith('/values/'):
+            return self._values(request, rest[len('/values/'):])
+        return self._response(request, 404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+
+    def close(self):
+        pass
+
+    # --- Internals ---
+    def _metadata(self):
+        sheets = []
+        for index, (title, rows) in enumerate(self.tabs.items()):
+            sheets.append({"properties": {
+                "sheetId": index, "title": title, "index": index, "sheetType": "GRID",
+                "gridProperties": {"rowCount": max(len(rows), 1000), "columnCount": 26},
+            }})
+        return {"spreadsheetId": self.sheet_key, "properties": {"title": self.sheet_name}, "sheets": sheets}
+
+    def _values(self, request, range_name):
+        match = re.match(r"^'?(.*?)'?(?:!([A-Z]*)(\d*)(?::([A-Z]*)(\d*))?)?$", range_name)
+        title = match.group(1)
+        if title not in self.tabs:
+            return self._response(request, 400, {"error": {"code": 400, "message": f"Unable to parse range: {range_name}", "status": "INVALID_ARGUMENT"}})
+        rows = self.tabs[title]
+        start = int(match.group(3)) if match.group(3) else 1
+        end = int(match.group(5)) if match.group(5) else len(rows)
+        body = {"range": range_name, "majorDimension": "ROWS"}
+        values = [list(map(str, row)) for row in rows[start - 1:end]]
+        if values:
+            body["values"] = values
+        return self._response(request, 200, body)
+
+    def _response(self, request, status, body):
+        response = requests.Response()
+        response.status_code = status
+        response._content = json.dumps(body).encode('utf-8')
+        response.headers['Content-Type'] = 'application/json'
+        response.url = request.url
+        response.request = request
+        response.encoding = 'utf-8'
+        return response
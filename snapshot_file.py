@@ -0,0 +1,250 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+from threading import Lock, Thread
+
+import numpy as np
+import pandas as pd
+
+# --- Snapshot File Configuration ---
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', os.path.join(tempfile.gettempdir(), 'pharmopera-snapshot'))
+# Persisted snapshots older than this are ignored at startup rather than served
+SNAPSHOT_MAX_AGE = float(os.environ.get('SNAPSHOT_MAX_AGE', 7 * 24 * 3600))
+# Minimum seconds between background writes; newer snapshots replace a pending one
+SNAPSHOT_PERSIST_INTERVAL = float(os.environ.get('SNAPSHOT_PERSIST_INTERVAL', 60))
+
+FORMAT_VERSION = 1
+CURRENT_FILE = 'CURRENT'
+# Generations kept on disk so a reader that just resolved CURRENT never sees its files deleted
+KEEP_GENERATIONS = 2
+
+
+def _encode_column(directory, index, series):
+    """Writes one column as .npy files and returns its manifest entry."""
+    name = f"c{index}"
+    dtype = series.dtype
+    entry = {'name': series.name, 'file': f"{name}.npy", 'dtype': str(dtype)}
+    if isinstance(dtype, pd.CategoricalDtype):
+        entry['kind'] = 'category'
+        entry['categories'] = series.cat.categories.tolist()
+        entry['categories_dtype'] = str(series.cat.categories.dtype)
+        np.save(os.path.join(directory, entry['file']), series.cat.codes.to_numpy())
+    elif isinstance(dtype, pd.DatetimeTZDtype) or (isinstance(dtype, np.dtype) and dtype.kind == 'M'):
+        entry['kind'] = 'datetime'
+        entry['tz'] = str(series.dt.tz) if series.dt.tz is not None else None
+        values = series.dt.tz_localize(None).to_numpy() if series.dt.tz is not None else series.to_numpy()
+        entry['unit'] = np.datetime_data(values.dtype)[0]
+        np.save(os.path.join(directory, entry['file']), values.view('int64'))
+    elif isinstance(dtype, np.dtype) and dtype.kind in 'biuf':
+        entry['kind'] = 'numeric'
+        np.save(os.path.join(directory, entry['file']), series.to_numpy())
+    else:
+        # Text and mixed object columns: dictionary-encoded, distinct values kept as JSON
+        entry['kind'] = 'text'
+        codes, uniques = pd.factorize(series)
+        entry['values_file'] = f"{name}.values.json"
+        with open(os.path.join(directory, entry['values_file']), 'w') as f:
+            json.dump(list(uniques), f, default=str)
+        np.save(os.path.join(directory, entry['file']), codes.astype(np.int32))
+    return entry
+
+
+def _decode_column(directory, entry, mmap_mode):
+    array = np.load(os.path.join(directory, entry['file']), mmap_mode=mmap_mode)
+    kind = entry['kind']
+    if kind == 'category':
+        categories = pd.Index(entry['categories'], dtype=entry['categories_dtype'])
+        return pd.Categorical.from_codes(array, categories=categories)
+    if kind == 'datetime':
+        values = pd.DatetimeIndex(array.view(f"datetime64[{entry['unit']}]"))
+        return values.tz_localize(entry['tz']) if entry['tz'] else values
+    if kind == 'numeric':
+        return array
+    # Text columns are decoded eagerly, so they keep the dtype the store built them with
+    with open(os.path.join(directory, entry['values_file'])) as f:
+        uniques = np.array(json.load(f) + [None], dtype=object)
+    # Code -1 (missing) picks the trailing None
+    values = uniques[array]
+    return pd.array(values, dtype=entry['dtype']) if entry['dtype'] != 'object' else values
+
+
+class SnapshotFile:
+    """
+    Normalized reminder snapshot persisted as a directory of .npy columns.
+
+    Numeric, datetime and categorical columns are stored as plain arrays and
+    memory-mapped on load, so a new process can serve dashboards in
+    milliseconds instead of waiting for a full sheet download; a categorical
+    column's categories are kept in the manifest. Text columns (patient,
+    phone, reminder time, check-in message) are dictionary-encoded as int32
+    codes plus a JSON file of distinct values, and are decoded into ordinary
+    in-memory string columns on every load: only their codes are mapped, so a
+    load costs time and memory proportional to those columns. Each write goes to a fresh generation directory
+    and is published by atomically replacing the CURRENT pointer, so readers
+    never see a half-written snapshot. The manifest records the store version,
+    write time and source sheet so a snapshot from another sheet is never served.
+    """
+
+    def __init__(self, directory=SNAPSHOT_DIR, source=None, max_age=SNAPSHOT_MAX_AGE,
+                 persist_interval=SNAPSHOT_PERSIST_INTERVAL):
+        self.directory = directory
+        self.source = source
+        self.max_age = max_age
+        self.persist_interval = persist_interval
+        self._lock = Lock()
+        self._pending = None
+        self._writer = None
+        self._last_write = 0.0
+        self.stats = {'writes': 0, 'write_errors': 0, 'last_write_ms': None, 'last_load_ms': None}
+
+    # --- Writing ---
+    def write(self, frame, offsets, version):
+        """Writes a snapshot synchronously and publishes it; returns its manifest."""
+        start = time.perf_counter()
+        os.makedirs(self.directory, exist_ok=True)
+        generation = f"v{version}-{time.time_ns()}"
+        target = os.path.join(self.directory, generation)
+        os.makedirs(target)
+        manifest = {
+            'format': FORMAT_VERSION,
+            'version': version,
+            'written_at': time.time(),
+            'source': self.source,
+            'rows': len(frame),
+            'offsets': {str(key): [int(start_row), int(stop_row)] for key, (start_row, stop_row) in offsets.items()},
+            'columns': [_encode_column(target, i, frame[column]) for i, column in enumerate(frame.columns)],
+        }
+        with open(os.path.join(target, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, default=str)
+
+        pointer = os.path.join(self.directory, f".{CURRENT_FILE}.{os.getpid()}")
+        with open(pointer, 'w') as f:
+            f.write(generation)
+        os.replace(pointer, os.path.join(self.directory, CURRENT_FILE))
+        self._prune(keep=generation)
+        manifest['generation'] = generation
+        self.stats['writes'] += 1
+        self.stats['last_write_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        return manifest
+
+    def save_async(self, frame, offsets, version):
+        """Queues a snapshot for a background write, at most once per `persist_interval`."""
+        with self._lock:
+            self._pending = (frame, offsets, version)
+            if self._writer is not None and self._writer.is_alive():
+                return
+            self._writer = Thread(target=self._drain, daemon=True)
+            self._writer.start()
+
+    def _drain(self):
+        while True:
+            wait = self._last_write + self.persist_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            with self._lock:
+                job, self._pending = self._pending, None
+                if job is None:
+                    self._writer = None
+                    return
+            try:
+                self.write(*job)
+            except Exception as e:
+                self.stats['write_errors'] += 1
+                print(f"[SNAPSHOT FILE ERROR] Write failed | {repr(e)}")
+            self._last_write = time.monotonic()
+
+    def _prune(self, keep):
+        generations = sorted(
+            (entry for entry in os.listdir(self.directory) if entry.startswith('v') and entry != keep),
+            key=lambda entry: os.path.getmtime(os.path.join(self.directory, entry))
+        )
+        for entry in generations[:max(0, len(generations) - (KEEP_GENERATIONS - 1))]:
+            shutil.rmtree(os.path.join(self.directory, entry), ignore_errors=True)
+
+    # --- Reading ---
+    def generation(self):
+        """Name of the currently published generation, or None; cheap enough to check per request."""
+        try:
+            with open(os.path.join(self.directory, CURRENT_FILE)) as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def manifest(self, generation=None):
+        """The manifest of the current (or given) generation and its directory, or (None, None) if there is none."""
+        try:
+            if generation is None:
+                with open(os.path.join(self.directory, CURRENT_FILE)) as f:
+                    generation = f.read().strip()
+            target = os.path.join(self.directory, generation)
+            with open(os.path.join(target, 'manifest.json')) as f:
+                return json.load(f), target
+        except (OSError, ValueError):
+            return None, None
+
+    def load(self, mmap_mode='r', ignore_age=False, generation=None):
+        """
+        Returns (frame, offsets, manifest) for the current snapshot (or a specific, still kept
+        `generation`), or None when there is none, it comes from another source or format,
+        or (unless `ignore_age`) it is older than `max_age`.
+        """
+        start = time.perf_counter()
+        manifest, target = self.manifest(generation)
+        if manifest is None:
+            return None
+        if manifest.get('format') != FORMAT_VERSION or manifest.get('source') != self.source:
+            return None
+        if not ignore_age and self.max_age is not None and time.time() - manifest['written_at'] > self.max_age:
+            return None
+        try:
+            frame = pd.DataFrame({
+                entry['name']: _decode_column(target, entry, mmap_mode) for entry in manifest['columns']
+            })
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[SNAPSHOT FILE ERROR] Could not read {target} | {repr(e)}")
+            return None
+        offsets = {key: tuple(bounds) for key, bounds in manifest['offsets'].items()}
+        manifest['generation'] = os.path.basename(target)
+        self.stats['last_load_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        return frame, offsets, manifest
+
+
+class ChangeInbox:
+    """
+    Spool directory through which web workers hand sheet change notifications
+    to the sync process. Each message is one JSON file, written under a
+    temporary name and renamed into place so it is only seen complete;
+    `drain()` returns and removes them in arrival order.
+    """
+
+    def __init__(self, directory=os.path.join(SNAPSHOT_DIR, 'inbox')):
+        self.directory = directory
+
+    def post(self, message):
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{time.time_ns()}-{os.getpid()}.json"
+        temporary = os.path.join(self.directory, f".{name}")
+        with open(temporary, 'w') as f:
+            json.dump(message, f, default=str)
+        os.replace(temporary, os.path.join(self.directory, name))
+
+    def drain(self):
+        try:
+            names = sorted(name for name in os.listdir(self.directory) if not name.startswith('.'))
+        except OSError:
+            return []
+        messages = []
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path) as f:
+                    messages.append(json.load(f))
+            except (OSError, ValueError) as e:
+                print(f"[SNAPSHOT FILE ERROR] Dropping unreadable inbox message {name} | {repr(e)}")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return messages
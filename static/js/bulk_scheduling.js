@@ -0,0 +1,94 @@
+/**
+ * Bulk prescription upload: posts the file, then follows per-row progress over
+ * Socket.IO, falling back to polling the job status if the socket is unavailable.
+ */
+document.addEventListener('DOMContentLoaded', () => {
+    const form = document.getElementById('bulk-schedule-form');
+    if (!form) return;
+
+    let activeJobId = null;
+    let pollTimer = null;
+    const socket = typeof io === 'function' ? io() : null;
+
+    if (socket) {
+        socket.on('bulk_schedule_progress', (data) => {
+            if (data.job_id !== activeJobId) return;
+            renderCounts(data.counts);
+            data.rows.filter(row => row.status !== 'scheduled').forEach(addProblem);
+        });
+        socket.on('bulk_schedule_done', (summary) => {
+            if (summary.job_id !== activeJobId) return;
+            finishJob(summary);
+        });
+    }
+
+    form.addEventListener('submit', async (event) => {
+        event.preventDefault();
+        const fileInput = document.getElementById('bulk-file');
+        if (!fileInput.files.length) return;
+
+        const body = new FormData();
+        body.append('file', fileInput.files[0]);
+        setBusy(true);
+        document.getElementById('bulk-problems').innerHTML = '';
+        document.getElementById('bulk-progress').style.display = 'block';
+        renderCounts({ total: 0, done: 0 });
+
+        try {
+            const response = await fetch('/api/schedule/bulk', { method: 'POST', body });
+            const result = await response.json();
+            if (!response.ok) throw new Error(result.error || `HTTP ${response.status}`);
+            activeJobId = result.job_id;
+            renderCounts({ total: result.rows, done: 0 });
+            // Without a live socket, follow the job by polling its status
+            if (!socket || !socket.connected) pollTimer = setInterval(() => pollJob(result.job_id), 2000);
+        } catch (error) {
+            setBusy(false);
+            document.getElementById('bulk-progress').style.display = 'none';
+            showMessage(`❌ Bulk upload failed: ${error.message}`, 'danger');
+        }
+    });
+
+    async function pollJob(jobId) {
+        try {
+            const response = await fetch(`/api/schedule/bulk/${jobId}`);
+            if (!response.ok) return;
+            const summary = await response.json();
+            renderCounts(summary.counts);
+            if (summary.finished) finishJob(summary);
+        } catch (error) {
+            console.error('Error polling bulk job:', error);
+        }
+    }
+
+    function finishJob(summary) {
+        clearInterval(pollTimer);
+        activeJobId = null;
+        setBusy(false);
+        renderCounts(summary.counts);
+        document.getElementById('bulk-problems').innerHTML = '';
+        summary.problems.forEach(addProblem);
+        const { scheduled, invalid, failed } = summary.counts;
+        const type = invalid || failed ? 'warning' : 'success';
+        showMessage(`Bulk upload finished: ${scheduled} rows scheduled, ${invalid} invalid, ${failed} failed.`, type);
+    }
+
+    function renderCounts(counts) {
+        const percent = counts.total ? Math.round(100 * counts.done / counts.total) : 0;
+        document.getElementById('bulk-progress-bar').style.width = `${percent}%`;
+        document.getElementById('bulk-progress-text').textContent = `${counts.done} of ${counts.total} rows processed`;
+    }
+
+    function addProblem(row) {
+        const item = document.createElement('li');
+        item.className = row.status === 'failed' ? 'text-danger' : 'text-warning';
+        item.textContent = `Row ${row.row}: ${row.message}`;
+        document.getElementById('bulk-problems').appendChild(item);
+    }
+
+    function setBusy(busy) {
+        const button = document.getElementById('bulk-submit');
+        button.disabled = busy;
+        button.textContent = busy ? 'Scheduling…' : '⬆ Upload and Schedule';
+    }
+});
@@ -29,7 +29,8 @@ class Dashboard {
     }
 
     setupSocketConnection() {
-        this.socket = io();
+        const options = document.getElementById('socketio-options');
+        this.socket = io(options ? JSON.parse(options.textContent) : {});
         
         this.socket.on('connect', () => {
             console.log('Connected to real-time server.');
@@ -43,6 +44,10 @@ class Dashboard {
         });
         
         this.socket.on('filtered_data', (msg) => {
+            if (this.filterManager.isStale(msg.seq)) {
+                console.log('Discarded out-of-date filtered data.');
+                return;
+            }
             console.log('Received filtered data.');
             const filteredData = JSON.parse(msg.data);
             this.updateDashboard(filteredData);
@@ -93,10 +98,57 @@ class ChatWidget {
 
         this.isDragging = false;
         this.isMinimized = false;
+        this.socket = null;
+        this.activeReply = null;
     }
 
-    init() {
+    init(socket) {
+        this.socket = socket;
         this.addEventListeners();
+        if (this.socket) this.setupStreaming();
+    }
+
+    setupStreaming() {
+        // Replies stream in over Socket.IO; events for any request but the active one are ignored
+        const isActive = (msg) => this.activeReply && msg.request_id === this.activeReply.requestId;
+
+        this.socket.on('chat_token', (msg) => {
+            if (!isActive(msg)) return;
+            const reply = this.activeReply;
+            if (reply.element.classList.contains('loading')) {
+                reply.element.classList.remove('loading');
+                reply.element.textContent = '';
+            }
+            reply.element.textContent += msg.delta;
+            this.messages.scrollTop = this.messages.scrollHeight;
+        });
+
+        this.socket.on('chat_status', (msg) => {
+            if (!isActive(msg)) return;
+            const element = this.activeReply.element;
+            element.classList.remove('loading');
+            element.textContent = msg.status;
+        });
+
+        const finish = (msg) => {
+            if (!isActive(msg)) return;
+            const element = this.activeReply.element;
+            element.classList.remove('loading');
+            element.textContent = msg.answer;
+            this.messages.scrollTop = this.messages.scrollHeight;
+            this.activeReply = null;
+        };
+        this.socket.on('chat_done', finish);
+        this.socket.on('chat_error', finish);
+
+        // Stop generating when the user navigates away; the server also cancels on disconnect
+        window.addEventListener('pagehide', () => this.cancelReply());
+    }
+
+    cancelReply() {
+        if (!this.activeReply) return;
+        this.socket.emit('chat_cancel', { request_id: this.activeReply.requestId });
+        this.activeReply = null;
     }
 
     addEventListeners() {
@@ -167,6 +219,18 @@ class ChatWidget {
 
         const loadingIndicator = this.addMessage('loading', 'bot');
 
+        if (this.socket && this.socket.connected) {
+            // A new question replaces a reply that is still streaming
+            if (this.activeReply) {
+                this.activeReply.element.classList.remove('loading');
+                if (!this.activeReply.element.textContent) this.activeReply.element.textContent = '(cancelled)';
+            }
+            const requestId = `${Date.now()}-${Math.random().toString(36).slice(2, 8)}`;
+            this.activeReply = { requestId, element: loadingIndicator };
+            this.socket.emit('chat_message', { question, request_id: requestId });
+            return;
+        }
+
         try {
             const response = await fetch('/api/chat', {
                 method: 'POST',
@@ -198,5 +262,5 @@ window.addEventListener('DOMContentLoaded', (event) => {
 
     // Initialize the chat widget
     const chatWidget = new ChatWidget();
-    chatWidget.init();
+    chatWidget.init(dashboard.socket);
 });
@@ -9,9 +9,12 @@ class FilterManager {
             patientSearch: '',
             checkin: 'all',
             timeOfDay: 'all',
-            frequency: 'all'
+            frequency: 'all',
+            trendGranularity: 'day'
         };
         this.socket = null;
+        // Incremented per filter request; responses tagged with an older number are stale
+        this.requestSeq = 0;
     }
 
     init(socket) {
@@ -43,6 +46,7 @@ class FilterManager {
 
         document.getElementById('filter-patient-search').addEventListener('input', (e) => {
             this.filterState.patientSearch = e.target.value.trim();
+            this.updatePatientSuggestions(this.filterState.patientSearch);
             this.applyFilters();
         });
 
@@ -61,11 +65,42 @@ class FilterManager {
             this.applyFilters();
         });
 
+        const trendGranularity = document.getElementById('trend-granularity');
+        if (trendGranularity) {
+            trendGranularity.addEventListener('change', (e) => {
+                this.filterState.trendGranularity = e.target.value;
+                this.applyFilters();
+            });
+        }
+
         document.getElementById('clear-filters').addEventListener('click', () => {
             this.clearAllFilters();
         });
     }
 
+    updatePatientSuggestions(prefix) {
+        const datalist = document.getElementById('patient-suggestions');
+        if (!datalist) return;
+        if (!prefix) {
+            datalist.innerHTML = '';
+            return;
+        }
+
+        fetch(`/api/patients/search?q=${encodeURIComponent(prefix)}&limit=10`)
+            .then(response => response.json())
+            .then(patients => {
+                // Ignore suggestions for a prefix the user has already typed past
+                if (prefix !== this.filterState.patientSearch || !Array.isArray(patients)) return;
+                datalist.innerHTML = '';
+                patients.forEach(patient => {
+                    const option = document.createElement('option');
+                    option.value = patient;
+                    datalist.appendChild(option);
+                });
+            })
+            .catch(error => console.error('Patient search error:', error));
+    }
+
     initializeFilters(data) {
         if (!data || Object.keys(data).length === 0) return;
         
@@ -197,7 +232,9 @@ class FilterManager {
             patientSearch: '',
             checkin: 'all',
             timeOfDay: 'all',
-            frequency: 'all'
+            frequency: 'all',
+            // The trend's granularity is a view setting, not a filter, so clearing keeps it
+            trendGranularity: this.filterState.trendGranularity
         };
         
         document.getElementById('filter-date-range').value = 'all';
@@ -217,8 +254,10 @@ class FilterManager {
         
         console.log('Applying filters:', JSON.stringify(this.filterState, null, 2));
         
+        const seq = ++this.requestSeq;
+        
         if (this.socket && this.socket.connected) {
-            this.socket.emit('apply_filters', { filters: this.filterState });
+            this.socket.emit('apply_filters', { filters: this.filterState, seq: seq });
         } else {
             // Fallback to HTTP request if socket not connected
             fetch('/api/filter', {
@@ -228,6 +267,7 @@ class FilterManager {
             })
             .then(response => response.json())
             .then(data => {
+                if (this.isStale(seq)) return;
                 if (window.dashboard) {
                     window.dashboard.updateDashboard(data);
                 }
@@ -235,6 +275,11 @@ class FilterManager {
             .catch(error => console.error('Filter error:', error));
         }
     }
+
+    isStale(seq) {
+        // Untagged responses (e.g. from older servers) are always applied
+        return typeof seq === 'number' && seq < this.requestSeq;
+    }
 }
 
 window.FilterManager = FilterManager;
@@ -0,0 +1,20 @@
+"""
+Sheet sync process for multi-worker deployments.
+
+Polls the reminder tab, applies sheet changes forwarded by the web workers and
+publishes every new normalized snapshot to SNAPSHOT_DIR, which the workers map
+read-only. gunicorn.conf.py starts it alongside the workers; to run it by hand:
+
+    APP_ROLE=sync python sync_process.py
+"""
+import os
+
+os.environ.setdefault('APP_ROLE', 'sync')
+
+import app as dashboard_app
+
+if __name__ == '__main__':
+    if dashboard_app.APP_ROLE != 'sync':
+        raise SystemExit("sync_process.py must run with APP_ROLE=sync")
+    print(f"Sheet sync process started; publishing snapshots to {dashboard_app.snapshot_file.directory}")
+    dashboard_app.run_sheet_sync()
@@ -0,0 +1,34 @@
+# app.py patches the standard library for gevent on import; patch before any test module
+# imports socketio or threading-based helpers, so they all share the patched primitives.
+# openai's optional async backends probe `select` when imported, so openai comes first.
+import openai  # noqa: F401
+from gevent import monkey
+monkey.patch_all()
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# app.py reads its prompt files relative to the working directory
+os.chdir(ROOT)
+
+_data_dir = tempfile.mkdtemp(prefix='pharmopera-tests-')
+os.environ.update({
+    'OPENAI_API_KEY': 'test',
+    # Dashboards are computed in process; tests of the spawn pool create their own
+    'COMPUTE_POOL_WORKERS': '0',
+    'SNAPSHOT_DIR': os.path.join(_data_dir, 'snapshot'),
+    'DATA_DIR': _data_dir,
+    'SHEET_WEBHOOK_SECRET': 'test-webhook-secret',
+})
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    """app.py, imported once with the test configuration above."""
+    import app
+    return app
@@ -0,0 +1,90 @@
+import pytest
+
+from bulk_schedule import BulkJobRegistry, BulkScheduleJob, group_prescriptions, read_prescription_file
+
+CSV = b"""patient_name,phone,medication,dosage,frequency,duration
+Bola Ade,08031234567,Amoxicillin,500mg,every 8 hours,7 days
+Chinedu Okafor,08035550101,Metformin,500mg,twice daily,30 days
+Chinedu Okafor,08035550101,Lisinopril,10mg,once daily,30 days
+Funke Bello,08022223333,Ciprofloxacin,500mg,three times daily,5 days
+"""
+
+
+@pytest.fixture
+def bulk(app_module, monkeypatch):
+    """A bulk upload ready to run, with emits and queued webhooks recorded and a stub schedule per patient."""
+    app = app_module
+    groups = group_prescriptions(read_prescription_file('upload.csv', CSV))
+    job = BulkScheduleJob('job-1', '0801', 'upload.csv', 4, len(groups))
+    app.bulk_jobs.add(job)
+    emitted, queued = [], []
+    monkeypatch.setattr(app.socketio, 'emit', lambda event, data=None, to=None, **kwargs: emitted.append((event, data)))
+    monkeypatch.setattr(app, 'enqueue_scheduling_webhook', lambda schedules, owner=None: queued.append(schedules))
+    monkeypatch.setattr(app, 'prepare_bulk_schedule', lambda job, group: ({'p': {'id': group['patient']}}, []))
+    return app, job, groups, emitted, queued
+
+
+def done_event(emitted):
+    done = [data for event, data in emitted if event == 'bulk_schedule_done']
+    assert len(done) == 1
+    return done[0]
+
+
+def test_a_group_that_raises_is_failed_and_the_others_are_scheduled(bulk, monkeypatch):
+    app, job, groups, emitted, queued = bulk
+
+    def prepare(job, group):
+        if group['patient'] == 'Chinedu Okafor':
+            raise RuntimeError('model unavailable')
+        return {'p': {'id': group['patient']}}, []
+    monkeypatch.setattr(app, 'prepare_bulk_schedule', prepare)
+
+    app.run_bulk_schedule(job, groups)
+
+    summary = done_event(emitted)
+    assert summary['finished'] is True
+    assert summary['counts'] == {'total': 4, 'done': 4, 'scheduled': 2, 'invalid': 0, 'failed': 2}
+    assert [(problem['row'], problem['status']) for problem in summary['problems']] == [(3, 'failed'), (4, 'failed')]
+    assert 'model unavailable' in summary['problems'][0]['message']
+    assert sorted(schedule['p']['id'] for schedules in queued for schedule in schedules) == ['Bola Ade', 'Funke Bello']
+
+
+def test_an_unexpected_error_still_ends_the_job(bulk, monkeypatch):
+    app, job, groups, emitted, queued = bulk
+
+    def enqueue(schedules, owner=None):
+        raise TypeError('payload is not serializable')
+    monkeypatch.setattr(app, 'enqueue_scheduling_webhook', enqueue)
+
+    app.run_bulk_schedule(job, groups)
+
+    summary = done_event(emitted)
+    assert summary['counts']['failed'] == 4
+    assert all('Bulk scheduling stopped' in problem['message'] for problem in summary['problems'])
+    assert app.bulk_jobs.get('job-1') is job
+
+
+def test_running_jobs_are_never_evicted():
+    registry = BulkJobRegistry(keep_finished=2)
+    running = [BulkScheduleJob(f"running-{i}", '0801', 'a.csv', 1, 1) for i in range(5)]
+    for job in running:
+        registry.add(job)
+    for i in range(5):
+        finished = BulkScheduleJob(f"finished-{i}", '0801', 'a.csv', 1, 1)
+        registry.add(finished)
+        registry.finish(finished)
+
+    assert all(registry.get(job.job_id) is job for job in running)
+    assert [registry.get(f"finished-{i}") is not None for i in range(5)] == [False, False, False, True, True]
+    assert registry.stats()['running'] == 5
+
+
+def test_a_finished_job_stays_available():
+    registry = BulkJobRegistry(keep_finished=2)
+    job = BulkScheduleJob('job', '0801', 'a.csv', 1, 1)
+    registry.add(job)
+
+    registry.finish(job)
+
+    assert registry.get('job') is job
+    assert registry.stats()['running'] == 0
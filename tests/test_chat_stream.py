@@ -0,0 +1,181 @@
+import threading
+from http.server import ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+from openai import OpenAI
+
+import fake_llm_server
+from benchmark import synthetic_reminders
+from chat_stream import ChatStreams, stream_completion
+from reminder_store import ReminderStore
+
+
+class FakeStream:
+    """An iterable of chunks with the close() of an OpenAI stream."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.consumed = 0
+        self.closed = False
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            self.consumed += 1
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+def chunk(content=None, tool_calls=None, usage=None):
+    choices = [] if usage else [SimpleNamespace(delta=SimpleNamespace(content=content, tool_calls=tool_calls))]
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+def fragment(index, id=None, name=None, arguments=None):
+    return SimpleNamespace(index=index, id=id, function=SimpleNamespace(name=name, arguments=arguments))
+
+
+def test_stream_completion_passes_tokens_and_joins_the_message():
+    stream = FakeStream([chunk('Hel'), chunk('lo'), chunk(None), chunk(usage={'total_tokens': 7})])
+    tokens, usage = [], []
+
+    message = stream_completion(stream, threading.Event(), tokens.append, usage.append)
+
+    assert message == {'role': 'assistant', 'content': 'Hello'}
+    assert tokens == ['Hel', 'lo']
+    assert usage == [{'total_tokens': 7}]
+    assert stream.closed
+
+
+def test_stream_completion_assembles_tool_call_fragments():
+    stream = FakeStream([
+        chunk(tool_calls=[fragment(0, id='call_a', name='get_dashboard_data', arguments='{"fil')]),
+        chunk(tool_calls=[fragment(1, id='call_b', name='get_dashboard_data', arguments='{}')]),
+        chunk(tool_calls=[fragment(0, arguments='ters": {}}')]),
+    ])
+
+    message = stream_completion(stream, threading.Event(), lambda delta: None)
+
+    assert message == {'role': 'assistant', 'content': None, 'tool_calls': [
+        {'id': 'call_a', 'type': 'function', 'function': {'name': 'get_dashboard_data', 'arguments': '{"filters": {}}'}},
+        {'id': 'call_b', 'type': 'function', 'function': {'name': 'get_dashboard_data', 'arguments': '{}'}},
+    ]}
+
+
+def test_cancelled_stream_returns_none_and_is_closed():
+    cancelled = threading.Event()
+    stream = FakeStream([chunk('one'), chunk('two'), chunk('three')])
+
+    assert stream_completion(stream, cancelled, lambda delta: cancelled.set()) is None
+    assert stream.consumed == 2
+    assert stream.closed
+
+
+def test_a_new_reply_cancels_the_previous_one_of_its_session():
+    streams = ChatStreams()
+    first = streams.start('sid-1', 'r1')
+    other_session = streams.start('sid-2', 'r1')
+
+    second = streams.start('sid-1', 'r2')
+
+    assert first.is_set() and not second.is_set() and not other_session.is_set()
+    # Cancelling a request that is no longer the session's reply does nothing
+    assert streams.cancel('sid-1', 'r1') is False
+    assert streams.cancel('sid-1') is True and second.is_set()
+
+
+def test_overlapping_replies_share_a_history_lock_until_both_finish():
+    streams = ChatStreams()
+    streams.start('sid-1', 'r1')
+    lock = streams.history_lock('sid-1')
+    streams.start('sid-1', 'r2')
+
+    streams.finish('sid-1', 'r1', 'cancelled')
+    assert streams.history_lock('sid-1') is lock
+    streams.finish('sid-1', 'r2', 'completed')
+
+    with pytest.raises(KeyError):
+        streams.history_lock('sid-1')
+    stats = streams.stats()
+    assert stats['active'] == 0 and stats['started'] == 2
+    assert stats['completed'] == 1 and stats['cancelled'] == 1
+
+
+# --- Streaming replies through app.py against fake_llm_server.py ---
+@pytest.fixture
+def chat(app_module, monkeypatch):
+    """app.py talking to an in-process fake model, with one stored session; emits are recorded."""
+    app = app_module
+    server = ThreadingHTTPServer(('127.0.0.1', 0), fake_llm_server.FakeLLMHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(fake_llm_server, 'FAKE_LLM_TOKEN_DELAY', 0.001)
+    monkeypatch.setattr(app, 'client', OpenAI(api_key='fake', base_url=f"http://127.0.0.1:{server.server_port}/v1"))
+
+    store = ReminderStore.build(synthetic_reminders(60, 1, patients_per_pharmacy=10, seed=3), version=1)
+    monkeypatch.setattr(app, 'get_reminder_store', lambda: store)
+    session_id = 'chat-test-session'
+    app.app.session_interface.backend.set(session_id, app.app.session_interface.serializer.dumps(
+        {'phone_no': store.pharmacy_ids[0], 'conversation_history': app.new_conversation_history()}))
+
+    emitted, hooks = [], []
+
+    def emit(event, data=None, to=None, **kwargs):
+        emitted.append((event, data))
+        for hook in hooks:
+            hook(event)
+    monkeypatch.setattr(app.socketio, 'emit', emit)
+
+    def reply(question, on_emit=None):
+        """Runs the chat_message background task to completion and returns the events it emitted."""
+        emitted.clear()
+        hooks.clear()
+        cancelled = app.chat_streams.start('sid-chat', question)
+        if on_emit:
+            hooks.append(lambda event: on_emit(event, cancelled))
+        app.stream_chat_reply('sid-chat', question, store.pharmacy_ids[0], session_id, stored_history(), question, cancelled)
+        return list(emitted)
+
+    def stored_history():
+        values = app.app.session_interface.serializer.loads(app.app.session_interface.backend.get(session_id))
+        return values['conversation_history']
+
+    yield SimpleNamespace(reply=reply, history=stored_history, store=store)
+    server.shutdown()
+    server.server_close()
+
+
+def test_reply_is_streamed_and_saved_to_the_session(chat):
+    events = chat.reply('hello there')
+
+    tokens = ''.join(data['delta'] for event, data in events if event == 'chat_token')
+    assert tokens == 'This is a fake reply to: hello there'
+    assert events[-1] == ('chat_done', {'answer': tokens, 'request_id': 'hello there'})
+    assert chat.history()[-2:] == [{'role': 'user', 'content': 'hello there'}, {'role': 'assistant', 'content': tokens}]
+
+
+def test_dashboard_question_runs_the_tool_and_streams_its_summary(chat):
+    events = chat.reply('How many patients are pending?')
+
+    assert ('chat_status', {'status': 'Looking up your dashboard data...', 'request_id': 'How many patients are pending?'}) in events
+    event, data = events[-1]
+    assert event == 'chat_done' and data['answer'].startswith('Over the selected period you have')
+    user, call, tool, answer = chat.history()[-4:]
+    assert user['content'] == 'How many patients are pending?'
+    assert call['tool_calls'][0]['function']['name'] == 'get_dashboard_data'
+    # Every tool call in the saved history is answered
+    assert tool['role'] == 'tool' and tool['tool_call_id'] == call['tool_calls'][0]['id']
+    assert answer == {'role': 'assistant', 'content': data['answer']}
+
+
+def test_cancelled_reply_stops_streaming_and_keeps_only_the_question(chat):
+    def cancel_on_first_token(event, cancelled):
+        if event == 'chat_token':
+            cancelled.set()
+
+    events = chat.reply('tell me a long story', on_emit=cancel_on_first_token)
+
+    assert [event for event, data in events] == ['chat_token']
+    assert chat.history()[-1] == {'role': 'user', 'content': 'tell me a long story'}
@@ -0,0 +1,61 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from compute_pool import ComputePool, PoolBusy
+
+
+@pytest.fixture
+def pool(tmp_path):
+    # time.sleep stands in for a slow aggregation; a spawned worker needs nothing else to run it
+    pool = ComputePool(str(tmp_path), 'compute-pool-test', workers=1, max_queue=4, per_tenant=1, timeout=1)
+    # Start the worker outside the timed tasks
+    pool.run('warm-up', time.sleep, 0)
+    yield pool
+    pool.shutdown()
+
+
+def wait_for(condition, seconds=10):
+    deadline = time.monotonic() + seconds
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+def test_a_timed_out_task_keeps_its_tenant_slot_until_the_worker_finishes(pool):
+    with pytest.raises(PoolBusy, match='took longer than'):
+        pool.run('0801', time.sleep, 2)
+
+    stats = pool.stats()
+    assert stats['timed_out'] == 1
+    assert stats['in_flight'] == 1 and stats['tenants_in_flight'] == {'0801': 1}
+    # The tenant's only slot is still taken by the abandoned task
+    with pytest.raises(PoolBusy, match='compute limit'):
+        pool.run('0801', time.sleep, 0)
+
+    assert wait_for(lambda: pool.stats()['in_flight'] == 0)
+    assert pool.run('0801', time.sleep, 0) is None
+    assert pool.stats()['tenants_in_flight'] == {}
+
+
+def test_idle_tenants_are_forgotten(pool):
+    for tenant in ('0801', '0802', '0803'):
+        pool.run(tenant, time.sleep, 0)
+    with pytest.raises(ZeroDivisionError):
+        pool.run('0804', divmod, 1, 0)
+
+    stats = pool.stats()
+    assert stats['tenants_tracked'] == 0
+    assert stats['completed'] == 4 and stats['failed'] == 1
+
+
+def test_offloaded_work_that_times_out_is_not_redone_inline(app_module, monkeypatch, pool):
+    monkeypatch.setattr(app_module, 'compute_pool', pool)
+    inline = []
+
+    # run_offloaded calls task(store.generation, *args): here time.sleep(2)
+    with pytest.raises(PoolBusy):
+        app_module.run_offloaded('0801', SimpleNamespace(generation=2), time.sleep, (), lambda: inline.append(True))
+
+    assert inline == []
@@ -0,0 +1,70 @@
+import pandas as pd
+import pytest
+
+from benchmark import synthetic_reminders
+from dashboard_data import apply_filters, build_dashboard_data, trend_rollup_slice
+from reminder_store import ReminderStore, value_counts
+from rollups import AdherenceRollup, adherence_trend
+
+CHARTS = {'reminder_status': 'status', 'top_medications': 'medication_name', 'dosage_distribution': 'dosage'}
+
+
+def text_counts(series, top=None):
+    """The chart series as counted on the plain text column, before categoricals: ties by first appearance."""
+    counts = series.astype(str).value_counts()
+    return counts.nlargest(top) if top else counts
+
+
+@pytest.fixture(scope='module')
+def store():
+    # Small pharmacies, so many medications and dosages tie
+    return ReminderStore.build(synthetic_reminders(600, 6, patients_per_pharmacy=20, seed=4))
+
+
+def test_value_counts_breaks_ties_by_first_appearance():
+    series = pd.Series(['b', 'c', 'a', 'c', 'a', 'b', 'd'], dtype=pd.CategoricalDtype(['a', 'b', 'c', 'd', 'e']))
+
+    counts = value_counts(series)
+
+    assert list(counts.index) == ['b', 'c', 'a', 'd']
+    assert list(counts) == [2, 2, 2, 1]
+
+
+@pytest.mark.parametrize('filters', [None, {'frequency': 'Twice daily'}, {'dateRange': '30'}])
+def test_chart_order_matches_text_counts(store, filters):
+    ties = 0
+    for phone_no in store.pharmacy_ids:
+        frame = apply_filters(store.pharmacy_index(phone_no), filters) if filters else store.pharmacy_frame(phone_no)
+        data = build_dashboard_data(phone_no, store, filters)
+        if frame.empty:
+            continue
+        for chart, column in CHARTS.items():
+            expected = text_counts(frame[column], None if chart == 'reminder_status' else 5)
+            assert data[chart]['labels'] == list(expected.index), (phone_no, chart)
+            assert data[chart]['data'] == list(expected), (phone_no, chart)
+            ties += expected.duplicated().sum()
+    # The data must actually exercise tie-breaking
+    assert ties > 0
+
+
+@pytest.mark.parametrize('filters, expected', [
+    (None, (True, None, None)),
+    ({'dateRange': 'all', 'medication': 'all', 'trendGranularity': 'week'}, (True, None, None)),
+    ({'medication': 'Metformin'}, (True, 'medication_name', 'Metformin')),
+    ({'timeOfDay': 'morning'}, (True, 'time_category', 'Morning')),
+    ({'frequency': 'Twice daily', 'medication': 'Metformin'}, (False, None, None)),
+    ({'dateRange': '30'}, (False, None, None)),
+])
+def test_trend_rollup_slice(filters, expected):
+    assert trend_rollup_slice(filters) == expected
+
+
+@pytest.mark.parametrize('filters', [None, {'medication': 'Metformin'}, {'timeOfDay': 'evening'}, {'frequency': 'Once daily'}])
+def test_trend_from_rollups_matches_counting_rows(store, filters):
+    for phone_no in store.pharmacy_ids:
+        frame = apply_filters(store.pharmacy_index(phone_no), filters) if filters else store.pharmacy_frame(phone_no)
+        data = build_dashboard_data(phone_no, store, filters)
+        if frame.empty:
+            continue
+        assert trend_rollup_slice(filters)[0]
+        assert data['adherence_trend'] == adherence_trend(AdherenceRollup(frame, dimensions=()).counts(), 'day')
@@ -0,0 +1,198 @@
+"""
+Parity of the grouped drill-downs (drilldown.py) with the per-patient loop
+implementation /api/details used before them: every metric family, on
+synthetic ReminderData sheets, compared as the JSON records /api/details returns
+(columns, row order and values).
+
+The loops are kept here verbatim apart from taking `now` as a parameter; they
+error on missing timestamps and on empty selections, so the synthetic data has neither.
+"""
+import json
+
+import pandas as pd
+import pytest
+
+from adherence import ADHERENCE_LABELS, adherence_table
+from benchmark import synthetic_reminders
+from drilldown import get_drilldown
+from reminder_store import ReminderStore
+
+
+def legacy_details(pharmacy_df, metric, now):
+    """The drill-down tables as /api/details computed them with per-patient masks and iterrows."""
+    details_df = pd.DataFrame()
+
+    if metric == 'pending_reminders':
+        details_df = pharmacy_df[pharmacy_df['status'].isin(['pending', 'upcoming'])]
+        details_df = details_df[[
+            'patient_identifier', 'phone_number', 'medication_name', 'next_reminder_time'
+        ]].rename(columns={
+            'patient_identifier': 'Patient Name',
+            'phone_number': 'Phone Number',
+            'medication_name': 'Medication',
+            'next_reminder_time': 'Next Reminder'
+        })
+        details_df['Next Reminder'] = details_df['Next Reminder'].dt.strftime('%Y-%m-%d %I:%M %p')
+
+    elif metric == 'total_patients':
+        patient_list = []
+        for patient_id in pharmacy_df['patient_identifier'].unique():
+            patient_data = pharmacy_df[pharmacy_df['patient_identifier'] == patient_id]
+            patient_list.append({
+                'Patient Name': patient_id,
+                'Phone Number': patient_data['phone_number'].iloc[0] if len(patient_data) > 0 else 'N/A',
+                'Primary Medication': patient_data['medication_name'].iloc[0] if len(patient_data) > 0 else 'N/A',
+                'Total Reminders': len(patient_data)
+            })
+        details_df = pd.DataFrame(patient_list)
+
+    elif metric == 'adherence_rate':
+        patient_adherence = adherence_table(pharmacy_df, now=now)
+        details_df = pd.DataFrame({
+            'Patient Name': patient_adherence.index,
+            'Completed': patient_adherence['completed'].to_numpy(),
+            'Missed': patient_adherence['missed'].to_numpy(),
+            'Adherence Rate (%)': patient_adherence['rate'].round(1).to_numpy(),
+            'Category': [ADHERENCE_LABELS[level] for level in patient_adherence['level']]
+        }).sort_values('Adherence Rate (%)', ascending=False)
+
+    elif metric == 'reminders_sent':
+        patient_reminders = []
+        for patient_id in pharmacy_df['patient_identifier'].unique():
+            patient_data = pharmacy_df[pharmacy_df['patient_identifier'] == patient_id]
+            patient_reminders.append({
+                'Patient Name': patient_id,
+                'Total Reminders': len(patient_data),
+                'Latest Status': patient_data.iloc[-1]['status'] if len(patient_data) > 0 else 'N/A',
+                'Frequency': patient_data.iloc[0]['frequency'] if len(patient_data) > 0 else 'N/A',
+                'Last Reminder': patient_data['time_stamp'].max().strftime('%Y-%m-%d %H:%M') if len(patient_data) > 0 else 'N/A'
+            })
+        details_df = pd.DataFrame(patient_reminders).sort_values('Total Reminders', ascending=False)
+
+    elif metric.startswith('medication_'):
+        medication_name = metric.replace('medication_', '')
+        med_patients = pharmacy_df[pharmacy_df['medication_name'] == medication_name]
+        patient_med_details = []
+        for patient_id in med_patients['patient_identifier'].unique():
+            patient_data = med_patients[med_patients['patient_identifier'] == patient_id]
+            completed = (patient_data['status'] == 'completed').sum()
+            total = len(patient_data)
+            adherence_rate = (completed / total * 100) if total > 0 else 0
+            patient_med_details.append({
+                'Patient Name': patient_id,
+                'Dosage': patient_data.iloc[0]['dosage'],
+                'Frequency': patient_data.iloc[0]['frequency'],
+                'Adherence Rate (%)': round(adherence_rate, 1),
+                'Current Status': patient_data.iloc[-1]['status']
+            })
+        details_df = pd.DataFrame(patient_med_details).sort_values('Adherence Rate (%)', ascending=False)
+
+    elif metric.startswith('status_'):
+        status_name = metric.replace('status_', '').lower()
+        status_patients = pharmacy_df[pharmacy_df['status'] == status_name]
+        status_details = []
+        for _, row in status_patients.iterrows():
+            reminder_time = row['next_reminder_time']
+            days_in_status = (now - reminder_time).days if pd.notna(reminder_time) else 0
+            status_details.append({
+                'Patient Name': row['patient_identifier'],
+                'Medication': row['medication_name'],
+                'Due Time': reminder_time.strftime('%Y-%m-%d %H:%M') if pd.notna(reminder_time) else 'N/A',
+                'Days in Status': max(0, days_in_status),
+                'Phone Number': row['phone_number']
+            })
+        details_df = pd.DataFrame(status_details).sort_values('Days in Status', ascending=False)
+
+    elif metric.startswith('time_'):
+        time_slot = metric.replace('time_', '')
+        time_patients = pharmacy_df[pharmacy_df['time_category'] == time_slot]
+        time_details = []
+        for patient_id in time_patients['patient_identifier'].unique():
+            patient_data = time_patients[time_patients['patient_identifier'] == patient_id]
+            completed = (patient_data['status'] == 'completed').sum()
+            total = len(patient_data)
+            adherence_rate = (completed / total * 100) if total > 0 else 0
+            time_details.append({
+                'Patient Name': patient_id,
+                'Medication': patient_data.iloc[0]['medication_name'],
+                'Exact Time': patient_data.iloc[0]['reminderTime'],
+                'Adherence Rate (%)': round(adherence_rate, 1),
+                'Total Reminders': total
+            })
+        details_df = pd.DataFrame(time_details).sort_values('Adherence Rate (%)', ascending=False)
+
+    elif metric.startswith('completion_'):
+        completion_type = metric.replace('completion_', '')
+        if completion_type.lower() == 'upcoming':
+            upcoming_data = pharmacy_df[pharmacy_df['status'].isin(['pending', 'upcoming'])]
+            completion_details = []
+            for _, row in upcoming_data.iterrows():
+                due_time = row['next_reminder_time']
+                days_until = (due_time - now).days if pd.notna(due_time) else 0
+                completion_details.append({
+                    'Patient Name': row['patient_identifier'],
+                    'Medication': row['medication_name'],
+                    'Due Time': due_time.strftime('%Y-%m-%d %H:%M') if pd.notna(due_time) else 'N/A',
+                    'Days Until Due': max(0, days_until),
+                    'Frequency': row['frequency']
+                })
+            details_df = pd.DataFrame(completion_details).sort_values('Days Until Due')
+        elif completion_type.lower() == 'completed':
+            completed_data = pharmacy_df[pharmacy_df['status'] == 'completed']
+            completion_details = []
+            for _, row in completed_data.iterrows():
+                completion_time = row['time_stamp']
+                completion_details.append({
+                    'Patient Name': row['patient_identifier'],
+                    'Medication': row['medication_name'],
+                    'Completion Time': completion_time.strftime('%Y-%m-%d %H:%M') if pd.notna(completion_time) else 'N/A',
+                    'Frequency': row['frequency'],
+                    'Phone Number': row['phone_number']
+                })
+            details_df = pd.DataFrame(completion_details).sort_values('Completion Time', ascending=False)
+
+    return details_df
+
+
+def metrics_for(pharmacy_df):
+    """Every drill-down metric the dashboard links to for this pharmacy's data."""
+    metrics = ['total_patients', 'reminders_sent', 'pending_reminders', 'adherence_rate',
+               'completion_upcoming', 'completion_completed']
+    metrics += [f"medication_{name}" for name in pharmacy_df['medication_name'].unique()]
+    metrics += [f"time_{slot}" for slot in pharmacy_df['time_category'].unique()]
+    # Status links are lower-cased by the handler, so a capitalized one is checked too
+    metrics += [f"status_{status}" for status in pharmacy_df['status'].unique()] + ['status_Pending']
+    return metrics
+
+
+def records(df):
+    """The rows as /api/details serializes them."""
+    return json.loads(json.dumps(df.to_dict('records'), default=str))
+
+
+def differences(expected, actual):
+    """Where two record lists differ: columns, row count, then up to five rows."""
+    columns = lambda rows: list(rows[0]) if rows else []
+    if columns(expected) != columns(actual):
+        return [f"columns: {columns(expected)} (loop) != {columns(actual)} (grouped)"]
+    if len(expected) != len(actual):
+        return [f"row count: {len(expected)} (loop) != {len(actual)} (grouped)"]
+    return [f"row {i}: {a} (loop) != {b} (grouped)" for i, (a, b) in enumerate(zip(expected, actual)) if a != b][:5]
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_drilldowns_match_the_loop_implementation(seed):
+    now = pd.Timestamp.now(tz='UTC').floor('min')
+    store = ReminderStore.build(synthetic_reminders(2000, 2, patients_per_pharmacy=40, seed=seed))
+    found = {}
+    checked = 0
+    for phone_no in store.pharmacy_ids:
+        pharmacy_df = store.pharmacy_frame(phone_no)
+        for metric in metrics_for(pharmacy_df):
+            diffs = differences(records(legacy_details(pharmacy_df, metric, now)),
+                                records(get_drilldown(pharmacy_df, metric, now=now)))
+            checked += 1
+            if diffs:
+                found[f"{phone_no} {metric}"] = diffs
+    assert checked > 0
+    assert found == {}
@@ -0,0 +1,82 @@
+import json
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from quick_setup import parse_quick_setup
+
+NOW = datetime(2026, 1, 5, 10, 20)
+
+
+def test_well_formed_message_is_parsed():
+    schedule = parse_quick_setup(
+        "Alice Matthew | 0801 234 5678\n"
+        "Lisinopril 10mg, once daily, 30 days, take with food\n"
+        "Paracetamol: 500mg, every 6 hours, 5 days\n"
+        "Contact: SMS", NOW)
+
+    assert schedule == {
+        'a': 'med_reminder',
+        'p': {'id': 'Alice Matthew', 'c': 'SMS', 'ph': '+2348012345678'},
+        'f': {'check': 'no'},
+        'm': [
+            {'n': 'Lisinopril', 'd': '10mg', 'f': 'once daily', 't': '09:00 AM', 's': '2026-01-05',
+             'du': '30 days', 'i': 'take with food'},
+            {'n': 'Paracetamol', 'd': '500mg', 'f': 'every 6 hours', 't': '10:20 AM, 04:20 PM, 10:20 PM, 04:20 AM',
+             's': '2026-01-05', 'du': '5 days'},
+        ],
+    }
+
+
+@pytest.mark.parametrize('text', [
+    # Check-in dates are left to the model
+    "Alice Matthew | +2348012345678\nLisinopril 10mg, once daily, 30 days\nCheck-in: 2 days",
+    # The webhook needs a phone number, so email contacts go to the model, which asks for one
+    "Dayo Smith | dayo@example.com\nAtorvastatin 20mg, once daily, 3 months\nContact: Email",
+    "Dayo Smith | +2348012345678\nAtorvastatin 20mg, once daily, 3 months\nContact: Email",
+    # Free-form schedules and frequencies without a documented time rule
+    "Gbenga | 08011112222\nArtemether 80mg, 1 tablet 20 mins from now, then 8 hrs later, then 12 hourly for 3 days",
+    "Funke Bello | 08022223333\nCiprofloxacin 500mg, three times daily, 5 days",
+    "schedule amoxicillin 500mg three times a day for Halima, her number is 08044445555",
+])
+def test_messages_for_the_model_are_declined(text):
+    assert parse_quick_setup(text, NOW) is None
+
+
+QUICK_SETUP = "Bola Ade | 08031234567\nAmoxicillin 500mg, every 8 hours, 7 days, complete the course"
+
+
+@pytest.fixture
+def model(app_module, monkeypatch):
+    """Scheduling questions answered by a stub model; returns the list of calls it received."""
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        message = SimpleNamespace(content=json.dumps({'a': 'med_reminder', 'from': 'model'}))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+    monkeypatch.setattr(app_module, 'client', SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+    monkeypatch.setattr(app_module.schedule_cache, 'get_or_extract', lambda key, question, extract: (extract(), 'model'))
+    return calls
+
+
+def test_local_parsing_is_off_by_default(app_module, model):
+    assert app_module.QUICK_SETUP_LOCAL_PARSE is False
+    assert app_module.is_scheduling_question(QUICK_SETUP) is False
+
+    schedule = json.loads(app_module.extract_schedule_json('0801', QUICK_SETUP, []))
+
+    assert schedule['from'] == 'model'
+    assert len(model) == 1
+
+
+def test_local_parsing_when_enabled_skips_the_model(app_module, model, monkeypatch):
+    monkeypatch.setattr(app_module, 'QUICK_SETUP_LOCAL_PARSE', True)
+    assert app_module.is_scheduling_question(QUICK_SETUP) is True
+
+    schedule = json.loads(app_module.extract_schedule_json('0801', QUICK_SETUP, [], start_date='2026-02-01'))
+
+    assert schedule['p'] == {'id': 'Bola Ade', 'c': 'WhatsApp', 'ph': '+2348031234567'}
+    assert schedule['m'][0]['s'] == '2026-02-01'
+    assert model == []
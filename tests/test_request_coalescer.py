@@ -0,0 +1,104 @@
+import pytest
+
+from request_coalescer import RequestCoalescer
+
+
+class Recorder:
+    """compute/deliver callbacks that record their calls; `during_compute` runs inside compute (e.g. a newer submit)."""
+
+    def __init__(self, fail_on=(), fail_deliver_on=()):
+        self.computed = []
+        self.delivered = []
+        self.fail_on = set(fail_on)
+        self.fail_deliver_on = set(fail_deliver_on)
+        self.during_compute = {}
+
+    def compute(self, payload):
+        self.computed.append(payload)
+        hook = self.during_compute.pop(payload, None)
+        if hook:
+            hook()
+        if payload in self.fail_on:
+            raise RuntimeError(f"compute failed for {payload}")
+        return f"result {payload}"
+
+    def deliver(self, seq, result):
+        if seq in self.fail_deliver_on:
+            raise RuntimeError(f"deliver failed for {seq}")
+        self.delivered.append((seq, result))
+
+
+def test_requests_during_a_computation_collapse_into_the_newest():
+    coalescer = RequestCoalescer(debounce=0)
+    calls = Recorder()
+
+    def newer_requests():
+        assert coalescer.submit('sid', 2, 'b', calls.compute, calls.deliver) is False
+        assert coalescer.submit('sid', 3, 'c', calls.compute, calls.deliver) is False
+    calls.during_compute['a'] = newer_requests
+
+    assert coalescer.submit('sid', 1, 'a', calls.compute, calls.deliver) is True
+
+    assert calls.computed == ['a', 'c']
+    assert calls.delivered == [(3, 'result c')]
+    assert coalescer.stats()['coalesced'] == 1
+    assert coalescer.stats()['discarded_results'] == 1
+    assert coalescer.stats()['in_flight'] == 0
+
+
+def test_out_of_order_requests_are_ignored():
+    coalescer = RequestCoalescer(debounce=0)
+    calls = Recorder()
+
+    coalescer.submit('sid', 5, 'new', calls.compute, calls.deliver)
+    assert coalescer.submit('sid', 4, 'old', calls.compute, calls.deliver) is False
+
+    assert calls.delivered == [(5, 'result new')]
+    assert coalescer.stats()['out_of_order'] == 1
+
+
+def test_failed_computation_still_serves_the_newer_request():
+    coalescer = RequestCoalescer(debounce=0)
+    calls = Recorder(fail_on={'a'})
+    calls.during_compute['a'] = lambda: coalescer.submit('sid', 2, 'b', calls.compute, calls.deliver)
+
+    with pytest.raises(RuntimeError, match='compute failed for a'):
+        coalescer.submit('sid', 1, 'a', calls.compute, calls.deliver)
+
+    assert calls.delivered == [(2, 'result b')]
+    assert coalescer.stats()['failed'] == 1
+    # The slot is released, so the next request is led again
+    assert coalescer.submit('sid', 3, 'c', calls.compute, calls.deliver) is True
+    assert calls.delivered[-1] == (3, 'result c')
+
+
+def test_failed_delivery_still_serves_a_request_that_arrived_meanwhile():
+    coalescer = RequestCoalescer(debounce=0)
+    calls = Recorder(fail_deliver_on={1})
+
+    def deliver(seq, result):
+        if seq == 1:
+            coalescer.submit('sid', 2, 'b', calls.compute, calls.deliver)
+        calls.deliver(seq, result)
+
+    with pytest.raises(RuntimeError, match='deliver failed for 1'):
+        coalescer.submit('sid', 1, 'a', calls.compute, deliver)
+
+    assert calls.delivered == [(2, 'result b')]
+    assert coalescer.stats()['in_flight'] == 0
+
+
+def test_debounce_collapses_a_burst_before_computing():
+    calls = Recorder()
+    burst = [(2, 'b'), (3, 'c')]
+
+    def sleep(seconds):
+        # Requests that arrive while the leader waits out its first debounce
+        while burst:
+            coalescer.submit('sid', *burst.pop(0), calls.compute, calls.deliver)
+    coalescer = RequestCoalescer(debounce=0.05, sleep=sleep)
+
+    coalescer.submit('sid', 1, 'a', calls.compute, calls.deliver)
+
+    assert calls.computed == ['c']
+    assert calls.delivered == [(3, 'result c')]
@@ -0,0 +1,99 @@
+import os
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from session_store import ServerSideSession, ServerSideSessionInterface, session_backend
+
+
+@pytest.fixture(params=['memory://', 'sqlite'])
+def interface(request, tmp_path):
+    url = request.param if request.param == 'memory://' else f"sqlite:///{tmp_path / 'sessions.sqlite3'}"
+    return ServerSideSessionInterface(session_backend(url), max_bytes=4096)
+
+
+def stored(interface, sid):
+    data = interface.backend.get(sid)
+    return None if data is None else interface.serializer.loads(data)
+
+
+def test_modify_changes_only_the_stored_session(interface):
+    interface._store('sid-1', {'phone_no': '0801', 'conversation_history': []})
+
+    assert interface.modify('sid-1', lambda values: values.update(last_intent='general')) is True
+    assert interface.modify('missing', lambda values: values.update(last_intent='general')) is False
+
+    assert stored(interface, 'sid-1') == {'phone_no': '0801', 'conversation_history': [], 'last_intent': 'general'}
+    assert stored(interface, 'missing') is None
+
+
+def test_oversized_history_is_trimmed_to_fit(interface):
+    history = [{'role': 'system', 'content': 'You are a helpful assistant.'}]
+    for i in range(40):
+        history += [{'role': 'user', 'content': f"question {i} " + 'x' * 100}, {'role': 'assistant', 'content': 'y' * 100}]
+
+    assert interface._store('sid-1', {'phone_no': '0801', 'conversation_history': history}) is True
+
+    kept = stored(interface, 'sid-1')['conversation_history']
+    assert len(interface.backend.get('sid-1')) <= 4096
+    assert kept[0] == history[0] and kept[-2:] == history[-2:]
+    assert interface.stats()['oversized_saves'] == 1
+
+
+def test_a_session_that_cannot_fit_is_not_stored(interface):
+    assert interface._store('sid-1', {'blob': 'x' * 10000}) is False
+    assert stored(interface, 'sid-1') is None
+    assert interface.stats()['refused_saves'] == 1
+
+
+def test_regenerate_moves_the_session_to_a_new_id(interface):
+    interface._store('planted', {'phone_no': '0801'})
+    session = ServerSideSession({'phone_no': '0801'}, sid='planted')
+
+    interface.regenerate(session)
+
+    assert session.sid != 'planted' and session.new and session.modified
+    assert stored(interface, 'planted') is None
+
+
+def test_a_chat_turn_saved_while_the_handler_runs_is_kept(app_module, monkeypatch):
+    """
+    The reply task may save its turn before the chat_message handler returns (here it runs inside
+    the handler); the handler's own copy of the session must not overwrite it afterwards.
+    """
+    app = app_module
+
+    def start_background_task(target, *args):
+        if target is app.stream_chat_reply:
+            sid, request_id, phone_no, session_id, history, question, cancelled = args
+            app.save_chat_turn(session_id, [{'role': 'user', 'content': question}, {'role': 'assistant', 'content': 'Noted.'}])
+            app.chat_streams.finish(sid, request_id, 'completed')
+    monkeypatch.setattr(app.socketio, 'start_background_task', start_background_task)
+    monkeypatch.setattr(app, 'thread', SimpleNamespace(is_alive=lambda: True))
+    monkeypatch.setattr(app.webhook_queue, 'start', lambda spawn: None)
+
+    client = app.app.test_client()
+    with client.session_transaction() as session:
+        session['phone_no'] = 'pharmacy-session-test'
+        session['conversation_history'] = app.new_conversation_history()
+    socket = app.socketio.test_client(app.app, flask_test_client=client)
+    socket.emit('chat_message', {'question': 'hello there', 'request_id': 'r1'})
+    socket.disconnect()
+
+    with client.session_transaction() as session:
+        assert session['conversation_history'][-2:] == [{'role': 'user', 'content': 'hello there'},
+                                                        {'role': 'assistant', 'content': 'Noted.'}]
+        assert session['last_intent'] == 'general'
+
+
+def test_web_workers_keep_sessions_in_the_data_directory(tmp_path):
+    env = dict(os.environ, APP_ROLE='web', DATA_DIR=str(tmp_path / 'data'), SNAPSHOT_DIR=str(tmp_path / 'snapshot'))
+    env.pop('SESSION_STORE_URL', None)
+
+    # A fresh process, since app.py reads its configuration on import
+    output = subprocess.run([sys.executable, '-c', 'import openai, app; print(app.SESSION_STORE_URL)'],
+                            env=env, capture_output=True, text=True, timeout=120, check=True).stdout
+
+    assert output.strip().splitlines()[-1] == f"sqlite:///{tmp_path / 'data' / 'sessions.sqlite3'}"
@@ -0,0 +1,120 @@
+import json
+
+import pytest
+from google.oauth2.credentials import Credentials
+
+from benchmark import synthetic_reminders
+from dashboard_data import build_dashboard_data
+from sheet_sync import FakeSheetNotifier, IncrementalSheetSync
+from sheets_client import MockSheetsTransport, SheetsClientRegistry
+
+SECRET = 'test-webhook-secret'
+
+
+@pytest.fixture
+def sheet(app_module, monkeypatch):
+    """
+    The app's reminder tab served by a MockSheetsTransport and synced once, with one
+    connected client per pharmacy; Socket.IO emits and background tasks are recorded.
+    """
+    app = app_module
+    raw = synthetic_reminders(80, 2, patients_per_pharmacy=10, seed=1)
+    # Ids that stay text: reads through gspread numericise cells, so 0801... would come back as a number
+    raw['pharmacy_id'] = 'pharmacy-' + raw['pharmacy_id'].str[-1]
+    tabs = {app.REMINDER_TAB: [list(raw.columns)] + raw.astype(str).values.tolist()}
+    transport = MockSheetsTransport(tabs)
+    registry = SheetsClientRegistry(lambda: Credentials(token='test-token'), sheet_key='mock-sheet-key', transport=transport)
+    monkeypatch.setattr(app, 'sheets_registry', registry)
+    monkeypatch.setattr(app, 'reminder_sync', IncrementalSheetSync(registry.worksheet, app.REMINDER_TAB))
+    monkeypatch.setattr(app, 'SHEET_SYNC_MODE', 'incremental')
+
+    app.sheet_cache.put(app.REMINDER_TAB, app.reminder_sync.sync())
+    app.publish_reminder_changes()
+
+    emitted, tasks = [], []
+    monkeypatch.setattr(app.socketio, 'emit', lambda event, data=None, to=None, **kwargs: emitted.append((event, to, data)))
+    monkeypatch.setattr(app.socketio, 'start_background_task', lambda target, *args: tasks.append(target))
+    pharmacies = sorted(raw['pharmacy_id'].unique())
+    for pharmacy_id in pharmacies:
+        monkeypatch.setitem(app.connected_clients, f"sid-{pharmacy_id}", {'phone_no': pharmacy_id, 'filters': None})
+
+    client = app.app.test_client()
+    notifier = FakeSheetNotifier(client.post, tabs, secret=SECRET)
+    return {'app': app, 'raw': raw, 'transport': transport, 'notifier': notifier, 'client': client,
+            'pharmacies': pharmacies, 'emitted': emitted, 'tasks': tasks}
+
+
+def dashboards(emitted):
+    """sid -> dashboard data of the filtered_data events emitted."""
+    return {to: json.loads(data['data']) for event, to, data in emitted if event == 'filtered_data'}
+
+
+def test_appended_row_is_applied_and_pushed_to_its_pharmacy_only(sheet):
+    pharmacy_id = sheet['pharmacies'][0]
+    row = sheet['raw'][sheet['raw']['pharmacy_id'] == pharmacy_id].iloc[0].astype(str).tolist()
+    reads_before = sheet['transport'].count('/values/')
+
+    response = sheet['notifier'].append(sheet['app'].REMINDER_TAB, row)
+
+    assert response.status_code == 200
+    assert response.get_json() == {'status': 'applied', 'rows': 1, 'pharmacies_changed': 1}
+    # Applied from the payload without reading the sheet
+    assert sheet['transport'].count('/values/') == reads_before
+    pushed = dashboards(sheet['emitted'])
+    assert list(pushed) == [f"sid-{pharmacy_id}"]
+    store = sheet['app'].get_reminder_store()
+    assert len(store.pharmacy_frame(pharmacy_id)) == int((sheet['raw']['pharmacy_id'] == pharmacy_id).sum()) + 1
+    expected = build_dashboard_data(pharmacy_id, store, sheet['app'].DEFAULT_DASHBOARD_FILTERS)
+    assert pushed[f"sid-{pharmacy_id}"] == json.loads(json.dumps(expected, default=str))
+    assert sheet['tasks'] == []
+
+
+def test_edited_row_replaces_the_resident_row(sheet):
+    app = sheet['app']
+    pharmacy_id = sheet['raw']['pharmacy_id'].iloc[0]
+    row = sheet['raw'].iloc[0].astype(str).tolist()
+    row[sheet['raw'].columns.get_loc('medication_name')] = 'Azithromycin'
+
+    response = sheet['notifier'].edit(app.REMINDER_TAB, 2, row)
+
+    assert response.get_json()['status'] == 'applied'
+    frame = app.get_reminder_store().pharmacy_frame(pharmacy_id)
+    assert len(frame) == int((sheet['raw']['pharmacy_id'] == pharmacy_id).sum())
+    assert 'Azithromycin' in set(frame['medication_name'].astype(str))
+    assert list(dashboards(sheet['emitted'])) == [f"sid-{pharmacy_id}"]
+
+
+def test_rows_below_a_gap_fall_back_to_a_sync(sheet):
+    app = sheet['app']
+    row = sheet['raw'].iloc[0].astype(str).tolist()
+
+    response = sheet['notifier'].notify(app.REMINDER_TAB, len(sheet['raw']) + 5, [row])
+
+    assert response.status_code == 202
+    assert response.get_json() == {'status': 'resync'}
+    assert sheet['tasks'] == [app.refresh_and_publish]
+    assert dashboards(sheet['emitted']) == {}
+
+
+@pytest.mark.parametrize('values', [
+    'not rows', [], [None], ['a row as text'], [[{'cell': 1}]], [[None] * 3], [['x'] * 40],
+])
+def test_malformed_rows_are_rejected(sheet, values):
+    response = sheet['client'].post('/api/sheet-webhook', json={'tab': sheet['app'].REMINDER_TAB, 'start_row': 2, 'values': values},
+                                    headers={'X-Sheet-Webhook-Token': SECRET})
+
+    assert response.status_code == 400
+    assert dashboards(sheet['emitted']) == {} and sheet['tasks'] == []
+
+
+def test_webhook_requires_the_secret(sheet):
+    response = sheet['client'].post('/api/sheet-webhook', json={'tab': 'ReminderData', 'start_row': 2, 'values': [['x']]},
+                                    headers={'X-Sheet-Webhook-Token': 'wrong'})
+
+    assert response.status_code == 401
+
+
+def test_other_tabs_are_invalidated(sheet):
+    response = sheet['notifier'].notify('Users', 2, [['0801', 'abc', 'Ada Pharmacy']])
+
+    assert response.get_json() == {'status': 'invalidated'}
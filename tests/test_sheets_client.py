@@ -0,0 +1,92 @@
+import pytest
+from google.oauth2.credentials import Credentials
+
+from sheet_sync import IncrementalSheetSync
+from sheets_client import MockSheetsTransport, SheetsClientRegistry
+
+HEADER = ['pharmacy_id', 'patient_identifier', 'medication_name', 'status']
+TABS = {
+    'ReminderData': [HEADER, ['0801', 'Ada', 'Amoxicillin', 'completed'], ['0802', 'Bayo', 'Metformin', 'pending']],
+    'Users': [['phone_no', 'unique_code', 'pharm_name'], ['0801', 'abc', 'Ada Pharmacy']],
+}
+METADATA_PATH = '/v4/spreadsheets/mock-sheet-key'
+
+
+@pytest.fixture
+def transport():
+    return MockSheetsTransport({title: [list(row) for row in rows] for title, rows in TABS.items()})
+
+
+def make_registry(transport, **kwargs):
+    """A registry over the mock transport, and the list of credentials it built."""
+    built = []
+
+    def credentials():
+        built.append(Credentials(token='test-token'))
+        return built[-1]
+    return SheetsClientRegistry(credentials, transport=transport, **kwargs), built
+
+
+def metadata_requests(transport):
+    return sum(1 for method, path in transport.requests if path == METADATA_PATH)
+
+
+def test_polls_reuse_client_spreadsheet_and_worksheet(transport):
+    registry, credentials = make_registry(transport, sheet_key='mock-sheet-key')
+
+    first = registry.worksheet('ReminderData').get_all_records()
+    metadata_after_first_poll = metadata_requests(transport)
+    for _ in range(4):
+        assert registry.worksheet('ReminderData').get_all_records() == first
+
+    assert len(first) == 2
+    assert len(credentials) == 1
+    assert registry.stats == {'authorizations': 1, 'spreadsheet_opens': 1, 'worksheet_lookups': 1}
+    # Later polls only read values: no Drive lookup and no further spreadsheet metadata
+    assert transport.count('/drive/') == 0
+    assert metadata_requests(transport) == metadata_after_first_poll
+    assert transport.count('/values/') == 5
+
+
+def test_spreadsheet_opened_by_name_is_reopened_by_key(transport):
+    registry, credentials = make_registry(transport, sheet_name='patient_reminder')
+
+    registry.worksheet('ReminderData').get_all_records()
+    registry.worksheet('Users').get_all_records()
+    assert transport.count('/drive/') == 1
+
+    registry.reset()
+    registry.worksheet('ReminderData').get_all_records()
+
+    # The re-open after a reset goes straight to the resolved key
+    assert transport.count('/drive/') == 1
+    assert len(credentials) == 2
+    assert registry.stats == {'authorizations': 2, 'spreadsheet_opens': 2, 'worksheet_lookups': 3}
+
+
+def test_resetting_one_tab_keeps_the_other_handles(transport):
+    registry, _ = make_registry(transport, sheet_key='mock-sheet-key')
+    users = registry.worksheet('Users')
+    registry.worksheet('ReminderData')
+
+    registry.reset('ReminderData')
+
+    assert registry.worksheet('Users') is users
+    registry.worksheet('ReminderData')
+    assert registry.stats == {'authorizations': 1, 'spreadsheet_opens': 1, 'worksheet_lookups': 3}
+
+
+def test_incremental_polls_share_the_worksheet_and_only_read_new_rows(transport):
+    registry, _ = make_registry(transport, sheet_key='mock-sheet-key')
+    sync = IncrementalSheetSync(registry.worksheet, 'ReminderData', full_sync_interval=3600)
+
+    assert len(sync.sync()) == 2
+    transport.tabs['ReminderData'].append(['0801', 'Chi', 'Lisinopril', 'upcoming'])
+    frame = sync.sync()
+    sync.sync()
+
+    assert frame['patient_identifier'].tolist() == ['Ada', 'Bayo', 'Chi']
+    assert sync.stats == {'full_syncs': 1, 'incremental_syncs': 2, 'rows_appended': 1}
+    assert registry.stats['worksheet_lookups'] == 1
+    assert [path for method, path in transport.requests if '/values/' in path][1:] == [
+        f"{METADATA_PATH}/values/'ReminderData'!A4:D", f"{METADATA_PATH}/values/'ReminderData'!A5:D"]
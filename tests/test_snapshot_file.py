@@ -0,0 +1,117 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+from benchmark import synthetic_reminders
+from dashboard_data import build_dashboard_data
+from message_queue import InProcessManager, queue_options
+from reminder_store import ReminderStore
+from snapshot_file import ChangeInbox, SnapshotFile
+
+SOURCE = 'mock-sheet-key/ReminderData'
+
+
+@pytest.fixture
+def store():
+    return ReminderStore.build(synthetic_reminders(300, 3, patients_per_pharmacy=15, seed=2), version=7)
+
+
+def test_a_written_snapshot_loads_in_another_process_unchanged(tmp_path, store):
+    SnapshotFile(str(tmp_path), source=SOURCE).write(store.frame, store.offsets, store.version)
+
+    # A web worker only shares the directory with the sync process
+    frame, offsets, manifest = SnapshotFile(str(tmp_path), source=SOURCE).load()
+
+    pd.testing.assert_frame_equal(frame, store.frame)
+    assert offsets == store.offsets
+    assert manifest['version'] == 7 and manifest['rows'] == len(store.frame)
+    loaded = ReminderStore(frame, version=manifest['version'], offsets=offsets, generation=manifest['generation'])
+    for phone_no in store.pharmacy_ids:
+        assert build_dashboard_data(phone_no, loaded) == build_dashboard_data(phone_no, store)
+
+
+def test_numeric_columns_are_memory_mapped(tmp_path, store):
+    snapshot = SnapshotFile(str(tmp_path), source=SOURCE)
+    snapshot.write(store.frame, store.offsets, store.version)
+    manifest, target = snapshot.manifest()
+
+    numeric = [entry for entry in manifest['columns'] if entry['kind'] in ('numeric', 'datetime')]
+    assert numeric
+    for entry in numeric:
+        assert isinstance(np.load(os.path.join(target, entry['file']), mmap_mode='r'), np.memmap)
+
+
+def test_snapshots_from_another_sheet_or_too_old_are_not_served(tmp_path, store):
+    SnapshotFile(str(tmp_path), source=SOURCE).write(store.frame, store.offsets, store.version)
+
+    assert SnapshotFile(str(tmp_path), source='other-sheet/ReminderData').load() is None
+    stale = SnapshotFile(str(tmp_path), source=SOURCE, max_age=0)
+    time.sleep(0.01)
+    assert stale.load() is None
+    assert stale.load(ignore_age=True) is not None
+
+
+def test_a_new_write_replaces_the_current_generation_and_keeps_the_previous_one(tmp_path, store):
+    snapshot = SnapshotFile(str(tmp_path), source=SOURCE)
+    first = snapshot.write(store.frame, store.offsets, 1)['generation']
+    second = snapshot.write(store.frame.iloc[:10], {}, 2)['generation']
+
+    assert snapshot.generation() == second
+    assert len(snapshot.load()[0]) == 10
+    # A reader that resolved the previous generation can still finish loading it
+    assert snapshot.load(generation=first)[2]['version'] == 1
+
+    snapshot.write(store.frame, store.offsets, 3)
+    assert snapshot.load(generation=first) is None
+    assert sorted(entry for entry in os.listdir(tmp_path) if entry.startswith('v')) == sorted([second, snapshot.generation()])
+
+
+def test_missing_snapshot_loads_as_none(tmp_path):
+    snapshot = SnapshotFile(str(tmp_path / 'missing'), source=SOURCE)
+
+    assert snapshot.generation() is None
+    assert snapshot.load() is None
+
+
+def test_inbox_drains_messages_in_arrival_order_once(tmp_path):
+    inbox = ChangeInbox(str(tmp_path / 'inbox'))
+    assert inbox.drain() == []
+
+    inbox.post({'start_row': 5, 'values': [['a']]})
+    inbox.post({'resync': True})
+    # A message still being written is not picked up
+    (tmp_path / 'inbox' / '.partial.json').write_text('{')
+
+    assert inbox.drain() == [{'start_row': 5, 'values': [['a']]}, {'resync': True}]
+    assert inbox.drain() == []
+
+
+def test_unreadable_inbox_messages_are_dropped(tmp_path):
+    inbox = ChangeInbox(str(tmp_path))
+    (tmp_path / '1-1.json').write_text('not json')
+    inbox.post({'resync': True})
+
+    assert inbox.drain() == [{'resync': True}]
+    assert os.listdir(tmp_path) == []
+
+
+def test_in_process_queue_fans_messages_out_to_every_worker():
+    workers = [queue_options('memory://', channel='test-fan-out')['client_manager'] for _ in range(2)]
+    publisher = InProcessManager(channel='test-fan-out', write_only=True)
+    other_channel = InProcessManager(channel='another-app')
+
+    publisher._publish({'method': 'emit', 'event': 'filtered_data'})
+
+    # Every subscribed worker receives the message once, including the one that would have emitted it
+    for manager in workers:
+        assert next(manager._listen()) == {'method': 'emit', 'event': 'filtered_data'}
+        assert manager._inbox.empty()
+    assert other_channel._inbox.empty()
+
+
+def test_queue_options():
+    assert queue_options(None) == {}
+    assert isinstance(queue_options('memory://')['client_manager'], InProcessManager)
+    assert queue_options('redis://localhost:6379/0') == {'message_queue': 'redis://localhost:6379/0', 'channel': 'flask-socketio'}
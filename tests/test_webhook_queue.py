@@ -0,0 +1,93 @@
+from types import SimpleNamespace
+
+import pytest
+
+from webhook_queue import WebhookQueue, idempotency_key
+
+URL = 'https://hooks.example.com/schedule'
+
+
+class FakeSession:
+    """Answers POSTs with the queued status codes (200 once they run out) and records them."""
+
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.posts = []
+
+    def post(self, url, data=None, timeout=None, headers=None):
+        self.posts.append((url, data, headers['Idempotency-Key']))
+        status = self.statuses.pop(0) if self.statuses else 200
+        return SimpleNamespace(ok=status < 400, status_code=status, text='')
+
+
+@pytest.fixture
+def session():
+    return FakeSession()
+
+
+@pytest.fixture
+def queue(tmp_path, session):
+    return WebhookQueue(str(tmp_path / 'webhooks.sqlite3'), retry_base=0, session=session)
+
+
+def deliver_due(queue):
+    """Delivers every due job, as the sender tasks would; returns how many were attempted."""
+    attempted = 0
+    while (job := queue._claim()) is not None:
+        queue._deliver(job)
+        attempted += 1
+    return attempted
+
+
+def test_a_job_waiting_to_be_sent_is_not_queued_twice(queue, session):
+    key = idempotency_key({'p': 'Bola'})
+    first = queue.enqueue(URL, [{'contact': 'Bola'}], key, owner='0801')
+
+    second = queue.enqueue(URL, [{'contact': 'Bola'}], key, owner='0801')
+
+    assert second == {'id': first['id'], 'status': 'pending', 'duplicate': True}
+    assert deliver_due(queue) == 1
+    assert len(session.posts) == 1
+
+
+def test_a_delivered_job_is_sent_again_when_resubmitted(queue, session):
+    key = idempotency_key({'p': 'Bola'})
+    first = queue.enqueue(URL, [{'contact': 'Bola'}], key, owner='0801')
+    deliver_due(queue)
+
+    again = queue.enqueue(URL + '?v=2', [{'contact': 'Bola', 'note': 'again'}], key, owner='0802')
+
+    assert again == {'id': first['id'], 'status': 'pending', 'duplicate': False}
+    assert deliver_due(queue) == 1
+    assert session.posts[-1] == (URL + '?v=2', '[{"contact": "Bola", "note": "again"}]', key)
+    stats = queue.stats()
+    assert stats['delivered'] == 2 and stats['duplicates'] == 0
+    assert stats['queued']['sent'] == 1
+
+
+def test_failed_deliveries_are_retried_then_dead_lettered(tmp_path):
+    session = FakeSession([503, 400])
+    queue = WebhookQueue(str(tmp_path / 'webhooks.sqlite3'), retry_base=0, session=session)
+    job = queue.enqueue(URL, [{'contact': 'Bola'}], 'key-1', owner='0801')
+
+    assert deliver_due(queue) == 2
+
+    dead = queue.dead_letters(owner='0801')
+    assert [(letter['id'], letter['attempts'], letter['last_error']) for letter in dead] == [(job['id'], 2, 'HTTP 400: ')]
+    assert queue.dead_letters(owner='0802') == []
+    assert queue.stats()['retries'] == 1
+
+
+def test_a_dead_job_is_revived_by_a_retry_or_a_resubmission(tmp_path):
+    session = FakeSession([400, 400])
+    queue = WebhookQueue(str(tmp_path / 'webhooks.sqlite3'), session=session)
+    job = queue.enqueue(URL, [{'contact': 'Bola'}], 'key-1', owner='0801')
+    deliver_due(queue)
+
+    assert queue.retry(job['id'], owner='0802') is False
+    assert queue.retry(job['id'], owner='0801') is True
+    deliver_due(queue)
+    assert queue.enqueue(URL, [{'contact': 'Bola'}], 'key-1', owner='0801')['duplicate'] is False
+
+    assert deliver_due(queue) == 1
+    assert queue.stats()['queued'] == {'pending': 0, 'sending': 0, 'sent': 1, 'dead': 0}
@@ -0,0 +1,269 @@
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+from threading import Event, Lock
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# --- Outbound Webhook Queue Configuration ---
+# Directory for state that must outlive the process (unlike the snapshot cache); mount persistent storage here
+DATA_DIR = os.environ.get('DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
+WEBHOOK_QUEUE_PATH = os.environ.get('WEBHOOK_QUEUE_PATH', os.path.join(DATA_DIR, 'webhooks.sqlite3'))
+# Deliveries in flight at once per process; also the keep-alive connections kept per host
+WEBHOOK_CONCURRENCY = int(os.environ.get('WEBHOOK_CONCURRENCY', 4))
+# Seconds to connect to and hear back from the webhook before the attempt counts as failed
+WEBHOOK_TIMEOUT = float(os.environ.get('WEBHOOK_TIMEOUT', 10))
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', 8))
+# Retry delays double from the base up to the cap (seconds), with jitter
+WEBHOOK_RETRY_BASE = float(os.environ.get('WEBHOOK_RETRY_BASE', 2))
+WEBHOOK_RETRY_MAX = float(os.environ.get('WEBHOOK_RETRY_MAX', 600))
+# Seconds between idle checks for due retries and for jobs enqueued by other processes
+WEBHOOK_QUEUE_POLL_INTERVAL = float(os.environ.get('WEBHOOK_QUEUE_POLL_INTERVAL', 5))
+# Delivered jobs are kept this long (seconds) for inspection; sending the same schedule again re-queues it
+WEBHOOK_QUEUE_RETENTION = float(os.environ.get('WEBHOOK_QUEUE_RETENTION', 7 * 24 * 3600))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS webhook_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    owner TEXT,
+    url TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS webhook_jobs_due ON webhook_jobs (status, next_attempt_at);
+"""
+STATUSES = ('pending', 'sending', 'sent', 'dead')
+
+
+def idempotency_key(value):
+    """Stable key for a JSON-serializable value (e.g. a schedule JSON): equal content, equal key."""
+    return hashlib.sha256(json.dumps(value, sort_keys=True, separators=(',', ':'), default=str).encode()).hexdigest()
+
+
+class WebhookQueue:
+    """
+    Durable outbound webhook queue in SQLite, drained by background senders.
+
+    `enqueue` only writes the job, so callers return straight away. Up to
+    `concurrency` sender tasks per process claim due jobs and POST them over one
+    pooled keep-alive session, sending the job's key as the Idempotency-Key header.
+    Timeouts, connection errors, 429 and 5xx responses are retried with
+    exponential backoff; other 4xx responses, or running out of attempts, move
+    the job to the dead letters, from where it can be retried. A claimed job
+    is leased for twice the request timeout, so jobs left behind by a crashed process
+    are picked up again. Several processes may share the database file.
+    """
+
+    def __init__(self, path=WEBHOOK_QUEUE_PATH, concurrency=WEBHOOK_CONCURRENCY, timeout=WEBHOOK_TIMEOUT,
+                 max_attempts=WEBHOOK_MAX_ATTEMPTS, retry_base=WEBHOOK_RETRY_BASE, retry_max=WEBHOOK_RETRY_MAX,
+                 poll_interval=WEBHOOK_QUEUE_POLL_INTERVAL, retention=WEBHOOK_QUEUE_RETENTION, session=None):
+        self.path = path
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.poll_interval = poll_interval
+        self.retention = retention
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=concurrency)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self._session = session
+        self._wake = Event()
+        self._lock = Lock()
+        self._started = False
+        self._enqueued = 0
+        self._duplicates = 0
+        self._delivered = 0
+        self._retries = 0
+        self._dead = 0
+        self._last_error = None
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+        if os.path.abspath(path).startswith(os.path.join(os.path.abspath(tempfile.gettempdir()), '')):
+            print(f"[WEBHOOK QUEUE] {path} is in the temp directory, so queued webhooks may not survive a restart; "
+                  "set WEBHOOK_QUEUE_PATH or DATA_DIR to persistent storage")
+
+    @contextmanager
+    def _connect(self):
+        """A connection whose changes are committed on success and rolled back on error."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def start(self, spawn):
+        """Starts the sender tasks once, using `spawn(target)` (e.g. socketio.start_background_task)."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for _ in range(self.concurrency):
+            spawn(self._run)
+
+    def enqueue(self, url, payload, key, owner=None):
+        """
+        Queues `payload` (JSON-serializable) for a POST to `url`. Returns {'id', 'status', 'duplicate'};
+        a job still waiting or being sent under `key` is not queued again, while a delivered or dead
+        one is queued afresh (the key is unique, so its row is reused).
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT id, status FROM webhook_jobs WHERE idempotency_key = ?', (key,)).fetchone()
+            if row is None:
+                cursor = conn.execute(
+                    'INSERT INTO webhook_jobs (idempotency_key, owner, url, payload, status, next_attempt_at, created_at, updated_at) '
+                    "VALUES (?, ?, ?, ?, 'pending', ?, ?, ?)",
+                    (key, owner, url, json.dumps(payload), now, now, now))
+                job = {'id': cursor.lastrowid, 'status': 'pending', 'duplicate': False}
+            elif row['status'] in ('sent', 'dead'):
+                self._revive(conn, row['id'], now)
+                conn.execute('UPDATE webhook_jobs SET owner = ?, url = ?, payload = ?, created_at = ? WHERE id = ?',
+                             (owner, url, json.dumps(payload), now, row['id']))
+                job = {'id': row['id'], 'status': 'pending', 'duplicate': False}
+            else:
+                job = {'id': row['id'], 'status': row['status'], 'duplicate': True}
+        with self._lock:
+            if job['duplicate']:
+                self._duplicates += 1
+            else:
+                self._enqueued += 1
+        if not job['duplicate']:
+            self._wake.set()
+        return job
+
+    @staticmethod
+    def _revive(conn, job_id, now):
+        conn.execute("UPDATE webhook_jobs SET status = 'pending', attempts = 0, next_attempt_at = ?, last_error = NULL, "
+                     "updated_at = ? WHERE id = ?", (now, now, job_id))
+
+    def _claim(self):
+        """Leases the most overdue job (or one whose sender's lease ran out) and returns it, or None."""
+        now = time.time()
+        with self._connect() as conn:
+            rows = conn.execute(
+                "UPDATE webhook_jobs SET status = 'sending', attempts = attempts + 1, next_attempt_at = ?, updated_at = ? "
+                'WHERE id = (SELECT id FROM webhook_jobs WHERE status IN (\'pending\', \'sending\') AND next_attempt_at <= ? '
+                'ORDER BY next_attempt_at LIMIT 1) '
+                'RETURNING id, idempotency_key, url, payload, attempts',
+                (now + self.timeout * 2, now, now)).fetchall()
+        return rows[0] if rows else None
+
+    def _next_due_in(self):
+        with self._connect() as conn:
+            row = conn.execute("SELECT MIN(next_attempt_at) FROM webhook_jobs WHERE status IN ('pending', 'sending')").fetchone()
+        if row[0] is None:
+            return self.poll_interval
+        return min(self.poll_interval, max(0.0, row[0] - time.time()))
+
+    def _run(self):
+        while True:
+            try:
+                # Cleared before looking for work, so an enqueue after the claim finds nothing still wakes the wait
+                self._wake.clear()
+                job = self._claim()
+                if job is None:
+                    self._wake.wait(self._next_due_in())
+                    self._prune()
+                    continue
+                self._deliver(job)
+            except sqlite3.Error as e:
+                print(f"[WEBHOOK QUEUE ERROR] {e}")
+                time.sleep(self.poll_interval)
+
+    def _deliver(self, job):
+        try:
+            response = self._session.post(job['url'], data=job['payload'], timeout=self.timeout, headers={
+                'Content-Type': 'application/json', 'Idempotency-Key': job['idempotency_key']})
+            if response.ok:
+                self._finish(job, 'sent')
+                print(f"Webhook response: {response.status_code} (job {job['id']})")
+                return
+            error = f"HTTP {response.status_code}: {response.text[:200]}"
+            retryable = response.status_code == 429 or response.status_code >= 500
+        except requests.exceptions.RequestException as e:
+            error, retryable = str(e), True
+
+        print(f"[WEBHOOK ERROR] job {job['id']} attempt {job['attempts']}: {error}")
+        if retryable and job['attempts'] < self.max_attempts:
+            delay = min(self.retry_max, self.retry_base * 2 ** (job['attempts'] - 1))
+            self._finish(job, 'pending', error, time.time() + delay * random.uniform(0.5, 1.0))
+        else:
+            self._finish(job, 'dead', error)
+
+    def _finish(self, job, status, error=None, next_attempt_at=None):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('UPDATE webhook_jobs SET status = ?, last_error = ?, next_attempt_at = ?, updated_at = ? WHERE id = ?',
+                         (status, error, next_attempt_at or now, now, job['id']))
+        with self._lock:
+            if status == 'sent':
+                self._delivered += 1
+            elif status == 'pending':
+                self._retries += 1
+            else:
+                self._dead += 1
+            if error:
+                self._last_error = error
+
+    def _prune(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM webhook_jobs WHERE status = 'sent' AND updated_at < ?", (time.time() - self.retention,))
+
+    def dead_letters(self, owner=None, limit=100):
+        """Jobs that gave up, newest first, optionally only those of one owner."""
+        query = "SELECT id, idempotency_key, owner, payload, attempts, last_error, created_at, updated_at FROM webhook_jobs WHERE status = 'dead'"
+        params = []
+        if owner is not None:
+            query += ' AND owner = ?'
+            params.append(owner)
+        with self._connect() as conn:
+            rows = conn.execute(query + ' ORDER BY updated_at DESC LIMIT ?', (*params, limit)).fetchall()
+        return [{**dict(row), 'payload': json.loads(row['payload'])} for row in rows]
+
+    def retry(self, job_id, owner=None):
+        """Moves a dead job back to the queue; returns False if there is no such dead job (for `owner`)."""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT id, owner FROM webhook_jobs WHERE id = ? AND status = 'dead'", (job_id,)).fetchone()
+            if row is None or (owner is not None and row['owner'] != owner):
+                return False
+            self._revive(conn, job_id, now)
+        self._wake.set()
+        return True
+
+    def stats(self):
+        with self._connect() as conn:
+            counts = dict(conn.execute('SELECT status, COUNT(*) FROM webhook_jobs GROUP BY status').fetchall())
+        with self._lock:
+            return {
+                'queued': {status: counts.get(status, 0) for status in STATUSES},
+                'senders': self.concurrency if self._started else 0,
+                'enqueued': self._enqueued,
+                'duplicates': self._duplicates,
+                'delivered': self._delivered,
+                'retries': self._retries,
+                'dead_lettered': self._dead,
+                'last_error': self._last_error,
+            }